@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Ejecutor por Lotes en Streaming para Tareas de Texto
+====================================================
+
+Este script procesa archivos JSONL o CSV (o la entrada estándar) con las
+mismas tareas y modelos que los ejemplos interactivos, sin necesidad de
+intervención del usuario. Los registros se leen con generadores, se
+agrupan en lotes internamente y los resultados se escriben a medida que
+se producen, por lo que la memoria usada no depende del tamaño de la
+entrada.
+
+Ejemplos:
+    python batch_runner.py sentimiento resenas.jsonl -o resultados.jsonl
+    cat textos.csv | python batch_runner.py idioma - --formato csv
+    python batch_runner.py zero-shot noticias.jsonl --categorias deportes,finanzas
+    python batch_runner.py qa preguntas.jsonl --tamano-lote 16
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+import metrics
+from model_registry import obtener_pipeline
+from batch_scoring import puntuar_columnar
+from inference_cache import obtener_cache
+from zero_shot import obtener_motor_zero_shot, obtener_prefiltro
+from language_id import obtener_detector
+from head_training import cargar_modelo_cabeza, es_modelo_cabeza
+from long_documents import AGREGACIONES, clasificar_documentos_largos
+from result_sink import SumideroParquet
+from dedup import UMBRAL_CASI_DUPLICADOS, Deduplicador
+
+# Modelo usado por cada tarea (los mismos que en los ejemplos)
+MODELOS = {
+    'sentimiento': "cardiffnlp/twitter-xlm-roberta-base-sentiment",
+    'zero-shot': "facebook/bart-large-mnli",
+    'emociones': "j-hartmann/emotion-english-distilroberta-base",
+    'idioma': "papluca/xlm-roberta-base-language-detection",
+    'qa': "deepset/roberta-base-squad2",
+    'traduccion': "Helsinki-NLP/opus-mt-en-es",
+    # Prefiltro de categorías de zero-shot (--prefiltro-k)
+    'embeddings': "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+}
+
+CAMPOS_TEXTO = ('texto', 'text')
+CAMPOS_PREGUNTA = ('pregunta', 'question')
+CAMPOS_CONTEXTO = ('contexto', 'context')
+
+
+def _campo(registro, nombres):
+    """
+    Devuelve el primer campo presente en el registro de entre `nombres`
+    """
+    for nombre in nombres:
+        if nombre in registro and registro[nombre] is not None:
+            return registro[nombre]
+    raise KeyError(f"El registro no tiene ninguno de los campos {', '.join(nombres)}")
+
+
+# ---------------------------------------------------------------------------
+# Lectura y escritura en streaming
+# ---------------------------------------------------------------------------
+
+def _abrir_entrada(ruta):
+    if ruta == '-':
+        return sys.stdin
+    return open(ruta, encoding='utf-8', newline='')
+
+
+def _abrir_salida(ruta):
+    if ruta == '-':
+        return sys.stdout
+    return open(ruta, 'w', encoding='utf-8', newline='')
+
+
+def _detectar_formato(ruta, formato):
+    if formato:
+        return formato
+    if ruta != '-' and ruta.lower().endswith('.csv'):
+        return 'csv'
+    return 'jsonl'
+
+
+def leer_registros(ruta, formato=None):
+    """
+    Genera los registros (diccionarios) de un archivo JSONL o CSV uno a uno
+    """
+    formato = _detectar_formato(ruta, formato)
+    archivo = _abrir_entrada(ruta)
+    try:
+        if formato == 'csv':
+            for fila in csv.DictReader(archivo):
+                yield fila
+        else:
+            for linea in archivo:
+                linea = linea.strip()
+                if linea:
+                    yield json.loads(linea)
+    finally:
+        if archivo is not sys.stdin:
+            archivo.close()
+
+
+def agrupar_en_lotes(registros, tamano_lote):
+    """
+    Agrupa un iterable en listas de como máximo `tamano_lote` elementos
+    """
+    iterador = iter(registros)
+    while True:
+        lote = list(islice(iterador, tamano_lote))
+        if not lote:
+            return
+        yield lote
+
+
+class EscritorResultados:
+    """
+    Escribe resultados de forma incremental en JSONL o CSV
+    """
+
+    def __init__(self, ruta, formato=None, tarea=None):
+        self.formato = _detectar_formato(ruta, formato)
+        self._csv = None
+        self._parquet = None
+        self.escritos = 0
+        if self.formato == 'parquet':
+            if ruta == '-':
+                raise ValueError("La salida parquet necesita un directorio (-o DIRECTORIO)")
+            # `ruta` es un directorio: un subdirectorio por tarea con Parquet rotativos
+            self.archivo = None
+            self._parquet = SumideroParquet(tarea, directorio=ruta)
+        else:
+            self.archivo = _abrir_salida(ruta)
+
+    def escribir(self, resultados):
+        if self._parquet is not None:
+            self._parquet.escribir(resultados)
+            self.escritos += len(resultados)
+            return
+        for resultado in resultados:
+            if self.formato == 'csv':
+                fila = {clave: json.dumps(valor, ensure_ascii=False) if isinstance(valor, (list, dict)) else valor
+                        for clave, valor in resultado.items()}
+                if self._csv is None:
+                    self._csv = csv.DictWriter(self.archivo, fieldnames=list(fila), extrasaction='ignore')
+                    self._csv.writeheader()
+                self._csv.writerow(fila)
+            else:
+                self.archivo.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+            self.escritos += 1
+        self.archivo.flush()
+
+    def cerrar(self):
+        if self._parquet is not None:
+            self._parquet.cerrar()
+        elif self.archivo is not sys.stdout:
+            self.archivo.close()
+
+
+# ---------------------------------------------------------------------------
+# Tareas
+# ---------------------------------------------------------------------------
+
+def _con_cache(opciones, tarea, modelo, entradas, calcular, parametros=None):
+    """
+    Calcula los resultados de `entradas` usando la caché si está activada
+    """
+    if opciones.cache is None:
+        return calcular(entradas)
+    return opciones.cache.obtener_o_calcular_lote(tarea, modelo, entradas, calcular, parametros)
+
+
+def _clasificar(nombre, tarea):
+    def procesar(lote, opciones):
+        textos = [str(_campo(registro, CAMPOS_TEXTO)) for registro in lote]
+        if es_modelo_cabeza(MODELOS[nombre]):
+            # Cabeza entrenada con head_training.py sobre embeddings congelados
+            modelo = cargar_modelo_cabeza(MODELOS[nombre])
+            predicciones = _con_cache(opciones, tarea, f"{MODELOS[nombre]}@{modelo.huella}", textos,
+                                      lambda pendientes: modelo(pendientes))
+            return [{'etiqueta': prediccion[0]['label'], 'confianza': prediccion[0]['score']}
+                    for prediccion in predicciones]
+
+        clasificador = obtener_pipeline(tarea, MODELOS[nombre])
+        if getattr(opciones, 'documentos_largos', False):
+            # Ventanas solapadas en lugar de truncar los textos largos
+            documentos, _ = clasificar_documentos_largos(clasificador, textos,
+                                                         solapamiento=opciones.solapamiento,
+                                                         agregacion=opciones.agregacion,
+                                                         cache=opciones.cache)
+            return [{'etiqueta': documento['etiquetas'][0]['label'],
+                     'confianza': documento['etiquetas'][0]['score'],
+                     'ventanas': documento['ventanas']}
+                    for documento in documentos]
+
+        columnares, _ = puntuar_columnar(clasificador, textos,
+                                         max_tamano_lote=opciones.tamano_lote,
+                                         cache=opciones.cache)
+        return [{'etiqueta': etiqueta, 'confianza': confianza}
+                for etiqueta, confianza in zip(columnares.nombres().tolist(),
+                                               columnares.confianzas().tolist())]
+    return procesar
+
+
+def _zero_shot(lote, opciones):
+    clasificador = obtener_pipeline("zero-shot-classification", MODELOS['zero-shot'])
+    motor = obtener_motor_zero_shot(clasificador)
+    k = getattr(opciones, 'prefiltro_k', None)
+
+    def clasificar(textos, categorias):
+        if k:
+            prefiltro = obtener_prefiltro(MODELOS['embeddings'])
+            return motor.clasificar_en_dos_etapas(textos, categorias, prefiltro, k)
+        return motor.clasificar(textos, categorias)
+
+    # Agrupar los registros que comparten categorías para clasificarlos juntos
+    grupos = {}
+    for indice, registro in enumerate(lote):
+        categorias = registro.get('categorias') or opciones.categorias
+        if isinstance(categorias, str):
+            categorias = [cat.strip() for cat in categorias.split(',')]
+        if not categorias:
+            raise ValueError("zero-shot necesita --categorias o un campo 'categorias'")
+        grupos.setdefault(tuple(categorias), []).append(indice)
+
+    salidas = [None] * len(lote)
+    for categorias, indices in grupos.items():
+        textos = [str(_campo(lote[i], CAMPOS_TEXTO)) for i in indices]
+        parametros = {'candidate_labels': list(categorias)}
+        if k:
+            parametros['prefiltro_k'] = k
+        resultados = _con_cache(
+            opciones, "zero-shot-classification", clasificador, textos,
+            lambda pendientes: clasificar(pendientes, list(categorias)),
+            parametros=parametros
+        )
+        for indice, resultado in zip(indices, resultados):
+            salidas[indice] = {
+                'categoria': resultado['labels'][0],
+                'confianza': resultado['scores'][0],
+                'todas_categorias': resultado['labels'],
+                'todas_confianzas': resultado['scores']
+            }
+    return salidas
+
+
+def _idioma(lote, opciones):
+    # Con un perfil validado los n-gramas resuelven los textos claros; el resto va al transformer
+    detector = obtener_detector(MODELOS['idioma'])
+    textos = [str(_campo(registro, CAMPOS_TEXTO)) for registro in lote]
+    predicciones = detector.detectar(textos, cache=opciones.cache, max_tamano_lote=opciones.tamano_lote)
+    return [{'etiqueta': prediccion['label'], 'confianza': prediccion['score'],
+             'fuente': prediccion['fuente']}
+            for prediccion in predicciones]
+
+
+def _qa(lote, opciones):
+    qa_pipeline = obtener_pipeline("question-answering", MODELOS['qa'])
+    entradas = [{'question': str(_campo(registro, CAMPOS_PREGUNTA)),
+                 'context': str(_campo(registro, CAMPOS_CONTEXTO))} for registro in lote]
+
+    def responder(pendientes):
+        respuestas = qa_pipeline(pendientes, batch_size=opciones.tamano_lote)
+        return respuestas if isinstance(respuestas, list) else [respuestas]
+
+    resultados = _con_cache(opciones, "question-answering", qa_pipeline, entradas, responder)
+    return [{'respuesta': r['answer'], 'confianza': r['score'],
+             'inicio': r['start'], 'fin': r['end']} for r in resultados]
+
+
+def _traduccion(lote, opciones):
+    translator = obtener_pipeline("translation", MODELOS['traduccion'])
+    textos = [str(_campo(registro, CAMPOS_TEXTO)) for registro in lote]
+    traducciones = translator(textos, batch_size=opciones.tamano_lote)
+    return [{'traduccion': t['translation_text']} for t in traducciones]
+
+
+# Tareas cuyo resultado depende solo del texto (zero-shot con categorías
+# por registro no entra: dos textos iguales pueden tener categorías distintas)
+TAREAS_DEDUPLICABLES = {'sentimiento', 'emociones', 'idioma', 'traduccion'}
+
+TAREAS = {
+    'sentimiento': _clasificar('sentimiento', "sentiment-analysis"),
+    'zero-shot': _zero_shot,
+    'emociones': _clasificar('emociones', "text-classification"),
+    'idioma': _idioma,
+    'qa': _qa,
+    'traduccion': _traduccion
+}
+
+
+def configurar_modelos(asignaciones):
+    """
+    Sustituye modelos a partir de asignaciones 'tarea=modelo' (p. ej. rutas locales)
+    """
+    for asignacion in asignaciones or []:
+        tarea, _, model_id = asignacion.partition('=')
+        if tarea not in MODELOS or not model_id:
+            raise ValueError(f"Asignación de modelo no válida: {asignacion}")
+        MODELOS[tarea] = model_id
+
+
+def procesar_stream(tarea, registros, opciones):
+    """
+    Genera los registros de entrada enriquecidos con el resultado de la tarea
+    """
+    procesar = TAREAS[tarea]
+    deduplicador = getattr(opciones, 'deduplicador', None)
+    for lote in agrupar_en_lotes(registros, opciones.tamano_lote):
+        if deduplicador is not None and tarea in TAREAS_DEDUPLICABLES:
+            # Solo el primer registro de cada grupo de textos iguales (o casi) pasa por el modelo
+            textos = [str(_campo(registro, CAMPOS_TEXTO)) for registro in lote]
+            representantes, asignacion = deduplicador.agrupar(textos)
+            metrics.registrar_deduplicacion(tarea, len(lote), len(representantes))
+            resultados = procesar([lote[i] for i in representantes], opciones)
+            resultados = [resultados[posicion] for posicion in asignacion]
+        else:
+            resultados = procesar(lote, opciones)
+        for registro, resultado in zip(lote, resultados):
+            yield {**registro, **resultado}
+
+
+def ejecutar(opciones):
+    """
+    Ejecuta una tarea completa de entrada a salida
+    """
+    configurar_modelos(opciones.modelo)
+    opciones.cache = None if opciones.sin_cache else obtener_cache()
+    deduplicar = opciones.deduplicar or opciones.umbral_dedup is not None
+    opciones.deduplicador = Deduplicador(opciones.umbral_dedup) if deduplicar else None
+    registros = leer_registros(opciones.entrada, opciones.formato)
+    escritor = EscritorResultados(opciones.salida, opciones.formato_salida, opciones.tarea)
+    inicio = time.time()
+    try:
+        for lote in agrupar_en_lotes(procesar_stream(opciones.tarea, registros, opciones),
+                                     opciones.tamano_lote):
+            escritor.escribir(lote)
+            if opciones.salida != '-' and not opciones.silencioso:
+                segundos = time.time() - inicio
+                print(f"\r🔄 {escritor.escritos} registros ({escritor.escritos / segundos:.1f}/s)",
+                      end='', file=sys.stderr)
+    finally:
+        escritor.cerrar()
+
+    segundos = time.time() - inicio
+    if not opciones.silencioso:
+        print(f"\n✅ {escritor.escritos} registros procesados en {segundos:.1f}s", file=sys.stderr)
+        if opciones.cache is not None:
+            stats = opciones.cache.estadisticas()
+            print(f"💾 Caché: {stats['tasa_aciertos'] * 100:.1f}% aciertos", file=sys.stderr)
+        if opciones.deduplicador is not None:
+            stats = opciones.deduplicador.estadisticas()
+            print(f"🧬 Deduplicación: {stats['ratio_deduplicacion'] * 100:.1f}% de los textos sin inferencia "
+                  f"({stats['duplicados_exactos']} exactos, {stats['casi_duplicados']} casi duplicados)",
+                  file=sys.stderr)
+    return escritor.escritos
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        description="Procesa archivos JSONL/CSV con las tareas de texto de los ejemplos"
+    )
+    parser.add_argument('tarea', choices=sorted(TAREAS))
+    parser.add_argument('entrada', help="Archivo JSONL/CSV de entrada ('-' para stdin)")
+    parser.add_argument('-o', '--salida', default='-',
+                        help="Archivo de salida JSONL/CSV ('-' para stdout, por defecto)")
+    parser.add_argument('--formato', choices=['jsonl', 'csv'],
+                        help="Formato de entrada (por defecto según la extensión)")
+    parser.add_argument('--formato-salida', choices=['jsonl', 'csv', 'parquet'],
+                        help="Formato de salida (por defecto según la extensión). Con parquet, "
+                             "-o es un directorio donde se escriben archivos Parquet rotativos")
+    parser.add_argument('--tamano-lote', type=int, default=32,
+                        help="Registros por lote (default=32)")
+    parser.add_argument('--categorias',
+                        help="Categorías separadas por comas para zero-shot")
+    parser.add_argument('--prefiltro-k', type=int,
+                        help="zero-shot: pasar por NLI solo las K categorías más parecidas "
+                             "según embeddings (útil con cientos de categorías)")
+    parser.add_argument('--documentos-largos', action='store_true',
+                        help="sentimiento/emociones: clasificar textos largos por ventanas "
+                             "solapadas en lugar de truncarlos")
+    parser.add_argument('--solapamiento', type=int, default=64,
+                        help="Tokens compartidos entre ventanas consecutivas (default=64)")
+    parser.add_argument('--agregacion', choices=AGREGACIONES, default='media',
+                        help="Cómo combinar las ventanas de un documento (default=media)")
+    parser.add_argument('--deduplicar', action='store_true',
+                        help="Procesar una sola vez los textos repetidos (tras normalizar) de "
+                             "cada lote (conviene subir --tamano-lote)")
+    parser.add_argument('--umbral-dedup', type=float,
+                        help="Agrupar también los casi duplicados (MinHash) con esta similitud de "
+                             f"Jaccard mínima; se recomienda {UMBRAL_CASI_DUPLICADOS} o más, ya que "
+                             "con umbrales bajos se agrupan textos que solo difieren en una negación"),
+    parser.add_argument('--modelo', action='append', metavar='TAREA=MODELO',
+                        help="Usar otro modelo (o ruta local) para una tarea")
+    parser.add_argument('--sin-cache', action='store_true',
+                        help="No leer ni guardar resultados en la caché de inferencia")
+    parser.add_argument('--silencioso', action='store_true',
+                        help="No mostrar progreso en stderr")
+    return parser
+
+
+def main(argv=None):
+    parser = crear_parser()
+    opciones = parser.parse_args(argv)
+    if opciones.umbral_dedup is not None and not 0 < opciones.umbral_dedup <= 1:
+        parser.error("--umbral-dedup debe estar entre 0 y 1")
+    ejecutar(opciones)
+
+
+if __name__ == "__main__":
+    main()
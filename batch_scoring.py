@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Puntuación por Lotes Agrupados por Longitud
+===========================================
+
+Este módulo permite clasificar muchos textos con un pipeline de
+clasificación (por ejemplo análisis de sentimientos) agrupándolos en lotes
+de longitud similar. Cada lote solo se rellena (padding) hasta el texto más
+largo del propio lote, y los resultados se devuelven en el orden original.
+"""
+
+import time
+
+import metrics
+from lazy_imports import importar_perezoso
+from tokenization_cache import COLUMNA_LONGITUD
+
+np = importar_perezoso("numpy")
+torch = importar_perezoso("torch")
+
+
+def _crear_lotes(longitudes, max_tokens_por_lote, max_tamano_lote):
+    """
+    Agrupa índices ordenados por longitud en lotes que respetan los límites.
+
+    El coste de un lote es (número de textos × longitud máxima del lote),
+    que es exactamente el número de tokens tras el padding.
+    """
+    orden = sorted(range(len(longitudes)), key=lambda i: longitudes[i])
+    lotes = []
+    lote_actual = []
+    for indice in orden:
+        longitud = longitudes[indice]
+        # Al estar ordenados, el texto nuevo es siempre el más largo del lote
+        coste = (len(lote_actual) + 1) * longitud
+        if lote_actual and (coste > max_tokens_por_lote or len(lote_actual) >= max_tamano_lote):
+            lotes.append(lote_actual)
+            lote_actual = []
+        lote_actual.append(indice)
+    if lote_actual:
+        lotes.append(lote_actual)
+    return lotes
+
+
+def _normalizar_scores(logits, config):
+    """
+    Convierte logits en probabilidades igual que el pipeline de transformers
+    """
+    if _multi_etiqueta(config):
+        return torch.sigmoid(logits)
+    return torch.softmax(logits, dim=-1)
+
+
+def _multi_etiqueta(config):
+    return config.num_labels == 1 or getattr(config, 'problem_type', None) == "multi_label_classification"
+
+
+class ResultadosColumnares:
+    """
+    Logits de todos los textos como una matriz NumPy, con el postproceso
+    (softmax, top-k, mapeo de etiquetas y umbrales) vectorizado.
+
+    Evita construir un diccionario por texto y etiqueta: los resultados
+    son arrays (ids de etiqueta, matriz de scores) con una fila por texto.
+    """
+
+    def __init__(self, logits, etiquetas, multi_etiqueta=False):
+        self.logits = np.asarray(logits, dtype=np.float32).reshape(-1, len(etiquetas))
+        self.etiquetas = np.asarray(etiquetas, dtype=object)
+        self.multi_etiqueta = multi_etiqueta
+        self._probabilidades = None
+
+    def __len__(self):
+        return len(self.logits)
+
+    @property
+    def probabilidades(self):
+        """
+        Matriz (textos × etiquetas) de probabilidades, calculada una vez
+        """
+        if self._probabilidades is None:
+            if self.multi_etiqueta:
+                self._probabilidades = 1.0 / (1.0 + np.exp(-self.logits))
+            else:
+                exponenciales = np.exp(self.logits - self.logits.max(axis=1, keepdims=True))
+                self._probabilidades = exponenciales / exponenciales.sum(axis=1, keepdims=True)
+        return self._probabilidades
+
+    def top_k(self, k=1):
+        """
+        Devuelve (ids, scores), ambos de forma (textos × k), ordenados de
+        mayor a menor score
+        """
+        probabilidades = self.probabilidades
+        k = min(k, probabilidades.shape[1])
+        if k < probabilidades.shape[1]:
+            candidatos = np.argpartition(-probabilidades, k - 1, axis=1)[:, :k]
+        else:
+            candidatos = np.broadcast_to(np.arange(k), probabilidades.shape)
+        scores = np.take_along_axis(probabilidades, candidatos, axis=1)
+        orden = np.argsort(-scores, axis=1, kind='stable')
+        return np.take_along_axis(candidatos, orden, axis=1), np.take_along_axis(scores, orden, axis=1)
+
+    def ids_predichos(self):
+        return self.logits.argmax(axis=1)
+
+    def confianzas(self):
+        return self.probabilidades.max(axis=1)
+
+    def nombres(self, ids=None, mapeo=None):
+        """
+        Nombres de etiqueta de un array de ids (por defecto el argmax),
+        traducidos con `mapeo` una sola vez por etiqueta, no por texto
+        """
+        ids = self.ids_predichos() if ids is None else ids
+        etiquetas = self.etiquetas
+        if mapeo:
+            etiquetas = np.array([mapeo.get(etiqueta, etiqueta) for etiqueta in etiquetas], dtype=object)
+        return etiquetas[ids]
+
+    def por_encima(self, umbral):
+        """
+        Máscara booleana (textos × etiquetas) de probabilidades >= umbral
+        """
+        return self.probabilidades >= umbral
+
+    def a_registros(self, top_k=1):
+        """
+        Convierte al formato del pipeline: [{'label', 'score'}, ...] por texto
+        """
+        ids, scores = self.top_k(top_k)
+        nombres = self.etiquetas[ids].tolist()
+        return [[{'label': etiqueta, 'score': score} for etiqueta, score in zip(fila_nombres, fila_scores)]
+                for fila_nombres, fila_scores in zip(nombres, scores.tolist())]
+
+
+def _etiquetas_modelo(config):
+    return [config.id2label[i] for i in range(config.num_labels)]
+
+
+def _logits(clasificador, textos, max_tokens_por_lote, max_tamano_lote, max_longitud,
+            contadores, cache_tokenizacion=None):
+    """
+    Tokeniza y ejecuta el modelo sobre `textos` lote a lote.
+
+    Devuelve una matriz NumPy (textos × etiquetas) de logits en el orden
+    original, acumulando en `contadores`.
+    """
+    tokenizer = clasificador.tokenizer
+    modelo = clasificador.model
+    if not textos:
+        return np.zeros((0, modelo.config.num_labels), dtype=np.float32)
+    device = modelo.device
+    tarea = getattr(clasificador, 'task', "text-classification")
+    model_id = modelo.config.name_or_path
+
+    inicio = time.perf_counter()
+    if cache_tokenizacion is not None:
+        # Ids en un Arrow mapeado en memoria: solo se leen las filas de cada lote
+        corpus = cache_tokenizacion.tokenizar(tokenizer, textos, max_longitud)
+        longitudes = corpus[COLUMNA_LONGITUD]
+        columnas = [columna for columna in corpus.column_names if columna != COLUMNA_LONGITUD]
+
+        def features_lote(lote):
+            filas = corpus[lote]
+            return [{clave: filas[clave][j] for clave in columnas} for j in range(len(lote))]
+    else:
+        codificados = tokenizer(textos, truncation=True, max_length=max_longitud)
+        longitudes = [len(ids) for ids in codificados['input_ids']]
+
+        def features_lote(lote):
+            return [{clave: codificados[clave][i] for clave in codificados.keys()} for i in lote]
+    metrics.registrar_etapa(tarea, model_id, "tokenizacion", time.perf_counter() - inicio)
+    lotes = _crear_lotes(longitudes, max_tokens_por_lote, max_tamano_lote)
+
+    logits_textos = np.empty((len(textos), modelo.config.num_labels), dtype=np.float32)
+    modelo.eval()
+    with torch.inference_mode():
+        for lote in lotes:
+            entradas = tokenizer.pad(features_lote(lote), return_tensors="pt")
+            entradas = {clave: valor.to(device) for clave, valor in entradas.items()}
+
+            contadores['lotes'] += 1
+            contadores['tokens_reales'] += sum(longitudes[i] for i in lote)
+            contadores['tokens_con_padding'] += entradas['input_ids'].numel()
+
+            inicio = time.perf_counter()
+            logits = modelo(**entradas).logits.float().cpu()
+            tamano_lote, longitud = entradas['input_ids'].shape
+            metrics.registrar_forward(tarea, model_id, time.perf_counter() - inicio,
+                                      tamano_lote, longitud)
+            logits_textos[lote] = logits.numpy()
+    return logits_textos
+
+
+def _calcular_logits(clasificador, textos, max_tokens_por_lote, max_tamano_lote, max_longitud,
+                     cache, cache_tokenizacion, contadores):
+    """
+    Logits de `textos`, calculando solo los que no están en la caché
+    """
+    def calcular(pendientes):
+        contadores['calculados'] += len(pendientes)
+        return _logits(clasificador, pendientes, max_tokens_por_lote, max_tamano_lote,
+                       max_longitud, contadores, cache_tokenizacion)
+
+    if cache is None:
+        return calcular(textos)
+    # La caché guarda filas de logits: sirven para cualquier top_k o umbral
+    filas = cache.obtener_o_calcular_lote(
+        "text-classification-logits", clasificador, textos,
+        lambda pendientes: calcular(pendientes).tolist(),
+        parametros={'max_longitud': max_longitud}
+    )
+    return np.array(filas, dtype=np.float32).reshape(len(textos), clasificador.model.config.num_labels)
+
+
+def _estadisticas(num_textos, contadores, segundos):
+    tokens_reales = contadores['tokens_reales']
+    tokens_con_padding = contadores['tokens_con_padding']
+    return {
+        'textos': num_textos,
+        'aciertos_cache': num_textos - contadores['calculados'],
+        'lotes': contadores['lotes'],
+        'tokens_reales': tokens_reales,
+        'tokens_con_padding': tokens_con_padding,
+        'desperdicio_padding': 1 - tokens_reales / tokens_con_padding if tokens_con_padding else 0.0,
+        'segundos': segundos,
+        'textos_por_segundo': num_textos / segundos if segundos > 0 else 0.0,
+        'tokens_por_segundo': tokens_reales / segundos if segundos > 0 else 0.0
+    }
+
+
+def puntuar_columnar(clasificador, textos, max_tokens_por_lote=4096, max_tamano_lote=64,
+                     max_longitud=None, cache=None, cache_tokenizacion=None, deduplicador=None):
+    """
+    Como puntuar_por_lotes, pero devuelve (ResultadosColumnares, estadisticas):
+    la matriz de logits de todos los textos en lugar de una lista de
+    diccionarios, para hacer el postproceso vectorizado con NumPy.
+
+    Con un `deduplicador` (ver dedup.py) solo se ejecutan los
+    representantes de cada grupo de textos duplicados o casi duplicados.
+    """
+    textos = list(textos)
+    if max_longitud is None:
+        max_longitud = min(clasificador.tokenizer.model_max_length, 512)
+
+    contadores = {'lotes': 0, 'tokens_reales': 0, 'tokens_con_padding': 0, 'calculados': 0}
+    inicio = time.perf_counter()
+    config = clasificador.model.config
+    tarea = getattr(clasificador, 'task', "text-classification")
+
+    representantes, asignacion = list(range(len(textos))), None
+    if deduplicador is not None:
+        representantes, asignacion = deduplicador.agrupar(textos)
+        metrics.registrar_deduplicacion(tarea, len(textos), len(representantes))
+
+    logits = _calcular_logits(clasificador, [textos[i] for i in representantes], max_tokens_por_lote,
+                              max_tamano_lote, max_longitud, cache, cache_tokenizacion, contadores)
+    if asignacion is not None:
+        # Cada texto recibe la fila de logits de su representante
+        logits = logits[np.asarray(asignacion, dtype=np.intp)]
+    resultados = ResultadosColumnares(logits, _etiquetas_modelo(config), _multi_etiqueta(config))
+
+    estadisticas = _estadisticas(len(textos), contadores, time.perf_counter() - inicio)
+    # Los textos repartidos desde su representante cuentan como resueltos sin inferencia
+    estadisticas['aciertos_cache'] = len(representantes) - contadores['calculados']
+    estadisticas['inferidos'] = contadores['calculados']
+    estadisticas['ratio_deduplicacion'] = 1 - len(representantes) / len(textos) if textos else 0.0
+    return resultados, estadisticas
+
+
+def puntuar_por_lotes(clasificador, textos, max_tokens_por_lote=4096, max_tamano_lote=64,
+                      max_longitud=None, top_k=1, cache=None, cache_tokenizacion=None,
+                      deduplicador=None):
+    """
+    Clasifica `textos` en lotes agrupados por longitud.
+
+    `clasificador` es un pipeline de clasificación de texto (se usan su
+    modelo y su tokenizer). Devuelve una tupla (resultados, estadisticas):
+    los resultados tienen el mismo formato que el pipeline
+    ([{'label': ..., 'score': ...}] por texto, con `top_k` elementos) y
+    las estadísticas incluyen el desperdicio de padding y el rendimiento.
+
+    Si se pasa una `cache` (ver inference_cache.py) los textos ya
+    clasificados se devuelven directamente sin tokenizarlos. Con
+    `cache_tokenizacion` (ver tokenization_cache.py) los ids de los textos
+    que sí hay que clasificar se reutilizan de disco entre ejecuciones.
+    """
+    columnares, estadisticas = puntuar_columnar(clasificador, textos, max_tokens_por_lote,
+                                                max_tamano_lote, max_longitud, cache, cache_tokenizacion,
+                                                deduplicador)
+    modelo = clasificador.model
+    inicio = time.perf_counter()
+    resultados = columnares.a_registros(top_k)
+    metrics.registrar_etapa(getattr(clasificador, 'task', "text-classification"),
+                            modelo.config.name_or_path, "postproceso", time.perf_counter() - inicio)
+    return resultados, estadisticas
+
+
+def mostrar_estadisticas_lotes(estadisticas):
+    """
+    Imprime un resumen de la puntuación por lotes
+    """
+    print(f"⚡ {estadisticas['textos']} textos en {estadisticas['lotes']} lotes "
+          f"({estadisticas['segundos']:.2f}s)")
+    if estadisticas.get('aciertos_cache'):
+        print(f"   Resultados reutilizados de la caché: {estadisticas['aciertos_cache']}")
+    if estadisticas.get('ratio_deduplicacion'):
+        print(f"   Duplicados resueltos sin inferencia: {estadisticas['ratio_deduplicacion'] * 100:.1f}%")
+    print(f"   Rendimiento: {estadisticas['textos_por_segundo']:.1f} textos/s, "
+          f"{estadisticas['tokens_por_segundo']:.0f} tokens/s")
+    print(f"   Padding desperdiciado: {estadisticas['desperdicio_padding'] * 100:.1f}% "
+          f"({estadisticas['tokens_con_padding'] - estadisticas['tokens_reales']} tokens)")
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Generación de Texto por Lotes con Relleno a la Izquierda
+========================================================
+
+En CPU el coste de cada paso de generación lo domina la lectura de los
+pesos del modelo, no el número de secuencias: generar para 8 prompts a la
+vez cuesta poco más que generar para uno. Este módulo junta muchos prompts
+(y sus num_return_sequences) en una sola llamada a `generate`:
+
+  - los prompts se ordenan por longitud y se agrupan en lotes;
+  - cada lote se rellena a la izquierda, para que todas las filas
+    continúen desde la última posición;
+  - cada fila termina por separado al generar EOS (generate rellena las
+    filas terminadas mientras las demás siguen);
+  - los resultados se devuelven agrupados por prompt, en el orden original.
+
+Cada prompt puede llevar sus propios parámetros de muestreo (temperature,
+top_p, top_k, repetition_penalty o do_sample=False) con
+`parametros_por_prompt`: un procesador de logits los aplica fila a fila,
+así que peticiones heterogéneas comparten el mismo forward en cada paso.
+
+Con `cache_prefijos` (prefix_cache.py) el prefill de un prompt repetido se
+hace una sola vez y su estado KV se copia para cada secuencia.
+"""
+
+import time
+
+import metrics
+from lazy_imports import importar_perezoso
+from batch_scoring import _crear_lotes
+
+torch = importar_perezoso("torch")
+transformers = importar_perezoso("transformers")
+
+
+def preparar_tokenizer(tokenizer):
+    """
+    Asegura un token de relleno (EOS si el modelo no tiene uno)
+    """
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def _tokens_hasta_eos(fila, eos_ids, pad_id):
+    """
+    Número de tokens nuevos de una fila hasta su primer EOS (incluido)
+    """
+    for posicion, token in enumerate(fila):
+        if token in eos_ids:
+            return posicion + 1
+    # Sin EOS: no se cuenta el relleno final, si lo hubiera
+    longitud = len(fila)
+    while longitud and fila[longitud - 1] == pad_id and pad_id not in eos_ids:
+        longitud -= 1
+    return longitud
+
+
+def _ids_eos(modelo, tokenizer):
+    eos = getattr(modelo.generation_config, 'eos_token_id', None)
+    if eos is None:
+        eos = tokenizer.eos_token_id
+    if eos is None:
+        return set()
+    return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+
+PARAMETROS_POR_FILA = ('temperature', 'top_p', 'top_k', 'repetition_penalty', 'do_sample')
+
+
+class MuestreoPorFila:
+    """
+    Procesador de logits con temperature, top_p, top_k y repetition_penalty
+    distintos para cada fila del lote.
+
+    Se pasa a generate dentro de un LogitsProcessorList, con do_sample=True
+    y los parámetros globales neutros. Aplica los pasos en el mismo orden que
+    los procesadores de transformers (penalización, temperatura, top-k,
+    top-p); las filas con do_sample=False (o temperature=0) quedan reducidas
+    a su token más probable, es decir, greedy.
+
+    Con `pad_token_id` el relleno a la izquierda no cuenta para
+    repetition_penalty, así que una fila da lo mismo en un lote que sola.
+    """
+
+    def __init__(self, parametros_filas, pad_token_id=None):
+        self.pad_token_id = pad_token_id
+        def columna(nombre, defecto):
+            return torch.tensor([float(p.get(nombre) if p.get(nombre) is not None else defecto)
+                                 for p in parametros_filas]).unsqueeze(1)
+
+        self.temperatura = columna('temperature', 1.0)
+        self.top_p = columna('top_p', 1.0)
+        self.top_k = columna('top_k', 0).long()
+        self.penalizacion = columna('repetition_penalty', 1.0)
+        self.greedy = torch.tensor([p.get('do_sample', True) is False or p.get('temperature') == 0
+                                    for p in parametros_filas]).unsqueeze(1)
+
+    def _filas(self, tensor, scores):
+        # generate expande cada fila en num_return_sequences filas consecutivas
+        repeticiones = scores.shape[0] // tensor.shape[0]
+        return tensor.repeat_interleave(repeticiones, dim=0).to(scores.device)
+
+    def __call__(self, input_ids, scores):
+        filtro = torch.finfo(scores.dtype).min
+        penalizacion = self._filas(self.penalizacion, scores)
+        if (penalizacion != 1.0).any():
+            penalizados = torch.where(scores < 0, scores * penalizacion.to(scores.dtype),
+                                      scores / penalizacion.to(scores.dtype))
+            validos = torch.ones_like(input_ids, dtype=scores.dtype)
+            if self.pad_token_id is not None:
+                # Relleno a la izquierda: los pad_token_id iniciales de cada fila
+                validos = 1 - (input_ids == self.pad_token_id).long().cumprod(dim=1).to(scores.dtype)
+            vistos = torch.zeros_like(scores).scatter_add(1, input_ids, validos) > 0
+            scores = torch.where(vistos, penalizados, scores)
+
+        greedy = self._filas(self.greedy, scores)
+        if greedy.any():
+            maximos = scores.argmax(dim=-1, keepdim=True)
+            solo_maximo = torch.full_like(scores, filtro).scatter(1, maximos, 0.0)
+            scores = torch.where(greedy, solo_maximo, scores)
+
+        temperatura = self._filas(self.temperatura, scores)
+        scores = scores / torch.where(greedy | (temperatura <= 0), 1.0, temperatura).to(scores.dtype)
+
+        ordenados, indices = scores.sort(dim=-1, descending=True)
+        eliminar = torch.zeros_like(ordenados, dtype=torch.bool)
+
+        top_k = self._filas(self.top_k, scores).clamp(max=scores.shape[-1])
+        if (top_k > 0).any():
+            posiciones = torch.arange(scores.shape[-1], device=scores.device).unsqueeze(0)
+            eliminar |= (top_k > 0) & (posiciones >= top_k)
+            ordenados = ordenados.masked_fill(eliminar, filtro)
+
+        top_p = self._filas(self.top_p, scores)
+        if (top_p < 1.0).any():
+            # Se conservan los tokens más probables hasta acumular top_p (al menos uno)
+            probabilidades = ordenados.softmax(dim=-1)
+            previa = probabilidades.cumsum(dim=-1) - probabilidades
+            eliminar |= previa >= top_p.to(previa.dtype)
+            eliminar[:, 0] = False
+
+        if eliminar.any():
+            eliminar = eliminar.scatter(1, indices, eliminar)
+            scores = scores.masked_fill(eliminar, filtro)
+        return scores
+
+
+def _parametros_lote(parametros, parametros_lote, pad_token_id=None):
+    """
+    Parámetros de generate para un lote con muestreo por fila: el procesador
+    sustituye a los ajustes globales de muestreo, que se dejan neutros
+    """
+    parametros = {clave: valor for clave, valor in parametros.items() if clave not in PARAMETROS_POR_FILA}
+    procesadores = transformers.LogitsProcessorList(list(parametros.pop('logits_processor', None) or []))
+    procesadores.append(MuestreoPorFila(parametros_lote, pad_token_id))
+    return {**parametros, 'logits_processor': procesadores, 'do_sample': True,
+            'temperature': 1.0, 'top_p': 1.0, 'top_k': 0, 'repetition_penalty': 1.0}
+
+
+def generar_por_lotes(generador, prompts, num_return_sequences=1, max_new_tokens=None,
+                      max_length=None, tamano_lote=16, parametros_por_prompt=None, cache_prefijos=None,
+                      **parametros):
+    """
+    Genera continuaciones para todos los `prompts` con pocas llamadas a generate.
+
+    `generador` es un pipeline de text-generation (se usan su modelo y su
+    tokenizer). `parametros` se pasan a generate (do_sample, temperature,
+    top_p...). Si solo se da `max_length`, cada lote genera
+    max_length - (prompt más largo del lote) tokens nuevos.
+
+    `parametros_por_prompt` es una lista con un diccionario por prompt
+    (claves de PARAMETROS_POR_FILA); lo que no indique se toma de
+    `parametros`. Así prompts con temperaturas o top_p distintos se generan
+    en el mismo lote. No es compatible con beam search.
+
+    Con `cache_prefijos` (prefix_cache.CachePrefijos) los lotes se forman
+    con prompts de tokens idénticos: el estado KV del prompt se calcula una
+    vez (o se toma de la caché, también por prefijo compartido) y se copia
+    para todas sus filas y num_return_sequences, en lugar de repetir el
+    prefill de cada una.
+
+    Devuelve (resultados, estadisticas): resultados[i] es la lista de las
+    `num_return_sequences` generaciones del prompt i, cada una
+    {'generated_text', 'texto_nuevo', 'tokens_nuevos'}.
+    """
+    prompts = list(prompts)
+    tokenizer = preparar_tokenizer(generador.tokenizer)
+    modelo = generador.model
+    model_id = modelo.config.name_or_path
+    eos_ids = _ids_eos(modelo, tokenizer)
+    if max_new_tokens is None and max_length is None:
+        max_new_tokens = 50
+    if parametros_por_prompt is not None:
+        if len(parametros_por_prompt) != len(prompts):
+            raise ValueError("parametros_por_prompt debe tener un diccionario por prompt")
+        if parametros.get('num_beams', 1) > 1:
+            raise ValueError("El muestreo por fila no es compatible con beam search")
+    elif ((parametros.get('repetition_penalty') or 1.0) != 1.0 and parametros.get('num_beams', 1) <= 1
+          and not parametros.get('do_sample', modelo.generation_config.do_sample)):
+        # El procesador de transformers también penaliza el relleno a la
+        # izquierda; en greedy el muestreo por fila da lo mismo que el prompt solo
+        parametros_por_prompt = [{'do_sample': False}] * len(prompts)
+    if parametros_por_prompt is not None:
+        comunes = {clave: parametros[clave] for clave in PARAMETROS_POR_FILA if clave in parametros}
+        parametros_por_prompt = [{**comunes, **(propios or {})} for propios in parametros_por_prompt]
+
+    # Sin prompts no se llama al tokenizer (falla con una lista vacía): no hay lotes
+    ids_prompts = tokenizer(prompts)['input_ids'] if prompts else []
+    longitudes = [len(ids) for ids in ids_prompts]
+    if cache_prefijos is None:
+        lotes = _crear_lotes(longitudes, float('inf'), max(1, tamano_lote))
+    else:
+        # Un lote por prompt (repetido), que comparte un único estado KV
+        iguales = {}
+        for indice, ids in enumerate(ids_prompts):
+            iguales.setdefault(tuple(ids), []).append(indice)
+        lotes = [grupo[inicio:inicio + max(1, tamano_lote)] for grupo in iguales.values()
+                 for inicio in range(0, len(grupo), max(1, tamano_lote))]
+
+    resultados = [None] * len(prompts)
+    contadores = {'lotes': 0, 'tokens_nuevos': 0, 'tokens_con_relleno': 0}
+    inicio_total = time.perf_counter()
+
+    lado_original = tokenizer.padding_side
+    tokenizer.padding_side = 'left'
+    try:
+        modelo.eval()
+        with torch.inference_mode():
+            for lote in lotes:
+                filas = num_return_sequences
+                if cache_prefijos is None:
+                    entradas = tokenizer([prompts[i] for i in lote], return_tensors="pt", padding=True)
+                    entradas = {clave: valor.to(modelo.device) for clave, valor in entradas.items()}
+                else:
+                    # Las filas se pasan ya expandidas: generate no replica el estado KV
+                    filas = 1
+                    ids = torch.tensor([ids_prompts[lote[0]]] * (len(lote) * num_return_sequences),
+                                       device=modelo.device)
+                    entradas = {'input_ids': ids, 'attention_mask': torch.ones_like(ids)}
+                    estado = cache_prefijos.estado_para(modelo, ids_prompts[lote[0]], filas=len(ids))
+                    if estado is not None:
+                        entradas['past_key_values'] = estado
+                longitud_entrada = entradas['input_ids'].shape[1]
+                nuevos = max_new_tokens
+                if nuevos is None:
+                    nuevos = max(max_length - max(longitudes[i] for i in lote), 1)
+
+                parametros_generate = parametros
+                if parametros_por_prompt is not None:
+                    parametros_generate = _parametros_lote(parametros, [parametros_por_prompt[i] for i in lote],
+                                                           tokenizer.pad_token_id)
+
+                inicio = time.perf_counter()
+                salida = modelo.generate(**entradas, num_return_sequences=filas,
+                                         max_new_tokens=nuevos, pad_token_id=tokenizer.pad_token_id,
+                                         **parametros_generate)
+                segundos = time.perf_counter() - inicio
+
+                generados = salida[:, longitud_entrada:].tolist()
+                textos = tokenizer.batch_decode(generados, skip_special_tokens=True)
+                tokens_lote = 0
+                for posicion, indice in enumerate(lote):
+                    grupo = []
+                    for j in range(num_return_sequences):
+                        fila = posicion * num_return_sequences + j
+                        tokens = _tokens_hasta_eos(generados[fila], eos_ids, tokenizer.pad_token_id)
+                        tokens_lote += tokens
+                        grupo.append({
+                            'generated_text': prompts[indice] + textos[fila],
+                            'texto_nuevo': textos[fila].strip(),
+                            'tokens_nuevos': tokens
+                        })
+                    resultados[indice] = grupo
+
+                contadores['lotes'] += 1
+                contadores['tokens_nuevos'] += tokens_lote
+                contadores['tokens_con_relleno'] += len(generados) * len(generados[0]) if generados else 0
+                metrics.registrar_forward("text-generation", model_id, segundos,
+                                          len(lote) * num_return_sequences, longitud_entrada,
+                                          tokens=tokens_lote)
+    finally:
+        tokenizer.padding_side = lado_original
+
+    segundos = time.perf_counter() - inicio_total
+    estadisticas = {
+        'prompts': len(prompts),
+        'secuencias': len(prompts) * num_return_sequences,
+        'lotes': contadores['lotes'],
+        'tokens_nuevos': contadores['tokens_nuevos'],
+        # Posiciones generadas tras el EOS de cada fila mientras otras seguían
+        'desperdicio_eos': (1 - contadores['tokens_nuevos'] / contadores['tokens_con_relleno']
+                            if contadores['tokens_con_relleno'] else 0.0),
+        'segundos': segundos,
+        'tokens_por_segundo': contadores['tokens_nuevos'] / segundos if segundos > 0 else 0.0
+    }
+    return resultados, estadisticas
+
+
+def mostrar_estadisticas_generacion(estadisticas):
+    """
+    Imprime un resumen de la generación por lotes
+    """
+    print(f"⚡ {estadisticas['secuencias']} secuencias de {estadisticas['prompts']} prompts en "
+          f"{estadisticas['lotes']} llamada(s) a generate ({estadisticas['segundos']:.2f}s)")
+    print(f"   {estadisticas['tokens_nuevos']} tokens nuevos, "
+          f"{estadisticas['tokens_por_segundo']:.1f} tokens/s "
+          f"(posiciones tras EOS: {estadisticas['desperdicio_eos'] * 100:.1f}%)")
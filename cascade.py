@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Cascada de Clasificadores por Confianza
+=======================================
+
+La mayoría de los textos reales son fáciles: un clasificador pequeño
+acierta con ellos igual que uno grande. En modo cascada cada texto pasa
+primero por un modelo rápido y solo se envía al modelo grande cuando la
+confianza calibrada del primero no supera un umbral.
+
+Los dos modelos pueden tener etiquetas distintas ("positive", "4 stars"...):
+sus probabilidades se agregan sobre las etiquetas comunes positivo /
+negativo / neutral antes de comparar (los modelos con etiquetas genéricas
+LABEL_0, LABEL_1... necesitan un mapeo explícito). La confianza del modelo
+rápido se calibra con escalado de temperatura sobre datos etiquetados.
+
+Ejecutado como script mide, sobre los datos de
+clasificacion_personalizada_con_datos (o un JSONL con campos texto y
+etiqueta), la fracción escalada y la exactitud frente a la latencia para
+varios umbrales:
+
+    python cascade.py --umbrales 0.6 0.7 0.8 0.9 --json cascada.json
+"""
+
+import argparse
+import json
+import math
+import re
+import time
+
+from model_registry import obtener_pipeline
+from batch_scoring import puntuar_por_lotes
+from tokenization_cache import obtener_cache_tokenizacion
+
+MODELO_RAPIDO = "lxyuan/distilbert-base-multilingual-cased-sentiments-student"
+MODELO_PRECISO = "nlptown/bert-base-multilingual-uncased-sentiment"
+
+CLASES = ("negativo", "neutral", "positivo")
+
+# Etiquetas de los modelos de sentimientos de los ejemplos → clases comunes
+MAPEO_ETIQUETAS = {
+    'negative': 'negativo', 'neg': 'negativo', 'negativo': 'negativo',
+    'neutral': 'neutral', 'neu': 'neutral',
+    'positive': 'positivo', 'pos': 'positivo', 'positivo': 'positivo',
+    '1 star': 'negativo', '2 stars': 'negativo', '3 stars': 'neutral',
+    '4 stars': 'positivo', '5 stars': 'positivo'
+}
+
+TEMPERATURAS = [0.25 * i for i in range(1, 21)]
+
+
+def mapeo_modelo(config, mapeo=None):
+    """
+    Mapeo {etiqueta del modelo en minúsculas: clase común} a partir de
+    config.id2label, con `mapeo` ({etiqueta: clase}) por encima de
+    MAPEO_ETIQUETAS.
+
+    Las etiquetas genéricas (LABEL_0, LABEL_1...) no indican el sentimiento:
+    LABEL_1 es positivo en un modelo binario y neutral en uno de tres
+    clases, así que necesitan un `mapeo` explícito.
+    """
+    explicito = {etiqueta.lower(): clase for etiqueta, clase in (mapeo or {}).items()}
+    resultado = {}
+    genericas = []
+    for etiqueta in config.id2label.values():
+        clave = etiqueta.lower()
+        clase = explicito.get(clave, MAPEO_ETIQUETAS.get(clave))
+        if clase is not None:
+            resultado[clave] = clase
+        elif re.fullmatch(r"label_\d+", clave):
+            genericas.append(etiqueta)
+    if genericas:
+        raise ValueError(f"{config.name_or_path} usa etiquetas genéricas ({', '.join(genericas)}): "
+                         f"indica un mapeo explícito a {', '.join(CLASES)}")
+    return resultado
+
+
+def distribucion_clases(resultado, mapeo=MAPEO_ETIQUETAS):
+    """
+    Suma las probabilidades de las etiquetas del modelo por clase común
+    """
+    distribucion = dict.fromkeys(CLASES, 0.0)
+    for elemento in resultado:
+        clase = mapeo.get(elemento['label'].lower())
+        if clase is not None:
+            distribucion[clase] += elemento['score']
+    return distribucion
+
+
+def aplicar_temperatura(distribucion, temperatura):
+    """
+    Reescala una distribución con softmax(log(p) / T)
+    """
+    logits = {clase: math.log(max(p, 1e-12)) / temperatura for clase, p in distribucion.items()}
+    maximo = max(logits.values())
+    exponenciales = {clase: math.exp(valor - maximo) for clase, valor in logits.items()}
+    total = sum(exponenciales.values())
+    return {clase: valor / total for clase, valor in exponenciales.items()}
+
+
+def _prediccion(distribucion):
+    clase = max(distribucion, key=distribucion.get)
+    return clase, distribucion[clase]
+
+
+class CascadaClasificacion:
+    """
+    Clasificador rápido con escalado de los textos dudosos a uno preciso
+    """
+
+    def __init__(self, modelo_rapido=MODELO_RAPIDO, modelo_preciso=MODELO_PRECISO,
+                 umbral=0.8, temperatura=1.0, tarea="sentiment-analysis", mapeos=None):
+        self.modelo_rapido = modelo_rapido
+        self.modelo_preciso = modelo_preciso
+        # {model_id: {etiqueta: clase}} para modelos con etiquetas genéricas
+        self.mapeos = mapeos or {}
+        self.umbral = umbral
+        self.temperatura = temperatura
+        self.tarea = tarea
+
+    def _distribuciones(self, model_id, textos, cache=None):
+        """
+        Clasifica con un modelo y devuelve (distribuciones, segundos)
+        """
+        clasificador = obtener_pipeline(self.tarea, model_id)
+        num_etiquetas = clasificador.model.config.num_labels
+        mapeo = mapeo_modelo(clasificador.model.config, self.mapeos.get(model_id))
+        inicio = time.perf_counter()
+        resultados, _ = puntuar_por_lotes(clasificador, textos, top_k=num_etiquetas, cache=cache,
+                                          cache_tokenizacion=obtener_cache_tokenizacion())
+        segundos = time.perf_counter() - inicio
+        return [distribucion_clases(resultado, mapeo) for resultado in resultados], segundos
+
+    def calibrar(self, textos, etiquetas):
+        """
+        Ajusta la temperatura del modelo rápido minimizando la log-verosimilitud
+        negativa sobre datos etiquetados
+        """
+        distribuciones, _ = self._distribuciones(self.modelo_rapido, textos)
+
+        def nll(temperatura):
+            return -sum(math.log(max(aplicar_temperatura(d, temperatura)[etiqueta], 1e-12))
+                        for d, etiqueta in zip(distribuciones, etiquetas))
+
+        self.temperatura = min(TEMPERATURAS, key=nll)
+        return self.temperatura
+
+    def clasificar(self, textos, cache=None):
+        """
+        Clasifica `textos` en cascada.
+
+        Devuelve (resultados, estadisticas). Cada resultado es
+        {'label', 'score', 'etapa'} con etapa 'rapido' o 'preciso'.
+        """
+        textos = list(textos)
+        distribuciones, segundos_rapido = self._distribuciones(self.modelo_rapido, textos, cache)
+
+        resultados = []
+        dudosos = []
+        for indice, distribucion in enumerate(distribuciones):
+            clase, confianza = _prediccion(aplicar_temperatura(distribucion, self.temperatura))
+            resultados.append({'label': clase, 'score': confianza, 'etapa': 'rapido'})
+            if confianza < self.umbral:
+                dudosos.append(indice)
+
+        segundos_preciso = 0.0
+        if dudosos:
+            distribuciones_precisas, segundos_preciso = self._distribuciones(
+                self.modelo_preciso, [textos[i] for i in dudosos], cache
+            )
+            for indice, distribucion in zip(dudosos, distribuciones_precisas):
+                clase, confianza = _prediccion(distribucion)
+                resultados[indice] = {'label': clase, 'score': confianza, 'etapa': 'preciso'}
+
+        # Solo inferencia: la carga de los modelos no cuenta
+        segundos = segundos_rapido + segundos_preciso
+        estadisticas = {
+            'textos': len(textos),
+            'escalados': len(dudosos),
+            'fraccion_escalada': len(dudosos) / len(textos) if textos else 0.0,
+            'segundos_rapido': segundos_rapido,
+            'segundos_preciso': segundos_preciso,
+            'segundos': segundos,
+            'ms_por_texto': segundos / len(textos) * 1000 if textos else 0.0
+        }
+        return resultados, estadisticas
+
+
+def evaluar_cascada(cascada, textos, etiquetas, umbrales=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95)):
+    """
+    Mide exactitud, fracción escalada y latencia para cada umbral.
+
+    Ambos modelos se ejecutan una vez sobre todos los textos (tras un
+    calentamiento) y la latencia de cada umbral se estima como el coste
+    del modelo rápido para todos más el del preciso para los escalados.
+    """
+    textos = list(textos)
+    n = len(textos)
+    if not n:
+        raise ValueError("evaluar_cascada necesita al menos un texto etiquetado")
+    for model_id in (cascada.modelo_rapido, cascada.modelo_preciso):
+        cascada._distribuciones(model_id, textos[:2])
+
+    rapidas, segundos_rapido = cascada._distribuciones(cascada.modelo_rapido, textos)
+    precisas, segundos_preciso = cascada._distribuciones(cascada.modelo_preciso, textos)
+    predicciones_rapidas = [_prediccion(aplicar_temperatura(d, cascada.temperatura)) for d in rapidas]
+    clases_precisas = [_prediccion(d)[0] for d in precisas]
+
+    def exactitud(predichas):
+        return sum(p == e for p, e in zip(predichas, etiquetas)) / n
+
+    filas = [
+        {'configuracion': 'solo_rapido', 'umbral': None, 'fraccion_escalada': 0.0,
+         'exactitud': exactitud([c for c, _ in predicciones_rapidas]),
+         'ms_por_texto': segundos_rapido / n * 1000},
+        {'configuracion': 'solo_preciso', 'umbral': None, 'fraccion_escalada': 1.0,
+         'exactitud': exactitud(clases_precisas),
+         'ms_por_texto': segundos_preciso / n * 1000}
+    ]
+    for umbral in umbrales:
+        escalados = [confianza < umbral for _, confianza in predicciones_rapidas]
+        predichas = [precisa if escalado else rapida
+                     for (rapida, _), precisa, escalado in zip(predicciones_rapidas, clases_precisas, escalados)]
+        fraccion = sum(escalados) / n
+        filas.append({
+            'configuracion': 'cascada',
+            'umbral': umbral,
+            'fraccion_escalada': fraccion,
+            'exactitud': exactitud(predichas),
+            'ms_por_texto': (segundos_rapido + fraccion * segundos_preciso) / n * 1000
+        })
+    return filas
+
+
+def mostrar_evaluacion(filas):
+    """
+    Imprime la tabla exactitud / latencia de evaluar_cascada
+    """
+    print(f"\n{'Configuración':<18}{'Umbral':>8}{'Escalado':>10}{'Exactitud':>11}{'ms/texto':>10}")
+    print("-" * 57)
+    for fila in filas:
+        umbral = f"{fila['umbral']:.2f}" if fila['umbral'] is not None else "-"
+        print(f"{fila['configuracion']:<18}{umbral:>8}{fila['fraccion_escalada'] * 100:>9.0f}%"
+              f"{fila['exactitud'] * 100:>10.1f}%{fila['ms_por_texto']:>10.1f}")
+
+
+def _leer_datos(ruta):
+    if ruta is None:
+        from text_classification import DATOS_RESENAS
+        return DATOS_RESENAS
+    with open(ruta, encoding='utf-8') as f:
+        registros = [json.loads(linea) for linea in f if linea.strip()]
+    return [(registro['texto'], registro['etiqueta']) for registro in registros]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evalúa la cascada de clasificadores")
+    parser.add_argument('--datos', help="JSONL con campos 'texto' y 'etiqueta' "
+                                        "(por defecto las reseñas de text_classification.py)")
+    parser.add_argument('--modelo-rapido', default=MODELO_RAPIDO)
+    parser.add_argument('--modelo-preciso', default=MODELO_PRECISO)
+    parser.add_argument('--mapeo-rapido', type=json.loads, metavar='JSON',
+                        help="Mapeo de etiquetas del modelo rápido a negativo/neutral/positivo, "
+                             "p. ej. '{\"LABEL_0\": \"negativo\", \"LABEL_1\": \"positivo\"}'")
+    parser.add_argument('--mapeo-preciso', type=json.loads, metavar='JSON',
+                        help="Mapeo de etiquetas del modelo preciso (como --mapeo-rapido)")
+    parser.add_argument('--umbrales', type=float, nargs='*', default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95])
+    parser.add_argument('--sin-calibrar', action='store_true',
+                        help="No ajustar la temperatura del modelo rápido")
+    parser.add_argument('--json', help="Guardar la evaluación en un archivo JSON")
+    opciones = parser.parse_args(argv)
+
+    datos = _leer_datos(opciones.datos)
+    if not datos:
+        parser.error(f"{opciones.datos} no contiene textos etiquetados")
+    textos = [texto for texto, _ in datos]
+    etiquetas = [etiqueta for _, etiqueta in datos]
+
+    print("🪜 CASCADA DE CLASIFICADORES")
+    print("=" * 60)
+    mapeos = {}
+    if opciones.mapeo_rapido:
+        mapeos[opciones.modelo_rapido] = opciones.mapeo_rapido
+    if opciones.mapeo_preciso:
+        mapeos[opciones.modelo_preciso] = opciones.mapeo_preciso
+    cascada = CascadaClasificacion(opciones.modelo_rapido, opciones.modelo_preciso, mapeos=mapeos)
+    if not opciones.sin_calibrar:
+        # Con pocos datos se calibra y evalúa sobre el mismo conjunto: para
+        # producción conviene reservar una partición de calibración
+        print(f"🌡️  Temperatura calibrada: {cascada.calibrar(textos, etiquetas):.2f}")
+
+    filas = evaluar_cascada(cascada, textos, etiquetas, opciones.umbrales)
+    mostrar_evaluacion(filas)
+
+    if opciones.json:
+        with open(opciones.json, 'w', encoding='utf-8') as f:
+            json.dump({'temperatura': cascada.temperatura, 'evaluacion': filas},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Evaluación guardada en {opciones.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Deduplicación de Entradas antes de la Inferencia
+================================================
+
+Los feeds de reseñas y redes sociales repiten muchos textos casi
+idénticos ("¡Me encanta!", "me encanta!!", retuits con una mención
+distinta...). Este módulo agrupa los textos de un lote antes de pasar por
+el modelo:
+
+  1. normaliza el texto (Unicode NFKC, minúsculas, sin puntuación ni
+     espacios repetidos) y agrupa los duplicados exactos por hash;
+  2. opcionalmente (con `umbral`), calcula una firma MinHash de los
+     n-gramas de caracteres de cada texto único y busca casi duplicados con
+     LSH por bandas, confirmando cada candidato con la similitud de Jaccard
+     estimada.
+
+Los casi duplicados no están activados por defecto: una negación cambia
+pocos n-gramas ("fue excelente" / "no fue excelente" comparten el 70%), así
+que textos con sentido opuesto pueden superar umbrales moderados. Con
+UMBRAL_CASI_DUPLICADOS solo se agrupan variaciones mínimas (una mención,
+un "RT") de textos largos.
+
+Solo el representante de cada grupo (su primera aparición) se envía al
+modelo y su resultado se copia a todos los miembros (ver
+batch_scoring.puntuar_columnar y batch_runner.py --deduplicar). La
+fracción de textos resueltos sin inferencia se registra en metrics.py
+(hf_deduplicacion_ratio).
+"""
+
+import hashlib
+import threading
+import unicodedata
+
+from lazy_imports import importar_perezoso
+
+np = importar_perezoso("numpy")
+
+_MEZCLA = 0x9E3779B97F4A7C15
+
+# Similitud de Jaccard recomendada al activar los casi duplicados
+UMBRAL_CASI_DUPLICADOS = 0.97
+
+
+def normalizar_para_deduplicar(texto):
+    """
+    Forma canónica de un texto para comparar duplicados
+    """
+    texto = unicodedata.normalize("NFKC", texto).lower()
+    texto = "".join(" " if unicodedata.category(c).startswith("P") else c for c in texto)
+    return " ".join(texto.split())
+
+
+def _shingles(texto, n):
+    """
+    Hashes uint64 únicos de los n-gramas de caracteres del texto normalizado
+    """
+    puntos = np.frombuffer(texto.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(puntos) < n:
+        # Texto corto: un único "n-grama" con el texto completo
+        n = max(len(puntos), 1)
+        if not len(puntos):
+            return np.zeros(1, dtype=np.uint64)
+    cantidad = len(puntos) - n + 1
+    h = np.full(cantidad, n, dtype=np.uint64)
+    for desplazamiento in range(n):
+        h = h * np.uint64(1000003) + puntos[desplazamiento:desplazamiento + cantidad]
+    return np.unique(h)
+
+
+class Deduplicador:
+    """
+    Agrupa textos duplicados tras normalizar y, con `umbral`, también los
+    casi duplicados (MinHash + LSH)
+    """
+
+    def __init__(self, umbral=None, num_permutaciones=128, bandas=32, ngrama=5, semilla=0):
+        if num_permutaciones % bandas:
+            raise ValueError("num_permutaciones debe ser múltiplo de bandas")
+        if umbral is not None and not 0 < umbral <= 1:
+            raise ValueError(f"El umbral de similitud debe estar en (0, 1]: {umbral}")
+        self.umbral = umbral
+        self.num_permutaciones = num_permutaciones
+        self.bandas = bandas
+        self.filas_banda = num_permutaciones // bandas
+        self.ngrama = ngrama
+        rng = np.random.default_rng(semilla)
+        # Una "permutación" por semilla: xor + mezcla multiplicativa
+        self._semillas = rng.integers(0, 2 ** 63, size=num_permutaciones, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self.textos = 0
+        self.duplicados_exactos = 0
+        self.casi_duplicados = 0
+
+    def firma(self, texto_normalizado):
+        """
+        Firma MinHash (num_permutaciones valores uint64) de un texto normalizado
+        """
+        shingles = _shingles(texto_normalizado, self.ngrama)
+        with np.errstate(over='ignore'):
+            valores = (shingles[None, :] ^ self._semillas[:, None]) * np.uint64(_MEZCLA)
+            valores ^= valores >> np.uint64(29)
+        return valores.min(axis=1)
+
+    def agrupar(self, textos):
+        """
+        Agrupa `textos`.
+
+        Devuelve (representantes, asignacion): los índices de los textos
+        que hay que procesar y, para cada texto, la posición de su
+        representante dentro de `representantes`.
+        """
+        textos = list(textos)
+        normalizados = [normalizar_para_deduplicar(str(texto)) for texto in textos]
+
+        # 1. Duplicados exactos tras normalizar
+        grupo_exacto = {}
+        unicos = []
+        padre = list(range(len(textos)))
+        for indice, normalizado in enumerate(normalizados):
+            clave = hashlib.blake2b(normalizado.encode('utf-8'), digest_size=16).digest()
+            primero = grupo_exacto.setdefault(clave, indice)
+            if primero == indice:
+                unicos.append(indice)
+            else:
+                padre[indice] = primero
+
+        def raiz(i):
+            while padre[i] != i:
+                padre[i] = padre[padre[i]]
+                i = padre[i]
+            return i
+
+        # 2. Casi duplicados entre los únicos: candidatos por LSH, confirmados por Jaccard
+        uniones = 0
+        if self.umbral is not None and len(unicos) > 1:
+            firmas = np.stack([self.firma(normalizados[i]) for i in unicos])
+            cubetas = {}
+            for banda in range(self.bandas):
+                tramo = firmas[:, banda * self.filas_banda:(banda + 1) * self.filas_banda]
+                for posicion, fila in enumerate(tramo):
+                    cubetas.setdefault((banda, fila.tobytes()), []).append(posicion)
+            comprobados = set()
+            for miembros in cubetas.values():
+                for otro in miembros[1:]:
+                    par = (miembros[0], otro)
+                    if par in comprobados:
+                        continue
+                    comprobados.add(par)
+                    a, b = raiz(unicos[par[0]]), raiz(unicos[par[1]])
+                    if a == b:
+                        continue
+                    similitud = float(np.mean(firmas[par[0]] == firmas[par[1]]))
+                    if similitud >= self.umbral:
+                        # El representante es siempre la primera aparición
+                        padre[max(a, b)] = min(a, b)
+                        uniones += 1
+
+        raices = [raiz(i) for i in range(len(textos))]
+        posicion_representante = {}
+        representantes = []
+        for indice in range(len(textos)):
+            if raices[indice] == indice:
+                posicion_representante[indice] = len(representantes)
+                representantes.append(indice)
+        asignacion = [posicion_representante[r] for r in raices]
+
+        with self._lock:
+            self.textos += len(textos)
+            self.duplicados_exactos += len(textos) - len(unicos)
+            self.casi_duplicados += uniones
+        return representantes, asignacion
+
+    def estadisticas(self):
+        with self._lock:
+            resueltos = self.duplicados_exactos + self.casi_duplicados
+            return {
+                'textos': self.textos,
+                'duplicados_exactos': self.duplicados_exactos,
+                'casi_duplicados': self.casi_duplicados,
+                'ratio_deduplicacion': resueltos / self.textos if self.textos else 0.0
+            }
+
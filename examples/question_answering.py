@@ -7,8 +7,14 @@ Este script demuestra cómo usar modelos de QA para responder preguntas
 basadas en un contexto dado.
 """
 
-from transformers import pipeline
-import torch
+import sys
+from pathlib import Path
+
+# Permitir ejecutar el script directamente desde examples/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from model_registry import obtener_pipeline
+from inference_cache import obtener_cache
 
 def qa_basico():
     """
@@ -17,10 +23,9 @@ def qa_basico():
     print("❓ Question Answering Básico...")
     
     # Crear pipeline de QA
-    qa_pipeline = pipeline(
+    qa_pipeline = obtener_pipeline(
         "question-answering",
-        model="deepset/roberta-base-squad2",
-        device=0 if torch.cuda.is_available() else -1
+        "deepset/roberta-base-squad2"
     )
     
     # Contexto de ejemplo
@@ -53,8 +58,18 @@ def qa_basico():
     print("\n❓ Respondiendo preguntas:")
     print("-" * 60)
     
-    for i, pregunta in enumerate(preguntas, 1):
-        resultado = qa_pipeline(question=pregunta, context=contexto)
+    def responder(entradas):
+        respuestas = qa_pipeline(entradas)
+        return respuestas if isinstance(respuestas, list) else [respuestas]
+    
+    # Las preguntas ya respondidas para este contexto se leen de la caché
+    resultados = obtener_cache().obtener_o_calcular_lote(
+        "question-answering", qa_pipeline,
+        [{'question': pregunta, 'context': contexto} for pregunta in preguntas],
+        responder
+    )
+    
+    for i, (pregunta, resultado) in enumerate(zip(preguntas, resultados), 1):
         
         respuesta = resultado['answer']
         confianza = resultado['score'] * 100
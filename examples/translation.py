@@ -6,8 +6,13 @@ Ejemplo de Traducción con Hugging Face
 Este script demuestra cómo usar modelos de traducción automática.
 """
 
-from transformers import pipeline
-import torch
+import sys
+from pathlib import Path
+
+# Permitir ejecutar el script directamente desde examples/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from model_registry import obtener_pipeline
 
 def traduccion_multiidioma():
     """
@@ -16,10 +21,9 @@ def traduccion_multiidioma():
     print("🌍 Traducción Multiidioma...")
     
     # Crear pipeline de traducción
-    translator = pipeline(
+    translator = obtener_pipeline(
         "translation",
-        model="Helsinki-NLP/opus-mt-en-es",  # Inglés a Español
-        device=0 if torch.cuda.is_available() else -1
+        "Helsinki-NLP/opus-mt-en-es"  # Inglés a Español
     )
     
     textos_en_ingles = [
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Entrenamiento de una Cabeza de Clasificación sobre Embeddings Congelados
+=======================================================================
+
+Ajustar todo un transformer en CPU no es práctico. Este módulo ejecuta el
+codificador congelado una sola vez sobre los datos etiquetados, guarda los
+embeddings (media de los tokens, normalizada) en un archivo NumPy mapeado
+en memoria y entrena encima una cabeza lineal (regresión logística
+multiclase) en segundos. Repetir el entrenamiento con otros
+hiperparámetros reutiliza los embeddings guardados sin volver a pasar por
+el codificador.
+
+El resultado es un modelo servible: un directorio con la cabeza y la
+referencia al codificador que se puede usar con cargar_modelo_cabeza() o
+directamente en batch_runner.py (--modelo sentimiento=ruta/al/modelo).
+
+Ejemplo:
+    python head_training.py --datos resenas.jsonl --salida modelos/resenas
+    python head_training.py --decaimientos 0 0.001 0.01 0.1   # barrido sobre la caché
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from lazy_imports import importar_perezoso
+from model_registry import obtener_registro
+from inference_cache import revision_modelo
+from zero_shot import MODELO_EMBEDDINGS, obtener_prefiltro
+
+np = importar_perezoso("numpy")
+torch = importar_perezoso("torch")
+
+DIRECTORIO_EMBEDDINGS = Path(".cache_inferencia") / "embeddings"
+ARCHIVO_CONFIG = "cabeza.json"
+ARCHIVO_PESOS = "cabeza.npz"
+TAMANO_BLOQUE = 1024
+
+
+def _huella(model_id, revision, textos):
+    """
+    Identifica un conjunto de embeddings por modelo, revisión y textos
+    """
+    resumen = hashlib.sha256(f"{model_id}\0{revision or ''}".encode('utf-8'))
+    for texto in textos:
+        resumen.update(b"\0" + texto.encode('utf-8'))
+    return resumen.hexdigest()
+
+
+def embeddings_en_cache(textos, modelo_base=MODELO_EMBEDDINGS, directorio=DIRECTORIO_EMBEDDINGS):
+    """
+    Devuelve los embeddings de `textos` como matriz mapeada en memoria.
+
+    La primera vez el codificador procesa los textos en bloques y los
+    escribe en un .npy; las siguientes se abre ese archivo sin cargar el
+    modelo en la GPU/CPU (la clave usa el id del modelo y la revisión de su
+    snapshot del hub).
+    """
+    textos = list(textos)
+    if not textos:
+        raise ValueError("No hay textos de los que calcular embeddings")
+    ruta = Path(directorio) / f"{_huella(modelo_base, revision_modelo(modelo_base), textos)}.npy"
+    if ruta.exists():
+        return np.load(ruta, mmap_mode='r')
+
+    codificador = obtener_prefiltro(modelo_base)
+    # Si el modelo se acaba de descargar, su revisión ya se conoce
+    ruta = Path(directorio) / f"{_huella(modelo_base, revision_modelo(modelo_base), textos)}.npy"
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_suffix(f".{os.getpid()}.tmp.npy")
+    matriz = None
+    for inicio in range(0, len(textos), TAMANO_BLOQUE):
+        bloque = codificador.embeber(textos[inicio:inicio + TAMANO_BLOQUE])
+        if matriz is None:
+            matriz = np.lib.format.open_memmap(temporal, mode='w+', dtype=np.float32,
+                                               shape=(len(textos), bloque.shape[1]))
+        matriz[inicio:inicio + len(bloque)] = bloque
+    matriz.flush()
+    del matriz
+    os.replace(temporal, ruta)
+    return np.load(ruta, mmap_mode='r')
+
+
+def entrenar_cabeza(embeddings, etiquetas, clases=None, decaimiento=0.01, epocas=300,
+                    tamano_lote=512, tasa_aprendizaje=0.05, semilla=0):
+    """
+    Ajusta una regresión logística multiclase sobre los embeddings.
+
+    Devuelve (pesos, sesgo, clases) como arrays de NumPy.
+    """
+    clases = sorted(set(etiquetas)) if clases is None else list(clases)
+    indice_clase = {clase: i for i, clase in enumerate(clases)}
+    objetivos = torch.tensor([indice_clase[e] for e in etiquetas])
+
+    generador = torch.Generator().manual_seed(semilla)
+    cabeza = torch.nn.Linear(embeddings.shape[1], len(clases))
+    optimizador = torch.optim.AdamW(cabeza.parameters(), lr=tasa_aprendizaje, weight_decay=decaimiento)
+    perdida = torch.nn.CrossEntropyLoss()
+
+    n = len(objetivos)
+    for _ in range(epocas):
+        permutacion = torch.randperm(n, generator=generador)
+        for inicio in range(0, n, tamano_lote):
+            indices = permutacion[inicio:inicio + tamano_lote]
+            # Lectura ordenada del memmap para no saltar por el archivo
+            filas = np.sort(indices.numpy())
+            x = torch.from_numpy(np.ascontiguousarray(embeddings[filas]))
+            optimizador.zero_grad()
+            perdida(cabeza(x), objetivos[filas]).backward()
+            optimizador.step()
+
+    with torch.no_grad():
+        return cabeza.weight.numpy().copy(), cabeza.bias.numpy().copy(), clases
+
+
+def _probabilidades(embeddings, pesos, sesgo):
+    logits = np.asarray(embeddings, dtype=np.float32) @ pesos.T + sesgo
+    logits -= logits.max(axis=1, keepdims=True)
+    exponenciales = np.exp(logits)
+    return exponenciales / exponenciales.sum(axis=1, keepdims=True)
+
+
+def _division(etiquetas, fraccion_validacion, semilla=0):
+    """
+    Partición estratificada en índices de entrenamiento y validación
+    """
+    rng = np.random.default_rng(semilla)
+    entrenamiento, validacion = [], []
+    for clase in sorted(set(etiquetas)):
+        indices = [i for i, e in enumerate(etiquetas) if e == clase]
+        rng.shuffle(indices)
+        corte = int(round(len(indices) * fraccion_validacion))
+        if len(indices) > 1:
+            corte = min(max(corte, 1), len(indices) - 1)
+        else:
+            corte = 0
+        validacion.extend(indices[:corte])
+        entrenamiento.extend(indices[corte:])
+    return sorted(entrenamiento), sorted(validacion)
+
+
+def barrido(embeddings, etiquetas, decaimientos=(0.0, 0.001, 0.01, 0.1), fraccion_validacion=0.2,
+            **kwargs):
+    """
+    Entrena una cabeza por valor de decaimiento sobre los mismos embeddings
+    y devuelve la exactitud de validación de cada una
+    """
+    entrenamiento, validacion = _division(etiquetas, fraccion_validacion)
+    clases = sorted(set(etiquetas))
+    x_entrenamiento = embeddings[entrenamiento]
+    y_entrenamiento = [etiquetas[i] for i in entrenamiento]
+
+    filas = []
+    for decaimiento in decaimientos:
+        inicio = time.perf_counter()
+        pesos, sesgo, _ = entrenar_cabeza(x_entrenamiento, y_entrenamiento, clases,
+                                          decaimiento=decaimiento, **kwargs)
+        segundos = time.perf_counter() - inicio
+        if validacion:
+            predichas = _probabilidades(embeddings[validacion], pesos, sesgo).argmax(axis=1)
+            exactitud = float(np.mean([clases[p] == etiquetas[i] for p, i in zip(predichas, validacion)]))
+        else:
+            exactitud = None
+        filas.append({'decaimiento': decaimiento, 'exactitud_validacion': exactitud,
+                      'segundos_entrenamiento': segundos})
+    return filas
+
+
+class ModeloCabeza:
+    """
+    Codificador congelado + cabeza lineal, con salida en formato pipeline
+    """
+
+    def __init__(self, modelo_base, clases, pesos, sesgo):
+        self.modelo_base = modelo_base
+        self.clases = list(clases)
+        self.pesos = pesos
+        self.sesgo = sesgo
+        self.task = "text-classification"
+        # Identifica los pesos en la caché de inferencia: reentrenar la invalida
+        resumen = hashlib.sha256(modelo_base.encode('utf-8'))
+        resumen.update(np.ascontiguousarray(pesos).tobytes())
+        resumen.update(np.ascontiguousarray(sesgo).tobytes())
+        self.huella = resumen.hexdigest()[:16]
+
+    def predecir_probabilidades(self, textos):
+        return _probabilidades(obtener_prefiltro(self.modelo_base).embeber(list(textos)),
+                               self.pesos, self.sesgo)
+
+    def __call__(self, textos, top_k=1):
+        """
+        Devuelve [{'label', 'score'}] por texto, como el pipeline de transformers
+        """
+        unico = isinstance(textos, str)
+        probabilidades = self.predecir_probabilidades([textos] if unico else textos)
+        k = min(top_k or len(self.clases), len(self.clases))
+        resultados = []
+        for fila in probabilidades:
+            orden = np.argsort(-fila)[:k]
+            resultados.append([{'label': self.clases[j], 'score': float(fila[j])} for j in orden])
+        return resultados[0] if unico else resultados
+
+    def guardar(self, directorio):
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        np.savez(directorio / ARCHIVO_PESOS, pesos=self.pesos, sesgo=self.sesgo)
+        with open(directorio / ARCHIVO_CONFIG, 'w', encoding='utf-8') as f:
+            json.dump({'modelo_base': self.modelo_base, 'clases': self.clases,
+                       'dimension': int(self.pesos.shape[1])}, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def cargar(cls, directorio):
+        directorio = Path(directorio)
+        with open(directorio / ARCHIVO_CONFIG, encoding='utf-8') as f:
+            config = json.load(f)
+        with np.load(directorio / ARCHIVO_PESOS) as datos:
+            return cls(config['modelo_base'], config['clases'], datos['pesos'], datos['sesgo'])
+
+
+def es_modelo_cabeza(ruta):
+    """
+    Indica si `ruta` es un directorio guardado por ModeloCabeza.guardar
+    """
+    return (Path(ruta) / ARCHIVO_CONFIG).is_file()
+
+
+def cargar_modelo_cabeza(ruta):
+    """
+    Devuelve el modelo de `ruta` desde el registro compartido de modelos
+    """
+    return obtener_registro().obtener("text-classification", str(Path(ruta).resolve()),
+                                      cargador=lambda: ModeloCabeza.cargar(ruta))
+
+
+def entrenar_modelo(textos, etiquetas, modelo_base=MODELO_EMBEDDINGS, decaimiento=0.01, **kwargs):
+    """
+    Codifica (o reutiliza) los embeddings y entrena la cabeza con todos los datos
+    """
+    embeddings = embeddings_en_cache(textos, modelo_base)
+    pesos, sesgo, clases = entrenar_cabeza(embeddings, list(etiquetas), decaimiento=decaimiento, **kwargs)
+    return ModeloCabeza(modelo_base, clases, pesos, sesgo)
+
+
+def _leer_datos(ruta):
+    if ruta is None:
+        from text_classification import DATOS_RESENAS
+        return DATOS_RESENAS
+    with open(ruta, encoding='utf-8') as f:
+        registros = [json.loads(linea) for linea in f if linea.strip()]
+    return [(registro['texto'], registro['etiqueta']) for registro in registros]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Entrena una cabeza lineal sobre embeddings congelados")
+    parser.add_argument('--datos', help="JSONL con campos 'texto' y 'etiqueta' "
+                                        "(por defecto las reseñas de text_classification.py)")
+    parser.add_argument('--modelo-base', default=MODELO_EMBEDDINGS)
+    parser.add_argument('--decaimientos', type=float, nargs='*', default=[0.0, 0.001, 0.01, 0.1],
+                        help="Valores de weight decay a comparar en validación")
+    parser.add_argument('--validacion', type=float, default=0.2,
+                        help="Fracción de validación para el barrido (default=0.2)")
+    parser.add_argument('--epocas', type=int, default=300)
+    parser.add_argument('--salida', default="modelos/cabeza_resenas",
+                        help="Directorio donde guardar el modelo final")
+    opciones = parser.parse_args(argv)
+
+    datos = _leer_datos(opciones.datos)
+    textos = [texto for texto, _ in datos]
+    etiquetas = [etiqueta for _, etiqueta in datos]
+
+    print("🧠 ENTRENAMIENTO DE CABEZA SOBRE EMBEDDINGS CONGELADOS")
+    print("=" * 60)
+    inicio = time.perf_counter()
+    embeddings = embeddings_en_cache(textos, opciones.modelo_base)
+    print(f"📦 Embeddings {embeddings.shape[0]}×{embeddings.shape[1]} listos en "
+          f"{time.perf_counter() - inicio:.2f}s ({embeddings.filename})")
+
+    filas = barrido(embeddings, etiquetas, opciones.decaimientos, opciones.validacion,
+                    epocas=opciones.epocas)
+    for fila in filas:
+        exactitud = fila['exactitud_validacion']
+        texto_exactitud = f"{exactitud * 100:.1f}%" if exactitud is not None else "-"
+        print(f"   decaimiento {fila['decaimiento']:<8} validación {texto_exactitud:>6} | "
+              f"{fila['segundos_entrenamiento']:.2f}s")
+
+    mejor = max(filas, key=lambda fila: fila['exactitud_validacion'] or 0.0)
+    modelo = entrenar_modelo(textos, etiquetas, opciones.modelo_base, mejor['decaimiento'],
+                             epocas=opciones.epocas)
+    modelo.guardar(opciones.salida)
+    print(f"\n💾 Modelo (decaimiento {mejor['decaimiento']}) guardado en {opciones.salida}")
+    print(f"   Úsalo con: python batch_runner.py sentimiento datos.jsonl --modelo sentimiento={opciones.salida}")
+
+
+if __name__ == "__main__":
+    main()
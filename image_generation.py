@@ -8,43 +8,55 @@ a partir de prompts de texto usando Stable Diffusion.
 """
 
 import os
-import torch
+import time
 import warnings
 from datetime import datetime
-from PIL import Image
-import matplotlib.pyplot as plt
+
+from lazy_imports import importar_perezoso
+from model_registry import obtener_registro
+from result_sink import SumideroParquet
+
+# torch y matplotlib solo se importan cuando se usan
+torch = importar_perezoso("torch")
+plt = importar_perezoso("matplotlib.pyplot")
 
 # Suprimir warnings de xformers
 warnings.filterwarnings("ignore", category=UserWarning, module="xformers")
 os.environ["XFORMERS_MORE_DETAILS"] = "0"
 
-try:
-    from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
-except ImportError as e:
-    print(f"❌ Error importando diffusers: {e}")
-    print("💡 Solucionando problema de dependencias...")
+def importar_diffusers():
+    """
+    Importa diffusers en el primer uso (intentando reparar dependencias si falla)
+    """
+    try:
+        from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+    except ImportError as e:
+        print(f"❌ Error importando diffusers: {e}")
+        print("💡 Solucionando problema de dependencias...")
     
-    # Desinstalar xformers problemático
-    import subprocess
-    import sys
+        # Desinstalar xformers problemático
+        import subprocess
+        import sys
     
-    try:
-        subprocess.run([sys.executable, "-m", "pip", "uninstall", "xformers", "-y"], 
-                      capture_output=True, check=False)
-        print("✅ xformers desinstalado")
-    except:
-        pass
+        try:
+            subprocess.run([sys.executable, "-m", "pip", "uninstall", "xformers", "-y"], 
+                          capture_output=True, check=False)
+            print("✅ xformers desinstalado")
+        except:
+            pass
     
-    # Intentar importar de nuevo
-    try:
-        from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
-        print("✅ Diffusers importado exitosamente")
-    except ImportError as e2:
-        print(f"❌ Error persistente: {e2}")
-        print("💡 Instalando versión compatible...")
-        subprocess.run([sys.executable, "-m", "pip", "install", "diffusers==0.21.4"], 
-                      capture_output=True)
-        from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+        # Intentar importar de nuevo
+        try:
+            from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+            print("✅ Diffusers importado exitosamente")
+        except ImportError as e2:
+            print(f"❌ Error persistente: {e2}")
+            print("💡 Instalando versión compatible...")
+            subprocess.run([sys.executable, "-m", "pip", "install", "diffusers==0.21.4"], 
+                          capture_output=True)
+            from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+    
+    return StableDiffusionPipeline, DPMSolverMultistepScheduler
 
 def crear_directorio_salida():
     """
@@ -56,6 +68,39 @@ def crear_directorio_salida():
         print(f"📁 Directorio creado: {directorio}")
     return directorio
 
+def cargar_pipeline_difusion(model_id, device, dtype):
+    """
+    Carga un pipeline de Stable Diffusion con las optimizaciones del ejemplo
+    """
+    StableDiffusionPipeline, DPMSolverMultistepScheduler = importar_diffusers()
+    pipe = StableDiffusionPipeline.from_pretrained(
+        model_id,
+        torch_dtype=dtype,
+        safety_checker=None,
+        requires_safety_checker=False
+    )
+    pipe = pipe.to(device)
+    
+    # Optimizar para velocidad
+    pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
+    
+    # Habilitar optimizaciones de memoria si es necesario
+    if device == "cpu" or dtype == torch.float32:
+        pipe.enable_attention_slicing()
+    
+    return pipe
+
+def obtener_pipeline_difusion(model_id, device, dtype=None):
+    """
+    Devuelve el pipeline de Stable Diffusion desde el registro compartido
+    """
+    if dtype is None:
+        dtype = torch.float16 if device == "cuda" else torch.float32
+    return obtener_registro().obtener(
+        "text-to-image", model_id, dtype=dtype, device=device,
+        cargador=lambda: cargar_pipeline_difusion(model_id, device, dtype)
+    )
+
 def generar_imagen_basica():
     """
     Genera imágenes usando Stable Diffusion con prompts básicos
@@ -67,26 +112,11 @@ def generar_imagen_basica():
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"🖥️  Dispositivo: {device}")
     
-    # Cargar el modelo Stable Diffusion
+    # Cargar el modelo Stable Diffusion (reutilizado si ya está en el registro)
     print("📥 Cargando modelo Stable Diffusion...")
-    model_id = "runwayml/stable-diffusion-v1-5"
     
     try:
-        pipe = StableDiffusionPipeline.from_pretrained(
-            model_id,
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-            safety_checker=None,
-            requires_safety_checker=False
-        )
-        pipe = pipe.to(device)
-        
-        # Optimizar para velocidad
-        pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
-        
-        # Habilitar optimizaciones de memoria si es necesario
-        if device == "cpu":
-            pipe.enable_attention_slicing()
-        
+        pipe = obtener_pipeline_difusion("runwayml/stable-diffusion-v1-5", device)
         print("✅ Modelo cargado exitosamente!")
         
     except Exception as e:
@@ -94,15 +124,8 @@ def generar_imagen_basica():
         print("💡 Intentando con modelo alternativo más ligero...")
         
         # Modelo alternativo más pequeño
-        model_id = "CompVis/stable-diffusion-v1-4"
-        pipe = StableDiffusionPipeline.from_pretrained(
-            model_id,
-            torch_dtype=torch.float32,
-            safety_checker=None,
-            requires_safety_checker=False
-        )
-        pipe = pipe.to(device)
-        pipe.enable_attention_slicing()
+        pipe = obtener_pipeline_difusion("CompVis/stable-diffusion-v1-4", device,
+                                         dtype=torch.float32)
     
     # Crear directorio de salida
     directorio_salida = crear_directorio_salida()
@@ -135,6 +158,9 @@ def generar_imagen_basica():
     print("-" * 60)
     
     imagenes_generadas = []
+    # Metadatos de cada imagen en Parquet (la imagen en sí va al PNG)
+    sumidero = SumideroParquet('imagen')
+    modelo = getattr(pipe, 'name_or_path', None) or pipe.config.get('_name_or_path')
     
     for i, ejemplo in enumerate(prompts_ejemplo, 1):
         prompt = ejemplo["prompt"]
@@ -144,6 +170,7 @@ def generar_imagen_basica():
         
         try:
             # Generar imagen
+            inicio = time.perf_counter()
             with torch.autocast(device):
                 imagen = pipe(
                     prompt,
@@ -163,6 +190,11 @@ def generar_imagen_basica():
                 "prompt": prompt,
                 "archivo": ruta_archivo
             })
+            sumidero.escribir([{
+                "prompt": prompt, "archivo": ruta_archivo, "modelo": modelo,
+                "ancho": 512, "alto": 512, "pasos": 20, "guidance": 7.5, "semilla": None,
+                "segundos": time.perf_counter() - inicio, "dispositivo": device
+            }])
             
             print(f"   ✅ Guardada como: {ruta_archivo}")
             
@@ -170,6 +202,8 @@ def generar_imagen_basica():
             print(f"   ❌ Error generando imagen: {e}")
             continue
     
+    sumidero.cerrar()
+    print(f"\n💾 Metadatos añadidos a {sumidero.directorio}")
     return imagenes_generadas
 
 def generar_imagen_personalizada():
@@ -184,21 +218,9 @@ def generar_imagen_personalizada():
     
     # Cargar modelo (reutilizar si ya está cargado)
     print("📥 Cargando modelo...")
-    model_id = "runwayml/stable-diffusion-v1-5"
     
     try:
-        pipe = StableDiffusionPipeline.from_pretrained(
-            model_id,
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-            safety_checker=None,
-            requires_safety_checker=False
-        )
-        pipe = pipe.to(device)
-        pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
-        
-        if device == "cpu":
-            pipe.enable_attention_slicing()
-            
+        pipe = obtener_pipeline_difusion("runwayml/stable-diffusion-v1-5", device)
     except Exception as e:
         print(f"❌ Error: {e}")
         return None
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Caché Persistente de Resultados de Inferencia
+=============================================
+
+Este módulo guarda en disco (SQLite) los resultados de los pipelines para
+no recalcular textos que ya se procesaron. Cada resultado se indexa por un
+hash del texto normalizado, la tarea, el modelo (y su revisión) y los
+parámetros de inferencia. Delante de SQLite hay una caché LRU en memoria.
+
+SQLite en modo WAL permite que varios procesos lean y escriban la misma
+caché a la vez. Las entradas se desalojan por antigüedad y por tamaño.
+
+La ruta se configura con HF_CACHE_INFERENCIA (por defecto
+'.cache_inferencia/resultados.sqlite').
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+RUTA_POR_DEFECTO = os.path.join(".cache_inferencia", "resultados.sqlite")
+
+# Campos que se usan tal cual: los resultados guardan posiciones de
+# caracteres dentro de ellos (start/end de question-answering)
+CAMPOS_LITERALES = frozenset({'context'})
+
+
+def normalizar_texto(texto):
+    """
+    Normaliza un texto para que variaciones triviales compartan entrada
+    """
+    texto = unicodedata.normalize("NFC", texto)
+    return " ".join(texto.split())
+
+
+def _normalizar_entrada(entrada):
+    if isinstance(entrada, str):
+        return normalizar_texto(entrada)
+    if isinstance(entrada, dict):
+        return {clave: valor if clave in CAMPOS_LITERALES else _normalizar_entrada(valor)
+                for clave, valor in entrada.items()}
+    if isinstance(entrada, (list, tuple)):
+        return [_normalizar_entrada(valor) for valor in entrada]
+    return entrada
+
+
+def identificar_modelo(modelo):
+    """
+    Devuelve (model_id, revision) a partir de un pipeline o un nombre de modelo
+    """
+    if isinstance(modelo, str):
+        return modelo, None
+    config = modelo.model.config
+    revision = getattr(config, '_commit_hash', None)
+    cuantizacion = getattr(config, 'cuantizacion', None)
+    if cuantizacion:
+        revision = f"{revision or ''}+{cuantizacion}"
+    return config.name_or_path, revision
+
+
+def revision_modelo(model_id):
+    """
+    Revisión (commit del snapshot descargado del hub) de `model_id` sin
+    cargar el modelo ni consultar la red. None para directorios locales o
+    modelos aún no descargados.
+    """
+    from transformers.utils.hub import cached_file, extract_commit_hash
+
+    try:
+        ruta = cached_file(model_id, "config.json", local_files_only=True,
+                           _raise_exceptions_for_missing_entries=False)
+    except (OSError, ValueError):
+        return None
+    return extract_commit_hash(ruta, None) if ruta else None
+
+
+class CacheInferencia:
+    """
+    Caché de resultados en SQLite con una capa LRU en memoria
+    """
+
+    def __init__(self, ruta=None, max_mb=512, max_edad_dias=30, tamano_memoria=10000):
+        if ruta is None:
+            ruta = os.environ.get("HF_CACHE_INFERENCIA", RUTA_POR_DEFECTO)
+        self.ruta = ruta
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self.max_edad_segundos = max_edad_dias * 86400 if max_edad_dias else None
+        self.tamano_memoria = tamano_memoria
+
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+        self._escrituras_desde_desalojo = 0
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False,
+                                         isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS resultados (
+                clave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL,
+                tamano INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self._conexion.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ultimo_acceso ON resultados (ultimo_acceso)"
+        )
+
+    @staticmethod
+    def clave(tarea, model_id, entrada, parametros=None, revision=None):
+        """
+        Calcula la clave (hash SHA-256) de una inferencia
+        """
+        contenido = json.dumps({
+            'tarea': tarea,
+            'modelo': model_id,
+            'revision': revision,
+            'parametros': parametros or {},
+            'entrada': _normalizar_entrada(entrada)
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+    def _recordar(self, clave, valor, creado):
+        self._memoria[clave] = (valor, creado)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.tamano_memoria:
+            self._memoria.popitem(last=False)
+
+    def obtener(self, clave):
+        """
+        Devuelve el resultado guardado o None si no existe (o ha caducado)
+        """
+        with self._lock:
+            ahora = time.time()
+            if clave in self._memoria:
+                valor, creado = self._memoria[clave]
+                if not (self.max_edad_segundos and ahora - creado > self.max_edad_segundos):
+                    self._memoria.move_to_end(clave)
+                    self.aciertos_memoria += 1
+                    return valor
+                del self._memoria[clave]
+
+            fila = self._conexion.execute(
+                "SELECT valor, creado FROM resultados WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or (self.max_edad_segundos and ahora - fila[1] > self.max_edad_segundos):
+                self.fallos += 1
+                return None
+
+            self._conexion.execute(
+                "UPDATE resultados SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave)
+            )
+            valor = json.loads(fila[0])
+            self._recordar(clave, valor, fila[1])
+            self.aciertos_disco += 1
+            return valor
+
+    def guardar_varios(self, pares):
+        """
+        Guarda una lista de pares (clave, valor) en una sola transacción
+        """
+        ahora = time.time()
+        filas = []
+        for clave, valor in pares:
+            serializado = json.dumps(valor, ensure_ascii=False)
+            filas.append((clave, serializado, len(serializado), ahora, ahora))
+        with self._lock:
+            for clave, valor in pares:
+                self._recordar(clave, valor, ahora)
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                self._conexion.executemany(
+                    "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?)", filas
+                )
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+            self._escrituras_desde_desalojo += len(filas)
+            if self._escrituras_desde_desalojo >= 1000:
+                self._desalojar()
+
+    def guardar(self, clave, valor):
+        self.guardar_varios([(clave, valor)])
+
+    def obtener_o_calcular_lote(self, tarea, modelo, entradas, calcular, parametros=None):
+        """
+        Devuelve los resultados de `entradas`, calculando solo las que faltan.
+
+        `modelo` es un pipeline o un nombre de modelo. `calcular` recibe la
+        lista de entradas sin resultado en caché y debe devolver sus
+        resultados en el mismo orden; con un acierto no se tokeniza ni se
+        ejecuta el modelo.
+        """
+        model_id, revision = identificar_modelo(modelo)
+        claves = [self.clave(tarea, model_id, entrada, parametros, revision) for entrada in entradas]
+        resultados = [self.obtener(clave) for clave in claves]
+
+        faltantes = [i for i, resultado in enumerate(resultados) if resultado is None]
+        if faltantes:
+            calculados = calcular([entradas[i] for i in faltantes])
+            for indice, resultado in zip(faltantes, calculados):
+                resultados[indice] = resultado
+            self.guardar_varios([(claves[i], resultados[i]) for i in faltantes])
+        return resultados
+
+    def _desalojar(self):
+        """
+        Elimina entradas caducadas y, si se supera el tamaño máximo, las
+        menos usadas recientemente
+        """
+        self._escrituras_desde_desalojo = 0
+        if self.max_edad_segundos:
+            self._conexion.execute(
+                "DELETE FROM resultados WHERE creado < ?", (time.time() - self.max_edad_segundos,)
+            )
+        if self.max_bytes:
+            total = self._conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM resultados").fetchone()[0]
+            while total > self.max_bytes:
+                antiguas = self._conexion.execute(
+                    "SELECT clave, tamano FROM resultados ORDER BY ultimo_acceso LIMIT 1000"
+                ).fetchall()
+                if not antiguas:
+                    break
+                self._conexion.executemany(
+                    "DELETE FROM resultados WHERE clave = ?", [(fila[0],) for fila in antiguas]
+                )
+                total -= sum(fila[1] for fila in antiguas)
+
+    def desalojar(self):
+        with self._lock:
+            self._desalojar()
+
+    def limpiar(self):
+        """
+        Elimina todas las entradas de la caché
+        """
+        with self._lock:
+            self._memoria.clear()
+            self._conexion.execute("DELETE FROM resultados")
+
+    def estadisticas(self):
+        """
+        Devuelve los contadores de aciertos y fallos
+        """
+        with self._lock:
+            entradas, tamano = self._conexion.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM resultados"
+            ).fetchone()
+        aciertos = self.aciertos_memoria + self.aciertos_disco
+        consultas = aciertos + self.fallos
+        return {
+            'aciertos_memoria': self.aciertos_memoria,
+            'aciertos_disco': self.aciertos_disco,
+            'fallos': self.fallos,
+            'tasa_aciertos': aciertos / consultas if consultas else 0.0,
+            'entradas': entradas,
+            'tamano_mb': tamano / (1024 * 1024)
+        }
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+
+_cache_global = None
+_lock_global = threading.Lock()
+
+
+def obtener_cache():
+    """
+    Devuelve la caché compartida por todo el proceso
+    """
+    global _cache_global
+    with _lock_global:
+        if _cache_global is None:
+            _cache_global = CacheInferencia()
+        return _cache_global
+
+
+def mostrar_estadisticas_cache():
+    """
+    Imprime los contadores de la caché global
+    """
+    stats = obtener_cache().estadisticas()
+    print(f"💾 Caché de inferencia: {stats['tasa_aciertos'] * 100:.1f}% aciertos "
+          f"({stats['aciertos_memoria']} memoria, {stats['aciertos_disco']} disco, "
+          f"{stats['fallos']} fallos) | {stats['entradas']} entradas, {stats['tamano_mb']:.1f} MB")
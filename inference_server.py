@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP Local de Inferencia con Micro-Lotes
+=================================================
+
+Este script expone las tareas de texto de los ejemplos como endpoints HTTP
+(JSON) usando solo asyncio, sin dependencias adicionales:
+
+    POST /sentimiento   {"texto": "..."}
+    POST /zero-shot     {"texto": "...", "categorias": ["a", "b"]}
+    POST /emociones     {"texto": "..."}
+    POST /idioma        {"texto": "..."}
+    POST /qa            {"pregunta": "...", "contexto": "..."}
+    POST /traduccion    {"texto": "..."}
+    GET  /salud
+    GET  /metricas      (formato de texto de Prometheus)
+
+Las peticiones concurrentes a la misma tarea se agrupan en micro-lotes
+(hasta --max-lote elementos o --max-espera-ms milisegundos) y los modelos
+se ejecutan en un pool de hilos para no bloquear el bucle de eventos; una
+misma tarea puede tener en marcha tantos lotes como --hilos.
+Por defecto funciona sin conexión usando los modelos ya descargados.
+
+Ejemplo:
+    python inference_server.py --puerto 8000 --max-espera-ms 5
+    curl -X POST localhost:8000/sentimiento -d '{"texto": "Me encanta"}'
+"""
+
+import os
+
+# Trabajar solo con los modelos de la caché local (antes de importar transformers)
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import asyncio
+import json
+import time
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from batch_runner import TAREAS, configurar_modelos
+from inference_cache import obtener_cache
+import metrics
+
+
+class MicroLoteador:
+    """
+    Agrupa peticiones concurrentes de una tarea en lotes
+    """
+
+    def __init__(self, tarea, ejecutor, opciones, max_lote=32, max_espera_ms=5.0, max_concurrentes=1):
+        self.tarea = tarea
+        self.ejecutor = ejecutor
+        self.opciones = opciones
+        self.max_lote = max_lote
+        self.max_espera = max_espera_ms / 1000
+        # Lotes de esta tarea en ejecución a la vez (uno por hilo del pool)
+        self.max_concurrentes = max(1, max_concurrentes)
+        self.cola = asyncio.Queue()
+        self.lotes = 0
+        self.elementos = 0
+        self._tarea_bucle = None
+        self._semaforo = None
+        self._en_curso = set()
+
+    def iniciar(self):
+        self._semaforo = asyncio.Semaphore(self.max_concurrentes)
+        self._tarea_bucle = asyncio.get_running_loop().create_task(self._bucle())
+
+    async def procesar(self, registro):
+        """
+        Encola un registro y espera su resultado
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        await self.cola.put((registro, futuro))
+        return await futuro
+
+    async def _bucle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Con todos los hilos ocupados las peticiones esperan en la cola
+            # y forman un lote mayor para el siguiente hilo libre
+            await self._semaforo.acquire()
+            pendientes = [await self.cola.get()]
+            limite = loop.time() + self.max_espera
+            while len(pendientes) < self.max_lote:
+                restante = limite - loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    pendientes.append(await asyncio.wait_for(self.cola.get(), restante))
+                except asyncio.TimeoutError:
+                    break
+
+            tarea = loop.create_task(self._ejecutar(pendientes))
+            self._en_curso.add(tarea)
+            tarea.add_done_callback(self._lote_terminado)
+
+    def _lote_terminado(self, tarea):
+        self._en_curso.discard(tarea)
+        self._semaforo.release()
+
+    async def _ejecutar(self, pendientes):
+        loop = asyncio.get_running_loop()
+        registros = [registro for registro, _ in pendientes]
+        try:
+            resultados = await loop.run_in_executor(
+                self.ejecutor, TAREAS[self.tarea], registros, self.opciones
+            )
+        except Exception as e:
+            if len(pendientes) > 1:
+                # Reintentar uno a uno para que un registro inválido
+                # no haga fallar al resto del lote
+                for pendiente in pendientes:
+                    await self._ejecutar([pendiente])
+                return
+            for _, futuro in pendientes:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+
+        self.lotes += 1
+        self.elementos += len(registros)
+        for (_, futuro), resultado in zip(pendientes, resultados):
+            if not futuro.done():
+                futuro.set_result(resultado)
+
+
+class ServidorInferencia:
+    """
+    Servidor HTTP/1.1 mínimo sobre asyncio
+    """
+
+    def __init__(self, opciones):
+        self.opciones = opciones
+        self.ejecutor = ThreadPoolExecutor(max_workers=opciones.hilos,
+                                           thread_name_prefix="inferencia")
+        self.opciones_tareas = Namespace(
+            tamano_lote=opciones.max_lote,
+            categorias=None,
+            cache=None if opciones.sin_cache else obtener_cache()
+        )
+        self.loteadores = {}
+        self.inicio = time.time()
+
+    def _loteador(self, tarea):
+        if tarea not in self.loteadores:
+            loteador = MicroLoteador(tarea, self.ejecutor, self.opciones_tareas,
+                                     self.opciones.max_lote, self.opciones.max_espera_ms,
+                                     max_concurrentes=self.opciones.hilos)
+            loteador.iniciar()
+            self.loteadores[tarea] = loteador
+        return self.loteadores[tarea]
+
+    async def _responder_peticion(self, metodo, ruta, cuerpo):
+        tarea = ruta.strip('/')
+        if metodo == 'GET' and tarea == 'salud':
+            return HTTPStatus.OK, {
+                'estado': 'ok',
+                'segundos_activo': time.time() - self.inicio,
+                'tareas': {nombre: {'lotes': l.lotes, 'elementos': l.elementos}
+                           for nombre, l in self.loteadores.items()}
+            }
+        if metodo == 'GET' and tarea == 'metricas':
+            return HTTPStatus.OK, metrics.exportar_prometheus()
+        if tarea not in TAREAS:
+            return HTTPStatus.NOT_FOUND, {'error': f"Ruta desconocida: {ruta}"}
+        if metodo != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "Usa POST"}
+
+        try:
+            datos = json.loads(cuerpo or b'{}')
+        except json.JSONDecodeError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': f"JSON no válido: {e}"}
+
+        # Se aceptan un registro, una lista de registros o una lista en "registros"
+        registros = datos.get('registros', [datos]) if isinstance(datos, dict) else datos
+        if not isinstance(registros, list) or not all(isinstance(r, dict) for r in registros):
+            return HTTPStatus.BAD_REQUEST, {'error': "El cuerpo debe ser un objeto JSON, una lista de "
+                                                     "objetos o {\"registros\": [objetos]}"}
+        loteador = self._loteador(tarea)
+        try:
+            resultados = await asyncio.gather(*(loteador.procesar(r) for r in registros))
+        except (KeyError, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+
+        if isinstance(datos, dict) and 'registros' not in datos:
+            return HTTPStatus.OK, resultados[0]
+        return HTTPStatus.OK, {'resultados': resultados}
+
+    async def _atender_conexion(self, lector, escritor):
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, ruta, version = linea.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                cabeceras = {}
+                while True:
+                    cabecera = await lector.readline()
+                    if cabecera in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = cabecera.decode('latin-1').partition(':')
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+
+                try:
+                    longitud = int(cabeceras.get('content-length', 0) or 0)
+                    if longitud < 0:
+                        raise ValueError(longitud)
+                except ValueError:
+                    # Sin una longitud válida no se sabe dónde acaba el cuerpo:
+                    # se responde 400 y se cierra la conexión
+                    longitud = None
+
+                if longitud is None:
+                    estado, respuesta = HTTPStatus.BAD_REQUEST, {'error': "Content-Length inválido"}
+                else:
+                    cuerpo = await lector.readexactly(longitud) if longitud else b''
+                    estado, respuesta = await self._responder_peticion(metodo, ruta.split('?')[0], cuerpo)
+                if isinstance(respuesta, str):
+                    contenido = respuesta.encode('utf-8')
+                    tipo = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    contenido = json.dumps(respuesta, ensure_ascii=False).encode('utf-8')
+                    tipo = "application/json; charset=utf-8"
+                mantener = (version == 'HTTP/1.1' and longitud is not None
+                            and cabeceras.get('connection', '').lower() != 'close')
+                escritor.write(
+                    f"HTTP/1.1 {estado.value} {estado.phrase}\r\n"
+                    f"Content-Type: {tipo}\r\n"
+                    f"Content-Length: {len(contenido)}\r\n"
+                    f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n".encode('latin-1')
+                    + contenido
+                )
+                await escritor.drain()
+                if not mantener:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    def precargar(self, tareas):
+        """
+        Carga los modelos indicados antes de aceptar peticiones
+        """
+        ejemplos = {
+            'zero-shot': {'texto': "hola", 'categorias': ["a", "b"]},
+            'qa': {'pregunta': "¿Qué?", 'contexto': "Esto es una prueba."}
+        }
+        for tarea in tareas:
+            print(f"📥 Precargando {tarea}...")
+            TAREAS[tarea]([ejemplos.get(tarea, {'texto': "hola"})],
+                          Namespace(tamano_lote=1, categorias=None, cache=None))
+
+    async def servir(self):
+        servidor = await asyncio.start_server(self._atender_conexion,
+                                              self.opciones.host, self.opciones.puerto)
+        print(f"🚀 Servidor escuchando en http://{self.opciones.host}:{self.opciones.puerto}")
+        print(f"   Micro-lotes: hasta {self.opciones.max_lote} elementos / "
+              f"{self.opciones.max_espera_ms} ms | Hilos: {self.opciones.hilos}")
+        async with servidor:
+            await servidor.serve_forever()
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Servidor HTTP local de inferencia")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--max-lote', type=int, default=32,
+                        help="Máximo de elementos por micro-lote (default=32)")
+    parser.add_argument('--max-espera-ms', type=float, default=5.0,
+                        help="Espera máxima para completar un micro-lote (default=5)")
+    parser.add_argument('--hilos', type=int, default=2,
+                        help="Hilos de ejecución de modelos (default=2)")
+    parser.add_argument('--modelo', action='append', metavar='TAREA=MODELO',
+                        help="Usar otro modelo (o ruta local) para una tarea")
+    parser.add_argument('--precargar', nargs='*', choices=sorted(TAREAS), default=[],
+                        help="Tareas cuyos modelos se cargan al arrancar")
+    parser.add_argument('--sin-cache', action='store_true',
+                        help="No usar la caché de inferencia")
+    return parser
+
+
+def main(argv=None):
+    opciones = crear_parser().parse_args(argv)
+    configurar_modelos(opciones.modelo)
+
+    print("🤗 SERVIDOR DE INFERENCIA HUGGING FACE")
+    print("=" * 60)
+    servidor = ServidorInferencia(opciones)
+    servidor.precargar(opciones.precargar)
+    try:
+        asyncio.run(servidor.servir())
+    except KeyboardInterrupt:
+        print("\n👋 Servidor detenido")
+    finally:
+        servidor.ejecutor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Identificación de Idioma con N-gramas de Caracteres
+===================================================
+
+Detectar el idioma con papluca/xlm-roberta-base-language-detection exige
+un pase completo de XLM-R incluso para frases triviales. Este módulo
+antepone un identificador de n-gramas de caracteres (1 a 3) con NumPy:
+los n-gramas se codifican con un hash estable en una tabla de pesos
+Naive Bayes, y un texto se puntúa sumando filas de esa tabla, en
+microsegundos. Solo cuando el margen entre los dos idiomas más probables
+es bajo se recurre al transformer.
+
+El prefiltro solo se activa con un perfil entrenado con las predicciones
+del propio transformer sobre textos reales:
+
+    python language_id.py --entrenar mensajes.txt
+
+Una parte de los textos se reserva: sobre ella se mide con
+evaluar_umbrales la concordancia con el transformer de cada umbral de
+margen, y se guarda el menor umbral cuya precisión en los textos que
+resuelven los n-gramas alcanza PRECISION_OBJETIVO. Esa precisión medida es
+el `score` de las respuestas de los n-gramas (la probabilidad de Naive
+Bayes es casi siempre 1.0 y no sirve como confianza). El perfil se guarda
+en .cache_inferencia/perfil_idioma.npz (configurable con HF_PERFIL_IDIOMA).
+
+Sin perfil entrenado (solo el corpus semilla CORPUS_SEMILLA, demasiado
+pequeño para textos reales) todos los textos van al transformer, salvo que
+se indique un umbral_margen explícito. Para comparar umbrales:
+
+    python language_id.py --evaluar mensajes.txt --umbrales 0.05 0.1 0.2
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from lazy_imports import importar_perezoso
+from model_registry import obtener_pipeline
+from batch_scoring import puntuar_por_lotes
+
+np = importar_perezoso("numpy")
+
+MODELO_IDIOMA = "papluca/xlm-roberta-base-language-detection"
+ORDENES_NGRAMA = (1, 2, 3)
+BITS_HASH = 16
+UMBRALES = (0.0, 0.02, 0.05, 0.1, 0.2, 0.3)
+# Precisión mínima (frente al transformer, en textos reservados) de los
+# textos que resuelven los n-gramas con el umbral elegido
+PRECISION_OBJETIVO = 0.99
+FRACCION_VALIDACION = 0.2
+# Con menos textos resueltos la precisión medida no es fiable
+MIN_RESUELTOS_VALIDACION = 50
+# Textos más cortos son ambiguos para los n-gramas y van siempre al modelo
+MIN_CARACTERES = 8
+SUAVIZADO = 0.5
+
+# Frases de ejemplo para los 20 idiomas del modelo de detección. No incluyen
+# las de text_classification.clasificacion_idioma, que sirven de textos no vistos
+CORPUS_SEMILLA = {
+    'ar': ["مرحبا، كيف حالك اليوم؟", "أنا أحب القراءة في المساء", "الطقس جميل جدا في هذه المدينة",
+           "هل يمكنك مساعدتي من فضلك؟"],
+    'bg': ["Здравейте, как сте днес?", "Обичам да чета книги вечер", "Времето в този град е много хубаво",
+           "Можете ли да ми помогнете, моля?",
+           "Вчера не се видяхме, защото трябваше да работя"],
+    'de': ["Der Zug fährt um acht Uhr morgens vom Bahnhof ab", "Ich lese abends gerne Bücher",
+           "Das Wetter in dieser Stadt ist sehr schön", "Können Sie mir bitte helfen?",
+           "Wir haben uns gestern nicht gesehen, weil ich arbeiten musste"],
+    'el': ["Γεια σας, πώς είστε σήμερα;", "Μου αρέσει να διαβάζω βιβλία το βράδυ",
+           "Ο καιρός σε αυτή την πόλη είναι πολύ ωραίος", "Μπορείτε να με βοηθήσετε, παρακαλώ;"],
+    'en': ["The train leaves the station at eight in the morning", "I like to read books in the evening",
+           "The weather in this city is very nice", "Can you help me, please?",
+           "We did not see each other yesterday because I had to work"],
+    'es': ["El tren sale de la estación a las ocho de la mañana", "Me gusta leer libros por la noche",
+           "El tiempo en esta ciudad es muy agradable", "¿Puedes ayudarme, por favor?",
+           "Ayer no nos vimos porque tenía que trabajar"],
+    'fr': ["Le train part de la gare à huit heures du matin", "J'aime lire des livres le soir",
+           "Le temps dans cette ville est très agréable", "Pouvez-vous m'aider, s'il vous plaît?",
+           "Nous ne nous sommes pas vus hier parce que je devais travailler"],
+    'hi': ["नमस्ते, आज आप कैसे हैं?", "मुझे शाम को किताबें पढ़ना पसंद है", "इस शहर का मौसम बहुत अच्छा है",
+           "क्या आप कृपया मेरी मदद कर सकते हैं?"],
+    'it': ["Il treno parte dalla stazione alle otto di mattina", "Mi piace leggere libri la sera",
+           "Il tempo in questa città è molto bello", "Puoi aiutarmi, per favore?",
+           "Ieri non ci siamo visti perché dovevo lavorare"],
+    'ja': ["電車は朝八時に駅を出発します", "私は夜に本を読むのが好きです", "この町の天気はとても良いです",
+           "手伝っていただけますか？"],
+    'nl': ["Hallo, hoe gaat het vandaag met je?", "Ik lees 's avonds graag boeken",
+           "Het weer in deze stad is erg mooi", "Kun je me alsjeblieft helpen?",
+           "We hebben elkaar gisteren niet gezien omdat ik moest werken"],
+    'pl': ["Cześć, jak się dzisiaj masz?", "Lubię czytać książki wieczorem",
+           "Pogoda w tym mieście jest bardzo ładna", "Czy możesz mi pomóc, proszę?",
+           "Wczoraj się nie widzieliśmy, bo musiałem pracować"],
+    'pt': ["Olá, como você está hoje?", "Eu gosto de ler livros à noite",
+           "O tempo nesta cidade é muito agradável", "Você pode me ajudar, por favor?",
+           "Ontem não nos vimos porque eu tinha que trabalhar"],
+    'ru': ["Поезд отходит от станции в восемь утра", "Я люблю читать книги по вечерам",
+           "Погода в этом городе очень хорошая", "Вы можете мне помочь, пожалуйста?",
+           "Мы не виделись вчера, потому что мне нужно было работать", "Спасибо, у меня всё хорошо",
+           "Мой брат живёт в большом городе", "Мы ждали автобус почти час"],
+    'sw': ["Habari, hujambo leo?", "Ninapenda kusoma vitabu jioni", "Hali ya hewa katika mji huu ni nzuri sana",
+           "Unaweza kunisaidia, tafadhali?", "Hatukuonana jana kwa sababu nilikuwa na kazi"],
+    'th': ["สวัสดี วันนี้คุณเป็นอย่างไรบ้าง", "ฉันชอบอ่านหนังสือตอนเย็น", "อากาศในเมืองนี้ดีมาก",
+           "คุณช่วยฉันได้ไหม"],
+    'tr': ["Merhaba, bugün nasılsın?", "Akşamları kitap okumayı severim", "Bu şehirde hava çok güzel",
+           "Bana yardım edebilir misin, lütfen?", "Dün görüşmedik çünkü çalışmam gerekiyordu"],
+    'ur': ["ہیلو، آج آپ کیسے ہیں؟", "مجھے شام کو کتابیں پڑھنا پسند ہے", "اس شہر کا موسم بہت اچھا ہے",
+           "کیا آپ میری مدد کر سکتے ہیں؟"],
+    'vi': ["Xin chào, hôm nay bạn thế nào?", "Tôi thích đọc sách vào buổi tối",
+           "Thời tiết ở thành phố này rất đẹp", "Bạn có thể giúp tôi được không?"],
+    'zh': ["火车早上八点从车站出发", "我喜欢晚上看书", "这个城市的天气很好", "你能帮我一下吗？"]
+}
+
+
+def ruta_perfil_por_defecto():
+    return os.environ.get("HF_PERFIL_IDIOMA", str(Path(".cache_inferencia") / "perfil_idioma.npz"))
+
+
+def _normalizar(texto):
+    return " " + " ".join(texto.lower().split()) + " "
+
+
+def hashes_ngramas(texto, bits=BITS_HASH):
+    """
+    Índices (con hash estable) de los n-gramas de caracteres de `texto`
+    """
+    puntos = np.frombuffer(_normalizar(texto).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    partes = []
+    for n in ORDENES_NGRAMA:
+        cantidad = len(puntos) - n + 1
+        if cantidad <= 0:
+            continue
+        h = np.full(cantidad, n, dtype=np.uint64)
+        for desplazamiento in range(n):
+            h = h * np.uint64(1000003) + puntos[desplazamiento:desplazamiento + cantidad]
+        partes.append(h)
+    if not partes:
+        return np.empty(0, dtype=np.int64)
+    h = np.concatenate(partes)
+    # Mezcla multiplicativa (Fibonacci) para repartir los índices
+    return ((h * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(64 - bits)).astype(np.int64)
+
+
+class IdentificadorNgramas:
+    """
+    Naive Bayes multinomial sobre n-gramas de caracteres con hash
+    """
+
+    def __init__(self, idiomas, pesos, bits=BITS_HASH, umbral_margen=None, precision=None):
+        self.idiomas = list(idiomas)
+        # (buckets, idiomas): sumar filas contiguas es más rápido que columnas
+        self.pesos = pesos
+        self.bits = bits
+        # Umbral validado en textos reservados y precisión medida con él
+        # (None si el perfil no se ha validado)
+        self.umbral_margen = umbral_margen
+        self.precision = precision
+
+    @classmethod
+    def entrenar(cls, textos, etiquetas, bits=BITS_HASH, suavizado=SUAVIZADO):
+        """
+        Estima los log-probabilidades de cada n-grama por idioma
+        """
+        idiomas = sorted(set(etiquetas))
+        columna = {idioma: i for i, idioma in enumerate(idiomas)}
+        conteos = np.zeros((1 << bits, len(idiomas)), dtype=np.float64)
+        for texto, etiqueta in zip(textos, etiquetas):
+            np.add.at(conteos[:, columna[etiqueta]], hashes_ngramas(texto, bits), 1)
+        totales = conteos.sum(axis=0, keepdims=True)
+        pesos = np.log((conteos + suavizado) / (totales + suavizado * conteos.shape[0]))
+        return cls(idiomas, pesos.astype(np.float32), bits)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as datos:
+            validado = 'umbral_margen' in datos.files
+            return cls([str(i) for i in datos['idiomas']], datos['pesos'], int(datos['bits']),
+                       float(datos['umbral_margen']) if validado else None,
+                       float(datos['precision']) if validado else None)
+
+    def guardar(self, ruta):
+        Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+        temporal = f"{ruta}.tmp.npz"
+        validacion = {}
+        if self.umbral_margen is not None:
+            validacion = {'umbral_margen': np.array(self.umbral_margen), 'precision': np.array(self.precision)}
+        np.savez_compressed(temporal, idiomas=np.array(self.idiomas), pesos=self.pesos,
+                            bits=np.array(self.bits), **validacion)
+        os.replace(temporal, ruta)
+
+    def puntuar(self, texto):
+        """
+        Devuelve (idioma, probabilidad, margen).
+
+        El margen es la diferencia de log-verosimilitud entre los dos
+        idiomas más probables dividida por el número de n-gramas, así que
+        no crece con la longitud del texto.
+        """
+        indices = hashes_ngramas(texto, self.bits)
+        if len(indices) == 0:
+            return None, 0.0, 0.0
+        puntuaciones = self.pesos[indices].sum(axis=0)
+        orden = np.argsort(puntuaciones)[::-1]
+        mejor = puntuaciones[orden[0]]
+        segundo = puntuaciones[orden[1]] if len(orden) > 1 else mejor - len(indices)
+        probabilidades = np.exp(puntuaciones - mejor)
+        return (self.idiomas[orden[0]], float(1.0 / probabilidades.sum()),
+                float((mejor - segundo) / len(indices)))
+
+
+class DetectorIdioma:
+    """
+    Identificador de n-gramas con el transformer como respaldo.
+
+    Sin `umbral_margen` se usa el validado del perfil; si el perfil no está
+    validado (solo corpus semilla) los n-gramas no resuelven ningún texto.
+    """
+
+    def __init__(self, identificador=None, modelo=MODELO_IDIOMA, umbral_margen=None,
+                 min_caracteres=MIN_CARACTERES):
+        self.identificador = identificador or cargar_identificador()
+        self.modelo = modelo
+        if umbral_margen is None:
+            umbral_margen = self.identificador.umbral_margen
+        self.umbral_margen = umbral_margen
+        self.min_caracteres = min_caracteres
+        self._lock = threading.Lock()
+        self._contadores = {'textos': 0, 'ngramas': 0, 'modelo': 0, 'segundos_ngramas': 0.0}
+
+    def detectar(self, textos, cache=None, max_tamano_lote=64):
+        """
+        Detecta el idioma de `textos`.
+
+        Devuelve [{'label', 'score', 'fuente'}] con fuente 'ngramas' o
+        'modelo' (cuando el margen de los n-gramas es bajo). El score de
+        los n-gramas es la precisión medida al validar el perfil (None si
+        no se validó).
+        """
+        textos = list(textos)
+        resultados = [None] * len(textos)
+        dudosos = []
+
+        inicio = time.perf_counter()
+        for indice, texto in enumerate(textos):
+            if self.umbral_margen is None:
+                dudosos.append(indice)
+                continue
+            idioma, _, margen = self.identificador.puntuar(texto)
+            if idioma is None or margen < self.umbral_margen or len(texto.strip()) < self.min_caracteres:
+                dudosos.append(indice)
+            else:
+                resultados[indice] = {'label': idioma, 'score': self.identificador.precision,
+                                      'fuente': 'ngramas'}
+        segundos_ngramas = time.perf_counter() - inicio
+
+        if dudosos:
+            clasificador = obtener_pipeline("text-classification", self.modelo)
+            predicciones, _ = puntuar_por_lotes(clasificador, [textos[i] for i in dudosos],
+                                                max_tamano_lote=max_tamano_lote, cache=cache)
+            for indice, prediccion in zip(dudosos, predicciones):
+                resultados[indice] = dict(prediccion[0], fuente='modelo')
+
+        with self._lock:
+            self._contadores['textos'] += len(textos)
+            self._contadores['ngramas'] += len(textos) - len(dudosos)
+            self._contadores['modelo'] += len(dudosos)
+            self._contadores['segundos_ngramas'] += segundos_ngramas
+        return resultados
+
+    def estadisticas(self):
+        """
+        Devuelve cuántos textos resolvió cada etapa y el coste de los n-gramas
+        """
+        with self._lock:
+            estadisticas = dict(self._contadores)
+        textos = estadisticas['textos']
+        estadisticas['fraccion_modelo'] = estadisticas['modelo'] / textos if textos else 0.0
+        estadisticas['us_por_texto_ngramas'] = (estadisticas['segundos_ngramas'] / textos * 1e6
+                                                if textos else 0.0)
+        return estadisticas
+
+
+def entrenar_desde_modelo(textos, modelo=MODELO_IDIOMA, min_confianza=0.9, incluir_semilla=True,
+                          fraccion_validacion=FRACCION_VALIDACION, umbrales=UMBRALES,
+                          precision_objetivo=PRECISION_OBJETIVO):
+    """
+    Entrena un identificador con las predicciones del transformer y elige
+    su umbral de margen en textos reservados.
+
+    Para entrenar solo se usan los textos que el modelo clasifica con al
+    menos `min_confianza`; el corpus semilla garantiza que todos los
+    idiomas tengan algún ejemplo. Una fracción `fraccion_validacion` de los
+    textos no se usa para entrenar y sirve para elegir el umbral
+    (elegir_umbral). Devuelve (identificador, filas de la validación).
+    """
+    textos = list(textos)
+    clasificador = obtener_pipeline("text-classification", modelo)
+    predicciones, _ = puntuar_por_lotes(clasificador, textos)
+    paso = max(2, round(1 / fraccion_validacion)) if fraccion_validacion else 0
+    reservados = set(range(0, len(textos), paso)) if paso else set()
+
+    pares = [(texto, prediccion[0]['label'])
+             for indice, (texto, prediccion) in enumerate(zip(textos, predicciones))
+             if indice not in reservados and prediccion[0]['score'] >= min_confianza]
+    if incluir_semilla:
+        pares += [(texto, idioma) for idioma, frases in CORPUS_SEMILLA.items() for texto in frases]
+    identificador = IdentificadorNgramas.entrenar([texto for texto, _ in pares], [idioma for _, idioma in pares])
+
+    filas = []
+    if reservados:
+        validacion = sorted(reservados)
+        filas = _filas_umbrales(identificador, [textos[i] for i in validacion],
+                                [predicciones[i][0]['label'] for i in validacion], umbrales)
+        identificador.umbral_margen, identificador.precision = elegir_umbral(filas, precision_objetivo)
+    return identificador, filas
+
+
+def elegir_umbral(filas, precision_objetivo=PRECISION_OBJETIVO, min_resueltos=MIN_RESUELTOS_VALIDACION):
+    """
+    Menor umbral de margen cuyos textos resueltos por los n-gramas (al
+    menos `min_resueltos`) coinciden con el transformer en una fracción
+    `precision_objetivo`. Devuelve (umbral, precisión) o (None, None).
+    """
+    for fila in sorted(filas, key=lambda fila: fila['umbral_margen']):
+        if fila['resueltos_ngramas'] >= min_resueltos and fila['precision_ngramas'] >= precision_objetivo:
+            return fila['umbral_margen'], fila['precision_ngramas']
+    return None, None
+
+
+def cargar_identificador(ruta=None):
+    """
+    Carga el perfil guardado o, si no existe, lo crea con el corpus semilla
+    (sin validar: DetectorIdioma no lo usa salvo con un umbral explícito)
+    """
+    ruta = ruta or ruta_perfil_por_defecto()
+    if Path(ruta).exists():
+        return IdentificadorNgramas.cargar(ruta)
+    pares = [(texto, idioma) for idioma, frases in CORPUS_SEMILLA.items() for texto in frases]
+    return IdentificadorNgramas.entrenar([texto for texto, _ in pares], [idioma for _, idioma in pares])
+
+
+_detectores = {}
+_lock_detectores = threading.Lock()
+
+
+def obtener_detector(modelo=MODELO_IDIOMA):
+    """
+    Devuelve el detector compartido del proceso para el transformer `modelo`
+    """
+    with _lock_detectores:
+        detector = _detectores.get(modelo)
+        if detector is None:
+            detector = _detectores[modelo] = DetectorIdioma(modelo=modelo)
+        return detector
+
+
+def _filas_umbrales(identificador, textos, referencia, umbrales, puntuaciones=None):
+    """
+    Para cada umbral de margen: fracción enviada al modelo, concordancia
+    final con el modelo y precisión de los textos que resuelven los n-gramas
+    """
+    if puntuaciones is None:
+        puntuaciones = [identificador.puntuar(texto) for texto in textos]
+    filas = []
+    for umbral in umbrales:
+        al_modelo = [idioma is None or margen < umbral or len(texto.strip()) < MIN_CARACTERES
+                     for texto, (idioma, _, margen) in zip(textos, puntuaciones)]
+        finales = [ref if escalado else idioma
+                   for (idioma, _, _), ref, escalado in zip(puntuaciones, referencia, al_modelo)]
+        resueltos = [idioma == ref for (idioma, _, _), ref, escalado in zip(puntuaciones, referencia, al_modelo)
+                     if not escalado]
+        filas.append({
+            'umbral_margen': umbral,
+            'fraccion_modelo': sum(al_modelo) / len(textos),
+            'concordancia': sum(f == r for f, r in zip(finales, referencia)) / len(textos),
+            'resueltos_ngramas': len(resueltos),
+            'precision_ngramas': sum(resueltos) / len(resueltos) if resueltos else 0.0
+        })
+    return filas
+
+
+def evaluar_umbrales(identificador, textos, modelo=MODELO_IDIOMA, umbrales=UMBRALES):
+    """
+    Compara los n-gramas con el transformer para cada umbral de margen:
+    fracción enviada al modelo, concordancia final con el modelo y
+    precisión de los n-gramas en los textos que resuelven
+    """
+    clasificador = obtener_pipeline("text-classification", modelo)
+    predicciones, estadisticas = puntuar_por_lotes(clasificador, textos)
+    referencia = [prediccion[0]['label'] for prediccion in predicciones]
+
+    inicio = time.perf_counter()
+    puntuaciones = [identificador.puntuar(texto) for texto in textos]
+    us_por_texto = (time.perf_counter() - inicio) / len(textos) * 1e6
+
+    filas = _filas_umbrales(identificador, textos, referencia, umbrales, puntuaciones)
+    return {'textos': len(textos), 'us_por_texto_ngramas': us_por_texto,
+            'ms_por_texto_modelo': estadisticas['segundos'] / len(textos) * 1000, 'umbrales': filas}
+
+
+def _leer_textos(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        return [linea.strip() for linea in f if linea.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Identificador de idioma por n-gramas")
+    parser.add_argument('--entrenar', metavar='ARCHIVO',
+                        help="Textos (uno por línea) a etiquetar con el transformer para entrenar el perfil")
+    parser.add_argument('--evaluar', metavar='ARCHIVO',
+                        help="Textos (uno por línea) para comparar n-gramas y transformer")
+    parser.add_argument('--umbrales', type=float, nargs='*', default=list(UMBRALES))
+    parser.add_argument('--min-confianza', type=float, default=0.9)
+    parser.add_argument('--precision-objetivo', type=float, default=PRECISION_OBJETIVO,
+                        help="Precisión mínima de los n-gramas en los textos reservados al elegir el umbral")
+    parser.add_argument('--perfil', default=ruta_perfil_por_defecto())
+    parser.add_argument('--modelo', default=MODELO_IDIOMA)
+    parser.add_argument('--json', help="Guardar la evaluación en un archivo JSON")
+    opciones = parser.parse_args(argv)
+
+    print("🌍 IDENTIFICADOR DE IDIOMA POR N-GRAMAS")
+    print("=" * 60)
+
+    if opciones.entrenar:
+        textos = _leer_textos(opciones.entrenar)
+        print(f"🏋️  Etiquetando {len(textos)} textos con {opciones.modelo}...")
+        identificador, _ = entrenar_desde_modelo(textos, opciones.modelo, opciones.min_confianza,
+                                                 umbrales=opciones.umbrales,
+                                                 precision_objetivo=opciones.precision_objetivo)
+        identificador.guardar(opciones.perfil)
+        print(f"💾 Perfil con {len(identificador.idiomas)} idiomas guardado en {opciones.perfil}")
+        if identificador.umbral_margen is None:
+            print(f"⚠️  Ningún umbral alcanza {opciones.precision_objetivo * 100:.1f}% de precisión en los "
+                  f"textos reservados: todos los textos irán al transformer")
+        else:
+            print(f"🎯 Umbral de margen {identificador.umbral_margen:.2f} "
+                  f"(precisión de los n-gramas en textos reservados: {identificador.precision * 100:.1f}%)")
+    else:
+        identificador = cargar_identificador(opciones.perfil)
+
+    if opciones.evaluar:
+        informe = evaluar_umbrales(identificador, _leer_textos(opciones.evaluar),
+                                   opciones.modelo, opciones.umbrales)
+        print(f"\n⚡ N-gramas: {informe['us_por_texto_ngramas']:.0f} µs/texto | "
+              f"transformer: {informe['ms_por_texto_modelo']:.1f} ms/texto")
+        for fila in informe['umbrales']:
+            print(f"   margen ≥ {fila['umbral_margen']:.2f}: {fila['fraccion_modelo'] * 100:5.1f}% al modelo | "
+                  f"concordancia {fila['concordancia'] * 100:5.1f}% | "
+                  f"precisión n-gramas {fila['precision_ngramas'] * 100:5.1f}%")
+        if opciones.json:
+            with open(opciones.json, 'w', encoding='utf-8') as f:
+                json.dump(informe, f, indent=2, ensure_ascii=False)
+            print(f"\n💾 Evaluación guardada en {opciones.json}")
+
+
+if __name__ == "__main__":
+    main()
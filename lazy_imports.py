@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Importaciones Perezosas
+=======================
+
+Permite declarar dependencias pesadas (torch, transformers, matplotlib,
+pandas...) al principio de un módulo sin pagar su coste de importación
+hasta que realmente se usan:
+
+    torch = importar_perezoso("torch")
+    plt = importar_perezoso("matplotlib.pyplot")
+
+El módulo real se importa la primera vez que se accede a uno de sus
+atributos. Para medir el tiempo de arranque ver startup_benchmark.py.
+"""
+
+import importlib
+import sys
+import types
+
+
+class ModuloPerezoso(types.ModuleType):
+    """
+    Módulo que se importa de verdad en el primer acceso a un atributo
+    """
+
+    def __init__(self, nombre):
+        super().__init__(nombre)
+        self.__dict__['_modulo'] = None
+
+    def _cargar(self):
+        modulo = self.__dict__['_modulo']
+        if modulo is None:
+            modulo = importlib.import_module(self.__name__)
+            self.__dict__['_modulo'] = modulo
+        return modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._cargar(), atributo)
+
+    def __dir__(self):
+        return dir(self._cargar())
+
+    def __repr__(self):
+        estado = "cargado" if self.__dict__['_modulo'] is not None else "sin cargar"
+        return f"<módulo perezoso '{self.__name__}' ({estado})>"
+
+
+def importar_perezoso(nombre):
+    """
+    Devuelve el módulo si ya está importado o un proxy perezoso si no
+    """
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    return ModuloPerezoso(nombre)
+
+
+def esta_cargado(modulo):
+    """
+    Indica si un módulo (o proxy perezoso) ya se ha importado de verdad
+    """
+    if isinstance(modulo, ModuloPerezoso):
+        return modulo.__dict__['_modulo'] is not None
+    return True
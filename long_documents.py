@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Clasificación de Documentos Largos por Ventanas
+===============================================
+
+Los clasificadores de los ejemplos solo ven los primeros 512 tokens (o
+menos) de cada texto: el resto se trunca sin aviso. Para transcripciones o
+documentos largos este módulo divide cada texto en ventanas de tokens
+solapadas, clasifica las ventanas de todos los documentos juntas en lotes
+agrupados por longitud y combina las distribuciones de cada ventana en
+una sola por documento.
+
+Agregaciones disponibles:
+    media      promedio de las distribuciones de las ventanas
+    ponderada  promedio ponderado por el número de tokens de cada ventana
+    maximo     máximo por etiqueta (renormalizado): una emoción fuerte en
+               un tramo del documento no se diluye en el resto
+"""
+
+import time
+
+import metrics
+from lazy_imports import importar_perezoso
+from batch_scoring import _crear_lotes, _normalizar_scores
+
+torch = importar_perezoso("torch")
+
+AGREGACIONES = ('media', 'ponderada', 'maximo')
+
+
+def crear_ventanas(tokenizer, textos, longitud_ventana=None, solapamiento=64):
+    """
+    Divide los textos en ventanas de tokens solapadas.
+
+    Devuelve (ventanas, documento_de_ventana, tokens_por_ventana): los
+    input_ids de cada ventana ya con los tokens especiales, el índice del
+    documento al que pertenece y sus tokens de contenido. Usa el
+    desbordamiento (overflow) del tokenizer rápido con `stride`.
+    """
+    if longitud_ventana is None:
+        longitud_ventana = min(tokenizer.model_max_length, 512)
+    contenido = longitud_ventana - tokenizer.num_special_tokens_to_add()
+    if not 0 <= solapamiento < contenido:
+        raise ValueError(f"El solapamiento debe estar entre 0 y {contenido - 1} tokens")
+
+    codificados = tokenizer(list(textos), truncation=True, max_length=longitud_ventana,
+                            stride=solapamiento, return_overflowing_tokens=True,
+                            return_special_tokens_mask=True)
+    tokens = [max(len(mascara) - sum(mascara), 1) for mascara in codificados['special_tokens_mask']]
+    return codificados['input_ids'], list(codificados['overflow_to_sample_mapping']), tokens
+
+
+def agregar_distribuciones(distribuciones, pesos, agregacion='media'):
+    """
+    Combina las distribuciones (ventanas × etiquetas) de un documento
+    """
+    if agregacion == 'media':
+        return distribuciones.mean(dim=0)
+    if agregacion == 'ponderada':
+        pesos = torch.tensor(pesos, dtype=distribuciones.dtype)
+        return (distribuciones * pesos.unsqueeze(1)).sum(dim=0) / pesos.sum()
+    if agregacion == 'maximo':
+        maximos = distribuciones.max(dim=0).values
+        return maximos / maximos.sum()
+    raise ValueError(f"Agregación desconocida: {agregacion} (opciones: {', '.join(AGREGACIONES)})")
+
+
+def _clasificar_documentos(clasificador, textos, longitud_ventana, solapamiento, agregacion,
+                           max_tokens_por_lote, max_tamano_lote, top_k, contadores):
+    if not textos:
+        return []
+    tokenizer = clasificador.tokenizer
+    modelo = clasificador.model
+    device = modelo.device
+    id2label = modelo.config.id2label
+    tarea = getattr(clasificador, 'task', "text-classification")
+    model_id = modelo.config.name_or_path
+
+    inicio = time.perf_counter()
+    ventanas, documentos, tokens = crear_ventanas(tokenizer, textos, longitud_ventana, solapamiento)
+    metrics.registrar_etapa(tarea, model_id, "tokenizacion", time.perf_counter() - inicio)
+
+    # Las ventanas de todos los documentos comparten lotes
+    longitudes = [len(ids) for ids in ventanas]
+    distribuciones = torch.empty(len(ventanas), modelo.config.num_labels)
+    modelo.eval()
+    with torch.inference_mode():
+        for lote in _crear_lotes(longitudes, max_tokens_por_lote, max_tamano_lote):
+            entradas = tokenizer.pad([{'input_ids': ventanas[i]} for i in lote], return_tensors="pt")
+            entradas = {clave: valor.to(device) for clave, valor in entradas.items()}
+
+            contadores['lotes'] += 1
+            contadores['tokens_reales'] += sum(longitudes[i] for i in lote)
+            contadores['tokens_con_padding'] += entradas['input_ids'].numel()
+
+            inicio = time.perf_counter()
+            logits = modelo(**entradas).logits.float().cpu()
+            tamano_lote, longitud = entradas['input_ids'].shape
+            metrics.registrar_forward(tarea, model_id, time.perf_counter() - inicio,
+                                      tamano_lote, longitud)
+            distribuciones[lote] = _normalizar_scores(logits, modelo.config)
+    contadores['ventanas'] += len(ventanas)
+
+    inicio = time.perf_counter()
+    # Las ventanas de cada documento son consecutivas
+    cuentas = torch.bincount(torch.tensor(documentos, dtype=torch.long), minlength=len(textos)).tolist()
+    resultados = []
+    inicio_documento = 0
+    for cuenta in cuentas:
+        fin = inicio_documento + cuenta
+        distribucion = agregar_distribuciones(distribuciones[inicio_documento:fin],
+                                              tokens[inicio_documento:fin], agregacion)
+        inicio_documento = fin
+        k = min(top_k, distribucion.shape[-1])
+        valores, etiquetas = distribucion.topk(k)
+        resultados.append({
+            'etiquetas': [{'label': id2label[int(etiqueta)], 'score': float(valor)}
+                          for valor, etiqueta in zip(valores.tolist(), etiquetas.tolist())],
+            'ventanas': cuenta
+        })
+    metrics.registrar_etapa(tarea, model_id, "postproceso", time.perf_counter() - inicio)
+    return resultados
+
+
+def clasificar_documentos_largos(clasificador, textos, longitud_ventana=None, solapamiento=64,
+                                 agregacion='media', max_tokens_por_lote=8192, max_tamano_lote=64,
+                                 top_k=None, cache=None):
+    """
+    Clasifica documentos de cualquier longitud con ventanas solapadas.
+
+    `clasificador` es un pipeline de clasificación de texto. Devuelve
+    (resultados, estadisticas): cada resultado es {'etiquetas': [{'label',
+    'score'}, ...], 'ventanas': n} con las `top_k` etiquetas (todas por
+    defecto) de la distribución agregada del documento.
+    """
+    if agregacion not in AGREGACIONES:
+        raise ValueError(f"Agregación desconocida: {agregacion} (opciones: {', '.join(AGREGACIONES)})")
+    textos = list(textos)
+    top_k = top_k or clasificador.model.config.num_labels
+    contadores = {'lotes': 0, 'ventanas': 0, 'tokens_reales': 0, 'tokens_con_padding': 0, 'calculados': 0}
+    inicio = time.perf_counter()
+
+    def calcular(pendientes):
+        contadores['calculados'] += len(pendientes)
+        return _clasificar_documentos(clasificador, pendientes, longitud_ventana, solapamiento,
+                                      agregacion, max_tokens_por_lote, max_tamano_lote, top_k,
+                                      contadores)
+
+    if cache is not None:
+        resultados = cache.obtener_o_calcular_lote(
+            "text-classification-ventanas", clasificador, textos, calcular,
+            parametros={'longitud_ventana': longitud_ventana, 'solapamiento': solapamiento,
+                        'agregacion': agregacion, 'top_k': top_k}
+        )
+    else:
+        resultados = calcular(textos)
+
+    segundos = time.perf_counter() - inicio
+    tokens_con_padding = contadores['tokens_con_padding']
+    estadisticas = {
+        'documentos': len(textos),
+        'aciertos_cache': len(textos) - contadores['calculados'],
+        'ventanas': contadores['ventanas'],
+        'lotes': contadores['lotes'],
+        'tokens_reales': contadores['tokens_reales'],
+        'tokens_con_padding': tokens_con_padding,
+        'desperdicio_padding': (1 - contadores['tokens_reales'] / tokens_con_padding
+                                if tokens_con_padding else 0.0),
+        'segundos': segundos,
+        'documentos_por_segundo': len(textos) / segundos if segundos > 0 else 0.0
+    }
+    return resultados, estadisticas
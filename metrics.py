@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Instrumentación de Latencia por Etapas
+======================================
+
+Este módulo mide cada llamada a los pipelines del proyecto separando las
+etapas de tokenización (preprocess), pase del modelo (forward) y
+postproceso, además del tamaño de lote, la longitud de secuencia y los
+tokens por segundo. Las medidas se acumulan en histogramas que se exportan
+en el formato de texto de Prometheus.
+
+Todos los pipelines obtenidos desde model_registry se instrumentan
+automáticamente. Las métricas pueden leerse:
+  - en el endpoint GET /metricas de inference_server.py
+  - en el archivo indicado por HF_METRICAS_ARCHIVO (se escribe al salir)
+  - con exportar_prometheus() / guardar_prometheus(ruta)
+"""
+
+import atexit
+import functools
+import inspect
+import os
+import threading
+import time
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_LOTE = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+BUCKETS_LONGITUD = (8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+BUCKETS_TOKENS_POR_SEGUNDO = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000)
+BUCKETS_FRACCION = (0.0, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_le(limite):
+    return "+Inf" if limite == float("inf") else repr(float(limite))
+
+
+class Histograma:
+    """
+    Histograma acumulativo con etiquetas, al estilo de Prometheus
+    """
+
+    def __init__(self, nombre, ayuda, buckets, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(str(etiquetas.get(nombre, "")) for nombre in self.etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = {'buckets': [0] * len(self.buckets), 'suma': 0.0, 'cuenta': 0}
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie['buckets'][i] += 1
+            serie['suma'] += valor
+            serie['cuenta'] += 1
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            for clave, serie in sorted(self._series.items()):
+                base = ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(self.etiquetas, clave))
+                separador = "," if base else ""
+                for limite, cuenta in zip(self.buckets, serie['buckets']):
+                    lineas.append(f'{self.nombre}_bucket{{{base}{separador}le="{_formatear_le(limite)}"}} {cuenta}')
+                etiquetas = f"{{{base}}}" if base else ""
+                lineas.append(f"{self.nombre}_sum{etiquetas} {serie['suma']}")
+                lineas.append(f"{self.nombre}_count{etiquetas} {serie['cuenta']}")
+        return lineas
+
+    def resumen(self):
+        """
+        Devuelve {etiquetas: (cuenta, media)} para mostrar por consola
+        """
+        with self._lock:
+            return {clave: (serie['cuenta'], serie['suma'] / serie['cuenta'] if serie['cuenta'] else 0.0)
+                    for clave, serie in self._series.items()}
+
+
+ETAPAS = Histograma(
+    "hf_pipeline_etapa_segundos",
+    "Duración de cada etapa de un pipeline (tokenizacion, forward, postproceso)",
+    BUCKETS_SEGUNDOS, ("tarea", "modelo", "etapa")
+)
+TAMANO_LOTE = Histograma(
+    "hf_pipeline_tamano_lote", "Número de secuencias por pase del modelo",
+    BUCKETS_LOTE, ("tarea", "modelo")
+)
+LONGITUD_SECUENCIA = Histograma(
+    "hf_pipeline_longitud_secuencia", "Longitud (con padding) de las secuencias de entrada",
+    BUCKETS_LONGITUD, ("tarea", "modelo")
+)
+TOKENS_POR_SEGUNDO = Histograma(
+    "hf_pipeline_tokens_por_segundo", "Tokens procesados por segundo en el forward (nuevos en generación)",
+    BUCKETS_TOKENS_POR_SEGUNDO, ("tarea", "modelo")
+)
+DEDUPLICACION = Histograma(
+    "hf_deduplicacion_ratio",
+    "Fracción de textos de cada lote resueltos sin inferencia por ser duplicados o casi duplicados",
+    BUCKETS_FRACCION, ("tarea",)
+)
+PREFIJO_REUTILIZADO = Histograma(
+    "hf_prefijo_reutilizado_ratio",
+    "Fracción de los tokens de cada prompt tomados de la caché de prefijos en lugar de recalcularse",
+    BUCKETS_FRACCION, ("modelo",)
+)
+TTFT = Histograma(
+    "hf_generacion_ttft_segundos",
+    "Tiempo hasta el primer token generado en streaming (incluye el prefill del prompt)",
+    BUCKETS_SEGUNDOS, ("modelo",)
+)
+ENTRE_TOKENS = Histograma(
+    "hf_generacion_entre_tokens_segundos",
+    "Latencia entre tokens consecutivos generados en streaming",
+    BUCKETS_SEGUNDOS, ("modelo",)
+)
+HISTOGRAMAS = [ETAPAS, TAMANO_LOTE, LONGITUD_SECUENCIA, TOKENS_POR_SEGUNDO, DEDUPLICACION,
+               PREFIJO_REUTILIZADO, TTFT, ENTRE_TOKENS]
+
+
+def registrar_etapa(tarea, modelo, etapa, segundos):
+    ETAPAS.observar(segundos, tarea=tarea, modelo=modelo, etapa=etapa)
+
+
+def registrar_forward(tarea, modelo, segundos, tamano_lote, longitud, tokens=None):
+    """
+    Registra un pase del modelo con su forma de entrada.
+
+    `tokens` permite indicar los tokens procesados cuando no coinciden con
+    tamano_lote × longitud (por ejemplo, los tokens nuevos en generación).
+    """
+    registrar_etapa(tarea, modelo, "forward", segundos)
+    if tamano_lote:
+        TAMANO_LOTE.observar(tamano_lote, tarea=tarea, modelo=modelo)
+        LONGITUD_SECUENCIA.observar(longitud, tarea=tarea, modelo=modelo)
+        if tokens is None:
+            tokens = tamano_lote * longitud
+        if segundos > 0:
+            TOKENS_POR_SEGUNDO.observar(tokens / segundos, tarea=tarea, modelo=modelo)
+
+
+def registrar_deduplicacion(tarea, textos, representantes):
+    """
+    Registra cuántos de `textos` se resolvieron con `representantes` inferencias
+    """
+    if textos:
+        DEDUPLICACION.observar(1 - representantes / textos, tarea=tarea)
+
+
+def registrar_prefijo(modelo, reutilizados, tokens):
+    """
+    Registra cuántos de los `tokens` de un prefijo salieron de la caché
+    """
+    if tokens:
+        PREFIJO_REUTILIZADO.observar(reutilizados / tokens, modelo=modelo)
+
+
+def registrar_streaming(modelo, ttft, entre_tokens):
+    """
+    Registra el tiempo hasta el primer token y las latencias entre tokens
+    """
+    if ttft is not None:
+        TTFT.observar(ttft, modelo=modelo)
+    for latencia in entre_tokens:
+        ENTRE_TOKENS.observar(latencia, modelo=modelo)
+
+
+def _forma_entrada(entradas):
+    """
+    Devuelve (tamano_lote, longitud) a partir de las entradas del modelo
+    """
+    try:
+        ids = entradas['input_ids']
+    except (KeyError, TypeError, IndexError):
+        return 0, 0
+    if hasattr(ids, 'shape') and len(ids.shape) == 2:
+        return int(ids.shape[0]), int(ids.shape[1])
+    return 0, 0
+
+
+def _tokens_generados(salida, tamano_lote, longitud):
+    """
+    Cuenta los tokens nuevos de un forward de generación, si los hay
+    """
+    try:
+        secuencias = salida['generated_sequence']
+    except (KeyError, TypeError, IndexError):
+        return None
+    if not hasattr(secuencias, 'shape') or not tamano_lote:
+        return None
+    filas = secuencias.numel() // secuencias.shape[-1]
+    return filas * max(int(secuencias.shape[-1]) - longitud, 0)
+
+
+def _registrar_forward_pipeline(tarea, modelo, args, segundos, salida=None):
+    tamano_lote, longitud = _forma_entrada(args[0] if args else None)
+    tokens = _tokens_generados(salida, tamano_lote, longitud)
+    registrar_forward(tarea, modelo, segundos, tamano_lote, longitud, tokens)
+
+
+def _temporizar_generador(generador, acumular):
+    """
+    Recorre un generador acumulando el tiempo pasado dentro de él
+    """
+    while True:
+        inicio = time.perf_counter()
+        try:
+            elemento = next(generador)
+        except StopIteration:
+            acumular(time.perf_counter() - inicio)
+            return
+        acumular(time.perf_counter() - inicio)
+        yield elemento
+
+
+def _envolver(objeto, atributo, medir):
+    original = getattr(objeto, atributo)
+
+    @functools.wraps(original)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = original(*args, **kwargs)
+        segundos = time.perf_counter() - inicio
+        if inspect.isgenerator(resultado):
+            return _temporizar_generador(resultado, lambda s: medir(args, s))
+        medir(args, segundos, resultado)
+        return resultado
+
+    setattr(objeto, atributo, envoltura)
+
+
+def instrumentar(pipe, tarea, modelo):
+    """
+    Instrumenta un pipeline de transformers o diffusers (una sola vez)
+    """
+    if getattr(pipe, '_instrumentado', False):
+        return pipe
+
+    if all(hasattr(pipe, nombre) for nombre in ('preprocess', 'forward', 'postprocess')):
+        # Pipeline de transformers
+        _envolver(pipe, 'preprocess',
+                  lambda args, s, *_: registrar_etapa(tarea, modelo, "tokenizacion", s))
+        _envolver(pipe, 'forward',
+                  lambda args, s, *salida: _registrar_forward_pipeline(tarea, modelo, args, s, *salida))
+        _envolver(pipe, 'postprocess',
+                  lambda args, s, *_: registrar_etapa(tarea, modelo, "postproceso", s))
+    else:
+        # Pipeline de diffusers: codificación del prompt, pasos de difusión y VAE
+        codificar = 'encode_prompt' if hasattr(pipe, 'encode_prompt') else '_encode_prompt'
+        etapas = [
+            (pipe, codificar, "codificacion_texto"),
+            (getattr(pipe, 'unet', None), 'forward', "paso_difusion"),
+            (getattr(pipe, 'vae', None), 'decode', "decodificacion_vae")
+        ]
+        for objeto, atributo, etapa in etapas:
+            if objeto is not None and hasattr(objeto, atributo):
+                _envolver(objeto, atributo,
+                          lambda args, s, *_, etapa=etapa: registrar_etapa(tarea, modelo, etapa, s))
+
+    try:
+        pipe._instrumentado = True
+    except AttributeError:
+        pass
+    return pipe
+
+
+def exportar_prometheus():
+    """
+    Devuelve todas las métricas en formato de texto de Prometheus
+    """
+    lineas = []
+    for histograma in HISTOGRAMAS:
+        lineas.extend(histograma.exportar())
+    return "\n".join(lineas) + "\n"
+
+
+def guardar_prometheus(ruta):
+    """
+    Escribe las métricas en `ruta` de forma atómica (para node_exporter)
+    """
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(exportar_prometheus())
+    os.replace(temporal, ruta)
+
+
+def mostrar_resumen():
+    """
+    Imprime la duración media de cada etapa por modelo
+    """
+    resumen = ETAPAS.resumen()
+    if not resumen:
+        return
+    print("\n⏱️  Latencia media por etapa:")
+    for (tarea, modelo, etapa), (cuenta, media) in sorted(resumen.items()):
+        print(f"   {modelo} [{etapa}]: {media * 1000:.1f} ms ({cuenta} llamadas)")
+
+
+def _guardar_al_salir():
+    ruta = os.environ.get("HF_METRICAS_ARCHIVO")
+    if ruta and any(h.resumen() for h in HISTOGRAMAS):
+        guardar_prometheus(ruta)
+
+
+atexit.register(_guardar_al_salir)
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Registro Compartido de Modelos
+==============================
+
+Este módulo mantiene en memoria los pipelines ya cargados para que todos los
+ejemplos los reutilicen en lugar de descargarlos y construirlos de nuevo en
+cada función. Los modelos se indexan por tarea, modelo, dtype y dispositivo,
+y cuando la memoria de los pesos registrados supera un presupuesto
+configurable se descartan los menos usados recientemente (LRU).
+
+El presupuesto se configura con la variable de entorno HF_PRESUPUESTO_RSS_MB
+(0 o sin definir = sin límite). Se compara con el tamaño de los pesos de
+cada modelo, no con el RSS del proceso: el RSS incluye las cachés y las
+referencias de quien llama, y no siempre baja al liberar un modelo.
+
+Las cargas se hacen fuera del lock del registro: mientras un hilo carga un
+modelo, los demás siguen obteniendo los que ya están en memoria, y quien
+pide el mismo modelo espera a esa carga en lugar de repetirla.
+"""
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from lazy_imports import importar_perezoso
+
+transformers = importar_perezoso("transformers")
+torch = importar_perezoso("torch")
+
+
+def dispositivo_por_defecto():
+    """
+    Devuelve el dispositivo que usan los ejemplos: GPU 0 si existe, si no CPU
+    """
+    return 0 if torch.cuda.is_available() else -1
+
+
+def memoria_rss_mb():
+    """
+    Devuelve la memoria residente actual del proceso en MB
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+
+    # Alternativa sin dependencias para Linux
+    try:
+        with open("/proc/self/statm") as f:
+            paginas_residentes = int(f.read().split()[1])
+        return paginas_residentes * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _bytes_valor(valor, vistos):
+    if isinstance(valor, torch.nn.Module):
+        return sum(_bytes_valor(v, vistos) for v in valor.state_dict(keep_vars=True).values())
+    if isinstance(valor, (tuple, list)):
+        # Los Linear cuantizados guardan sus pesos en tuplas (_packed_params)
+        return sum(_bytes_valor(v, vistos) for v in valor)
+    if isinstance(valor, torch.Tensor):
+        # Los pesos compartidos (embeddings atados) se cuentan una vez
+        if valor.data_ptr() in vistos:
+            return 0
+        vistos.add(valor.data_ptr())
+        return valor.numel() * valor.element_size()
+    if hasattr(valor, 'nbytes') and hasattr(valor, 'dtype'):
+        return int(valor.nbytes)
+    return 0
+
+
+def bytes_modelo(modelo):
+    """
+    Memoria de los pesos de un modelo registrado (pipeline de transformers,
+    pipeline de difusión u otro objeto con tensores o arrays)
+    """
+    if isinstance(getattr(modelo, 'components', None), dict):
+        partes = list(modelo.components.values())
+    elif getattr(modelo, 'model', None) is not None:
+        partes = [modelo.model]
+    else:
+        partes = list(vars(modelo).values()) if hasattr(modelo, '__dict__') else [modelo]
+    vistos = set()
+    return sum(_bytes_valor(parte, vistos) for parte in partes)
+
+
+class RegistroModelos:
+    """
+    Caché LRU de modelos cargados con presupuesto de memoria
+    """
+
+    def __init__(self, presupuesto_rss_mb=None):
+        if presupuesto_rss_mb is None:
+            presupuesto_rss_mb = float(os.environ.get("HF_PRESUPUESTO_RSS_MB", "0") or 0)
+        self.presupuesto_rss_mb = presupuesto_rss_mb
+        self._modelos = OrderedDict()
+        self._tamanos = {}
+        # Claves en carga -> Event que se activa al terminar
+        self._cargando = {}
+        self._lock = threading.RLock()
+        self.aciertos = 0
+        self.cargas = 0
+        self.desalojos = 0
+        self.segundos_carga = 0.0
+
+    @staticmethod
+    def _clave(tarea, model_id, dtype, device, kwargs):
+        extras = tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+        return (tarea, model_id, str(dtype) if dtype is not None else None, device, extras)
+
+    def obtener(self, tarea, model_id, dtype=None, device=None, cargador=None, **kwargs):
+        """
+        Devuelve una instancia ya cargada o la carga y la registra.
+
+        Si se pasa `cargador` (una función sin argumentos) se usa para
+        construir el modelo; si no, se crea un pipeline de transformers con
+        la tarea y el modelo indicados.
+        """
+        if device is None:
+            device = dispositivo_por_defecto()
+        clave = self._clave(tarea, model_id, dtype, device, kwargs)
+
+        while True:
+            with self._lock:
+                if clave in self._modelos:
+                    self._modelos.move_to_end(clave)
+                    self.aciertos += 1
+                    return self._modelos[clave]
+                en_carga = self._cargando.get(clave)
+                if en_carga is None:
+                    en_carga = self._cargando[clave] = threading.Event()
+                    break
+            # Otro hilo carga este modelo: se espera y se vuelve a mirar
+            # (si su carga falló, este hilo lo intenta de nuevo)
+            en_carga.wait()
+
+        try:
+            rss_inicial = memoria_rss_mb()
+            inicio = time.time()
+            if cargador is not None:
+                modelo = cargador()
+            else:
+                opciones = dict(kwargs)
+                if dtype is not None:
+                    opciones['torch_dtype'] = dtype
+                modelo = transformers.pipeline(tarea, model=model_id, device=device, **opciones)
+            segundos = time.time() - inicio
+            metrics.instrumentar(modelo, tarea, model_id)
+            # Sin tensores que medir se usa el crecimiento del RSS durante la carga
+            tamano = bytes_modelo(modelo) or max(0.0, memoria_rss_mb() - rss_inicial) * 1024 * 1024
+
+            with self._lock:
+                self.segundos_carga += segundos
+                self.cargas += 1
+                self._modelos[clave] = modelo
+                self._tamanos[clave] = tamano
+                self._aplicar_presupuesto()
+            return modelo
+        finally:
+            with self._lock:
+                self._cargando.pop(clave, None)
+            en_carga.set()
+
+    def memoria_modelos_mb(self):
+        with self._lock:
+            return sum(self._tamanos.values()) / (1024 * 1024)
+
+    def _aplicar_presupuesto(self):
+        """
+        Desaloja modelos LRU mientras sus pesos superen el presupuesto.
+        El modelo más reciente nunca se desaloja.
+        """
+        if not self.presupuesto_rss_mb:
+            return
+        desalojados = False
+        while len(self._modelos) > 1 and self.memoria_modelos_mb() > self.presupuesto_rss_mb:
+            clave, _ = self._modelos.popitem(last=False)
+            self._tamanos.pop(clave, None)
+            self.desalojos += 1
+            desalojados = True
+        if desalojados:
+            self._liberar_memoria()
+
+    @staticmethod
+    def _liberar_memoria():
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def descartar(self, tarea, model_id, dtype=None, device=None, **kwargs):
+        """
+        Elimina un modelo concreto del registro
+        """
+        if device is None:
+            device = dispositivo_por_defecto()
+        clave = self._clave(tarea, model_id, dtype, device, kwargs)
+        with self._lock:
+            self._tamanos.pop(clave, None)
+            if self._modelos.pop(clave, None) is not None:
+                self._liberar_memoria()
+
+    def limpiar(self):
+        """
+        Vacía el registro completo
+        """
+        with self._lock:
+            self._modelos.clear()
+            self._tamanos.clear()
+            self._liberar_memoria()
+
+    def estadisticas(self):
+        """
+        Devuelve un resumen del estado del registro
+        """
+        with self._lock:
+            return {
+                'modelos_cargados': [(clave[0], clave[1], clave[2]) for clave in self._modelos],
+                'aciertos': self.aciertos,
+                'cargas': self.cargas,
+                'desalojos': self.desalojos,
+                'segundos_carga': self.segundos_carga,
+                'memoria_modelos_mb': self.memoria_modelos_mb(),
+                'rss_mb': memoria_rss_mb(),
+                'presupuesto_rss_mb': self.presupuesto_rss_mb
+            }
+
+
+_registro_global = None
+_lock_global = threading.Lock()
+
+
+def obtener_registro():
+    """
+    Devuelve el registro compartido por todo el proceso
+    """
+    global _registro_global
+    with _lock_global:
+        if _registro_global is None:
+            _registro_global = RegistroModelos()
+        return _registro_global
+
+
+def obtener_pipeline(tarea, model_id, dtype=None, device=None, cuantizar=None, **kwargs):
+    """
+    Atajo para obtener un pipeline de transformers desde el registro global.
+
+    Con `cuantizar=True` (o si el modelo aparece en HF_MODELOS_INT8) el
+    pipeline se ejecuta en CPU con cuantización dinámica int8, ver
+    quantization.py.
+    """
+    if device is None:
+        device = dispositivo_por_defecto()
+
+    if cuantizar is None:
+        from quantization import modelos_int8_configurados
+        cuantizar = device == -1 and model_id in modelos_int8_configurados()
+
+    if cuantizar:
+        from quantization import cuantizar_pipeline
+
+        def cargar_int8():
+            # El pipeline fp32 se crea fuera del registro y se cuantiza en el
+            # sitio: no quedan dos copias del modelo en memoria
+            fp32 = transformers.pipeline(tarea, model=model_id, device=-1, **kwargs)
+            return cuantizar_pipeline(fp32, copiar=False)
+
+        return obtener_registro().obtener(
+            tarea, model_id, dtype="int8-dinamico", device=-1, cargador=cargar_int8, **kwargs
+        )
+
+    return obtener_registro().obtener(tarea, model_id, dtype=dtype, device=device, **kwargs)
+
+
+def mostrar_estadisticas():
+    """
+    Imprime el estado del registro global
+    """
+    stats = obtener_registro().estadisticas()
+    print("\n🗂️  Registro de modelos:")
+    print(f"   Modelos en memoria: {len(stats['modelos_cargados'])}")
+    for tarea, model_id, dtype in stats['modelos_cargados']:
+        print(f"      • {tarea}: {model_id}" + (f" ({dtype})" if dtype else ""))
+    print(f"   Reutilizaciones: {stats['aciertos']} | Cargas: {stats['cargas']} "
+          f"| Desalojos: {stats['desalojos']}")
+    print(f"   Tiempo total de carga: {stats['segundos_carga']:.1f}s")
+    print(f"   Pesos en memoria: {stats['memoria_modelos_mb']:.0f} MB | RSS actual: {stats['rss_mb']:.0f} MB")
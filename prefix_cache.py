@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Caché de Prefijos (Estado KV) para Generación
+=============================================
+
+En completados cortos buena parte de la latencia es el prefill: procesar
+el prompt entero antes del primer token nuevo. Ese trabajo se repite cada
+vez que el mismo prompt se genera varias veces (num_return_sequences,
+varias configuraciones de muestreo) o cuando muchos prompts empiezan igual
+(instrucciones de sistema, plantillas).
+
+Este módulo guarda el estado KV (DynamicCache) de los prefijos ya
+procesados en una LRU indexada por los ids de tokens, con un límite de
+memoria. Para cada prompt:
+
+  1. busca el prefijo guardado más largo que coincide con sus tokens;
+  2. procesa solo los tokens que faltan (todos menos el último, que
+     generate necesita para calcular el primer token nuevo) y guarda el
+     resultado;
+  3. devuelve una copia del estado repetida para todas las filas que
+     generan a partir de ese prompt.
+
+Se usa desde batched_generation.generar_por_lotes(cache_prefijos=...).
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from lazy_imports import importar_perezoso
+
+torch = importar_perezoso("torch")
+transformers = importar_perezoso("transformers")
+
+
+def bytes_estado(estado):
+    """
+    Memoria ocupada por los tensores de clave y valor de un DynamicCache
+    """
+    total = 0
+    for capa in getattr(estado, 'layers', ()):
+        for tensor in (getattr(capa, 'keys', None), getattr(capa, 'values', None)):
+            if tensor is not None and hasattr(tensor, 'numel'):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class CachePrefijos:
+    """
+    LRU de estados KV por (modelo, ids del prefijo) con límite de memoria
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2, max_entradas=128):
+        self.max_bytes = max_bytes
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.aciertos_parciales = 0
+        self.fallos = 0
+        self.tokens_reutilizados = 0
+        self.tokens_calculados = 0
+        self.expulsiones = 0
+
+    def _buscar(self, model_id, ids):
+        """
+        Devuelve (clave, estado) del prefijo guardado más largo de `ids`
+        """
+        mejor = None
+        for clave in self._entradas:
+            modelo, prefijo = clave
+            if modelo == model_id and len(prefijo) <= len(ids) and ids[:len(prefijo)] == prefijo:
+                if mejor is None or len(prefijo) > len(mejor[1]):
+                    mejor = clave
+        if mejor is None:
+            return None, None
+        self._entradas.move_to_end(mejor)
+        return mejor, self._entradas[mejor][0]
+
+    def _guardar(self, clave, estado):
+        tamano = bytes_estado(estado)
+        if tamano > self.max_bytes:
+            return
+        if clave in self._entradas:
+            self._bytes -= self._entradas.pop(clave)[1]
+        self._entradas[clave] = (estado, tamano)
+        self._bytes += tamano
+        while self._entradas and (self._bytes > self.max_bytes or len(self._entradas) > self.max_entradas):
+            _, (_, liberado) = self._entradas.popitem(last=False)
+            self._bytes -= liberado
+            self.expulsiones += 1
+
+    def estado_para(self, modelo, ids, filas=1):
+        """
+        Estado KV de ids[:-1] repetido para `filas` secuencias.
+
+        El estado devuelto es una copia que generate puede modificar; la
+        entrada guardada no cambia. Devuelve None si el prompt tiene un
+        solo token (no hay prefijo que reutilizar).
+        """
+        ids = tuple(int(token) for token in ids)
+        prefijo = ids[:-1]
+        if not prefijo:
+            return None
+        model_id = modelo.config.name_or_path
+
+        with self._lock:
+            clave, guardado = self._buscar(model_id, prefijo)
+            base = copy.deepcopy(guardado) if guardado is not None else None
+        reutilizados = len(clave[1]) if clave is not None else 0
+
+        if reutilizados < len(prefijo):
+            estado = base if base is not None else transformers.DynamicCache(config=modelo.config)
+            pendientes = torch.tensor([prefijo[reutilizados:]], device=modelo.device)
+            inicio = time.perf_counter()
+            with torch.inference_mode():
+                modelo(input_ids=pendientes, past_key_values=estado, use_cache=True,
+                       cache_position=torch.arange(reutilizados, len(prefijo), device=modelo.device))
+            metrics.registrar_etapa("text-generation", model_id, "prefill", time.perf_counter() - inicio)
+            with self._lock:
+                self._guardar((model_id, prefijo), copy.deepcopy(estado))
+        else:
+            estado = base
+
+        with self._lock:
+            if reutilizados == len(prefijo):
+                self.aciertos += 1
+            elif reutilizados:
+                self.aciertos_parciales += 1
+            else:
+                self.fallos += 1
+            self.tokens_reutilizados += reutilizados
+            self.tokens_calculados += len(prefijo) - reutilizados
+        metrics.registrar_prefijo(model_id, reutilizados, len(prefijo))
+
+        if filas > 1:
+            estado.batch_repeat_interleave(filas)
+        return estado
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.tokens_reutilizados + self.tokens_calculados
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'aciertos': self.aciertos,
+                'aciertos_parciales': self.aciertos_parciales,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones,
+                'tokens_reutilizados': self.tokens_reutilizados,
+                'tokens_calculados': self.tokens_calculados,
+                'ratio_reutilizacion': self.tokens_reutilizados / total if total else 0.0
+            }
+
+
+_cache_global = None
+_lock_global = threading.Lock()
+
+
+def obtener_cache_prefijos():
+    """
+    Devuelve la caché de prefijos compartida por todo el proceso
+    """
+    global _cache_global
+    with _lock_global:
+        if _cache_global is None:
+            _cache_global = CachePrefijos()
+        return _cache_global
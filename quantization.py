@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Cuantización Dinámica Int8 para Clasificadores en CPU
+=====================================================
+
+Este script permite ejecutar los modelos encoder de los ejemplos
+(sentimientos, emociones, idioma) con cuantización dinámica int8 de las
+capas Linear de PyTorch. Es opcional y se activa por modelo:
+
+    HF_MODELOS_INT8="cardiffnlp/twitter-xlm-roberta-base-sentiment,papluca/xlm-roberta-base-language-detection"
+
+o directamente con obtener_pipeline(..., cuantizar=True).
+
+Ejecutado como script genera un informe que compara fp32 contra int8 en
+latencia, memoria y concordancia de etiquetas sobre un conjunto de
+referencia:
+
+    python quantization.py --min-concordancia 0.95
+"""
+
+import argparse
+import copy
+import io
+import json
+import os
+import sys
+
+from lazy_imports import importar_perezoso
+
+torch = importar_perezoso("torch")
+transformers = importar_perezoso("transformers")
+
+# Modelos encoder usados en los ejemplos y la tarea de su pipeline
+MODELOS_ENCODER = {
+    "cardiffnlp/twitter-xlm-roberta-base-sentiment": "sentiment-analysis",
+    "pysentimiento/robertuito-sentiment-analysis": "sentiment-analysis",
+    "j-hartmann/emotion-english-distilroberta-base": "text-classification",
+    "papluca/xlm-roberta-base-language-detection": "text-classification",
+    "nlptown/bert-base-multilingual-uncased-sentiment": "sentiment-analysis"
+}
+
+# Conjunto de referencia tomado de los textos de los ejemplos
+TEXTOS_REFERENCIA = [
+    "¡Me encanta este producto! Es fantástico.",
+    "Este servicio es terrible, muy decepcionante.",
+    "El clima está bien hoy, ni muy bueno ni muy malo.",
+    "Estoy muy triste por lo que pasó ayer.",
+    "No me gustó nada la película, fue aburrida",
+    "Aunque el producto tiene algunas fallas menores, en general estoy satisfecho con la compra.",
+    "La atención al cliente fue excelente, pero el producto llegó dañado.",
+    "Meh, está bien pero nada del otro mundo.",
+    "Pésima calidad, se rompió al primer uso",
+    "Cumple su función básica, precio justo",
+    "I'm so excited about my vacation next week!",
+    "I can't believe they cancelled the concert, I'm devastated.",
+    "This traffic is making me so angry and frustrated.",
+    "I feel anxious about the job interview tomorrow.",
+    "I'm really surprised by how well the project turned out.",
+    "Bonjour, comment allez-vous aujourd'hui?",
+    "Guten Tag, wie geht es Ihnen heute?",
+    "Ciao, come stai oggi?",
+    "Привет, как дела сегодня?",
+    "你好，你今天怎么样？"
+]
+
+
+def modelos_int8_configurados():
+    """
+    Devuelve el conjunto de modelos que deben ejecutarse cuantizados
+    """
+    valor = os.environ.get("HF_MODELOS_INT8", "")
+    return {modelo.strip() for modelo in valor.split(",") if modelo.strip()}
+
+
+def cuantizar_modelo(modelo, copiar=True):
+    """
+    Devuelve el modelo con las capas Linear cuantizadas a int8: una copia,
+    o el propio modelo modificado si `copiar=False` (sin duplicar los pesos)
+    """
+    if copiar:
+        modelo = copy.deepcopy(modelo)
+    modelo = modelo.to("cpu").eval()
+    # Marcar la configuración para que la caché de inferencia distinga
+    # los resultados int8 de los fp32
+    modelo.config.cuantizacion = "int8-dinamico"
+    return torch.ao.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8,
+                                                  inplace=True)
+
+
+def cuantizar_pipeline(pipe, copiar=True):
+    """
+    Crea un pipeline equivalente cuyo modelo usa cuantización dinámica int8.
+    Con `copiar=False` el modelo de `pipe` se cuantiza en el sitio.
+    """
+    return transformers.pipeline(pipe.task, model=cuantizar_modelo(pipe.model, copiar),
+                                 tokenizer=pipe.tokenizer, device=-1)
+
+
+def tamano_modelo_mb(modelo):
+    """
+    Tamaño del state_dict serializado (incluye los pesos int8 empaquetados)
+    """
+    buffer = io.BytesIO()
+    torch.save(modelo.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+def _medir(pipe, textos, repeticiones):
+    from batch_scoring import puntuar_por_lotes
+
+    # Calentamiento
+    puntuar_por_lotes(pipe, textos[:2])
+
+    tiempos = []
+    for _ in range(repeticiones):
+        resultados, estadisticas = puntuar_por_lotes(pipe, textos)
+        tiempos.append(estadisticas['segundos'])
+    return resultados, min(tiempos)
+
+
+def comparar_fp32_int8(tarea, model_id, textos=None, repeticiones=3):
+    """
+    Compara un modelo en fp32 con su versión int8 sobre `textos`
+    """
+    from model_registry import obtener_pipeline
+
+    textos = textos or TEXTOS_REFERENCIA
+    pipe_fp32 = obtener_pipeline(tarea, model_id, device=-1, cuantizar=False)
+    pipe_int8 = obtener_pipeline(tarea, model_id, device=-1, cuantizar=True)
+
+    resultados_fp32, segundos_fp32 = _medir(pipe_fp32, textos, repeticiones)
+    resultados_int8, segundos_int8 = _medir(pipe_int8, textos, repeticiones)
+
+    coincidencias = sum(a[0]['label'] == b[0]['label'] for a, b in zip(resultados_fp32, resultados_int8))
+    diferencias = [abs(a[0]['score'] - b[0]['score'])
+                   for a, b in zip(resultados_fp32, resultados_int8) if a[0]['label'] == b[0]['label']]
+
+    return {
+        'modelo': model_id,
+        'textos': len(textos),
+        'ms_por_texto_fp32': segundos_fp32 / len(textos) * 1000,
+        'ms_por_texto_int8': segundos_int8 / len(textos) * 1000,
+        'aceleracion': segundos_fp32 / segundos_int8 if segundos_int8 > 0 else 0.0,
+        'mb_fp32': tamano_modelo_mb(pipe_fp32.model),
+        'mb_int8': tamano_modelo_mb(pipe_int8.model),
+        'concordancia_etiquetas': coincidencias / len(textos),
+        'max_diferencia_confianza': max(diferencias) if diferencias else 0.0
+    }
+
+
+def mostrar_informe(informe):
+    """
+    Imprime el resultado de comparar_fp32_int8
+    """
+    print(f"\n📦 {informe['modelo']}")
+    print(f"   Latencia: {informe['ms_por_texto_fp32']:.1f} ms/texto (fp32) → "
+          f"{informe['ms_por_texto_int8']:.1f} ms/texto (int8) | x{informe['aceleracion']:.2f}")
+    print(f"   Memoria:  {informe['mb_fp32']:.0f} MB (fp32) → {informe['mb_int8']:.0f} MB (int8)")
+    print(f"   Concordancia de etiquetas: {informe['concordancia_etiquetas'] * 100:.1f}% "
+          f"| Máx. diferencia de confianza: {informe['max_diferencia_confianza']:.3f}")
+
+
+def main(argv=None):
+    """
+    Genera el informe fp32 vs int8 para los modelos encoder de los ejemplos
+    """
+    parser = argparse.ArgumentParser(description="Informe de cuantización int8 vs fp32")
+    parser.add_argument('--modelos', nargs='*', default=list(MODELOS_ENCODER),
+                        help="Modelos a comparar (por defecto todos los encoder)")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--min-concordancia', type=float, default=0.0,
+                        help="Falla (código 1) si la concordancia de etiquetas es menor")
+    parser.add_argument('--json', help="Guardar el informe en un archivo JSON")
+    opciones = parser.parse_args(argv)
+
+    print("🤗 CUANTIZACIÓN DINÁMICA INT8 - INFORME")
+    print("=" * 60)
+
+    informes = []
+    for model_id in opciones.modelos:
+        tarea = MODELOS_ENCODER.get(model_id, "text-classification")
+        try:
+            informe = comparar_fp32_int8(tarea, model_id, repeticiones=opciones.repeticiones)
+        except Exception as e:
+            print(f"⚠️  No se pudo evaluar {model_id}: {e}")
+            continue
+        mostrar_informe(informe)
+        informes.append(informe)
+
+    if opciones.json:
+        with open(opciones.json, 'w', encoding='utf-8') as f:
+            json.dump(informes, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Informe guardado en {opciones.json}")
+
+    por_debajo = [i['modelo'] for i in informes
+                  if i['concordancia_etiquetas'] < opciones.min_concordancia]
+    if por_debajo:
+        print(f"\n❌ Concordancia por debajo de {opciones.min_concordancia:.2f}: {', '.join(por_debajo)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Sumidero de Resultados en Arrow / Parquet
+=========================================
+
+Los resultados de los ejemplos terminan en listas de diccionarios o en
+líneas impresas. Este módulo acumula los resultados de una tarea en
+columnas, los convierte en lotes Arrow (RecordBatch) de tamaño fijo y los
+escribe en archivos Parquet rotativos con un esquema estable por tarea:
+
+    resultados_parquet/sentimiento/parte-00000.parquet
+    resultados_parquet/sentimiento/parte-00001.parquet
+    ...
+
+Nunca hay en memoria más de un lote de resultados, y cada archivo solo
+aparece con su nombre final cuando está completo. Para analizarlos:
+
+    tabla = leer_resultados("resultados_parquet/sentimiento")   # pyarrow.Table
+    df = tabla.to_pandas()
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+from lazy_imports import importar_perezoso
+
+pa = importar_perezoso("pyarrow")
+pq = importar_perezoso("pyarrow.parquet")
+ds = importar_perezoso("pyarrow.dataset")
+
+DIRECTORIO_POR_DEFECTO = "resultados_parquet"
+
+
+def _campos_esquema(tarea):
+    """
+    Columnas fijas de cada tarea (nombre, tipo Arrow)
+    """
+    texto = ('texto', pa.string())
+    clasificacion = [texto, ('etiqueta', pa.string()), ('confianza', pa.float32())]
+    return {
+        'sentimiento': clasificacion,
+        'emociones': clasificacion + [('ventanas', pa.int32())],
+        'idioma': clasificacion + [('fuente', pa.string())],
+        'zero-shot': [texto, ('categoria', pa.string()), ('confianza', pa.float32()),
+                      ('todas_categorias', pa.list_(pa.string())),
+                      ('todas_confianzas', pa.list_(pa.float32()))],
+        'qa': [('pregunta', pa.string()), ('contexto', pa.string()), ('respuesta', pa.string()),
+               ('confianza', pa.float32()), ('inicio', pa.int32()), ('fin', pa.int32())],
+        'traduccion': [texto, ('traduccion', pa.string())],
+        'imagen': [('prompt', pa.string()), ('archivo', pa.string()), ('modelo', pa.string()),
+                   ('ancho', pa.int32()), ('alto', pa.int32()), ('pasos', pa.int32()),
+                   ('guidance', pa.float32()), ('semilla', pa.int64()),
+                   ('segundos', pa.float32()), ('dispositivo', pa.string())]
+    }.get(tarea)
+
+
+def esquema_tarea(tarea):
+    """
+    Devuelve el esquema Arrow de una tarea conocida (o None)
+    """
+    campos = _campos_esquema(tarea)
+    return pa.schema(campos) if campos else None
+
+
+class SumideroParquet:
+    """
+    Escribe resultados de una tarea en archivos Parquet rotativos.
+
+    Con `esquema=None` se usa el de la tarea; las columnas de los
+    registros que no estén en él se añaden con el tipo inferido del primer
+    lote y a partir de ahí el esquema queda fijo (las columnas nuevas se
+    ignoran y las que faltan quedan a null).
+    """
+
+    def __init__(self, tarea, directorio=DIRECTORIO_POR_DEFECTO, esquema=None,
+                 filas_por_lote=10000, filas_por_archivo=1_000_000, compresion='zstd'):
+        self.tarea = tarea
+        self.directorio = Path(directorio) / tarea
+        self.esquema = esquema if esquema is not None else esquema_tarea(tarea)
+        self.filas_por_lote = filas_por_lote
+        self.filas_por_archivo = filas_por_archivo
+        self.compresion = compresion
+        self._esquema_fijo = False
+        self._columnas = {}
+        self._filas_pendientes = 0
+        self._escritor = None
+        self._ruta_temporal = None
+        self._filas_archivo = 0
+        self._lock = threading.Lock()
+        self.filas_escritas = 0
+        self.archivos = []
+        self.directorio.mkdir(parents=True, exist_ok=True)
+
+    def _siguiente_parte(self):
+        """
+        Número de la siguiente parte: uno más que la mayor ya publicada
+        (puede haber huecos o archivos de otras ejecuciones)
+        """
+        numeros = [int(ruta.stem[len("parte-"):]) for ruta in self.directorio.glob("parte-*.parquet")
+                   if ruta.stem[len("parte-"):].isdigit()]
+        return max(numeros, default=-1) + 1
+
+    def _fijar_esquema(self, columnas):
+        campos = list(self.esquema) if self.esquema is not None else []
+        conocidos = {campo.name for campo in campos}
+        for nombre, valores in columnas.items():
+            if nombre not in conocidos:
+                tipo = pa.array(list(valores)).type
+                campos.append(pa.field(nombre, pa.string() if pa.types.is_null(tipo) else tipo))
+        self.esquema = pa.schema(campos)
+
+    def escribir_columnas(self, columnas):
+        """
+        Añade resultados dados por columnas: {nombre: lista o array}
+        """
+        columnas = {nombre: list(valores) if not hasattr(valores, 'tolist') else valores.tolist()
+                    for nombre, valores in columnas.items()}
+        filas = len(next(iter(columnas.values()), []))
+        if not filas:
+            return
+        with self._lock:
+            if not self._esquema_fijo:
+                self._fijar_esquema(columnas)
+                self._esquema_fijo = True
+            for nombre in self.esquema.names:
+                self._columnas.setdefault(nombre, []).extend(columnas.get(nombre, [None] * filas))
+            self._filas_pendientes += filas
+            if self._filas_pendientes >= self.filas_por_lote:
+                self._volcar()
+
+    def escribir(self, registros):
+        """
+        Añade resultados dados como lista de diccionarios
+        """
+        registros = list(registros)
+        if not registros:
+            return
+        nombres = list(dict.fromkeys(clave for registro in registros for clave in registro))
+        self.escribir_columnas({nombre: [registro.get(nombre) for registro in registros]
+                                for nombre in nombres})
+
+    def _volcar(self):
+        """
+        Convierte las columnas pendientes en un RecordBatch y lo escribe
+        """
+        if not self._filas_pendientes:
+            return
+        lote = pa.RecordBatch.from_arrays(
+            [pa.array(self._columnas[campo.name], type=campo.type) for campo in self.esquema],
+            schema=self.esquema
+        )
+        self._columnas = {}
+        self._filas_pendientes = 0
+
+        if self._escritor is None:
+            # El nombre final se elige al publicar; el temporal es único por proceso e hilo
+            self._ruta_temporal = self.directorio / (f".parte-{time.time_ns()}-{os.getpid()}-"
+                                                     f"{threading.get_ident()}.tmp")
+            self._escritor = pq.ParquetWriter(self._ruta_temporal, self.esquema,
+                                              compression=self.compresion)
+            self._filas_archivo = 0
+        self._escritor.write_batch(lote)
+        self._filas_archivo += lote.num_rows
+        self.filas_escritas += lote.num_rows
+        if self._filas_archivo >= self.filas_por_archivo:
+            self._cerrar_archivo()
+
+    def _cerrar_archivo(self):
+        if self._escritor is None:
+            return
+        self._escritor.close()
+        self._escritor = None
+        # os.link falla si el destino existe: nunca se sustituye una parte
+        # ya publicada, aunque otro proceso escriba en el mismo directorio
+        while True:
+            ruta_final = self.directorio / f"parte-{self._siguiente_parte():05d}.parquet"
+            try:
+                os.link(self._ruta_temporal, ruta_final)
+                break
+            except FileExistsError:
+                continue
+        os.unlink(self._ruta_temporal)
+        self.archivos.append(str(ruta_final))
+
+    def cerrar(self):
+        """
+        Escribe lo pendiente y publica el último archivo
+        """
+        with self._lock:
+            self._volcar()
+            self._cerrar_archivo()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+def leer_resultados(directorio, columnas=None, filtro=None):
+    """
+    Lee los Parquet de una tarea como una tabla Arrow, solo con las
+    `columnas` pedidas y las filas que cumplen `filtro` (expresión de
+    pyarrow.dataset, p. ej. ds.field('confianza') < 0.5)
+    """
+    dataset = ds.dataset(str(directorio), format="parquet", exclude_invalid_files=True)
+    return dataset.to_table(columns=columnas, filter=filtro)
@@ -48,6 +48,8 @@ def main():
     print("🤗 EJECUTOR DE EJEMPLOS DE HUGGING FACE")
     print("=" * 60)
     print("Este script ejecutará todos los ejemplos disponibles")
+    print("💡 Los modelos se cargan una sola vez y se comparten entre ejemplos")
+    print("   (límite de memoria configurable con HF_PRESUPUESTO_RSS_MB)")
     
     # Lista de ejemplos a ejecutar
     ejemplos = [
@@ -110,6 +112,15 @@ def main():
     print(f"❌ Ejemplos fallidos: {fallidos}")
     print(f"📈 Tasa de éxito: {(exitosos/(exitosos+fallidos)*100):.1f}%")
     
+    # Todos los ejemplos comparten el mismo registro de modelos en este proceso
+    try:
+        from model_registry import mostrar_estadisticas
+        from metrics import mostrar_resumen
+        mostrar_estadisticas()
+        mostrar_resumen()
+    except ImportError:
+        pass
+    
     if fallidos > 0:
         print("\n💡 Si hubo errores, verifica:")
         print("   • Que todas las dependencias estén instaladas: pip install -r requirements.txt")
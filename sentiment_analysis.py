@@ -7,11 +7,32 @@ Este script demuestra cómo usar modelos preentrenados de Hugging Face
 para realizar análisis de sentimientos en texto en español e inglés.
 """
 
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-import torch
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
+from lazy_imports import importar_perezoso
+from model_registry import obtener_pipeline
+from batch_scoring import puntuar_por_lotes, puntuar_columnar, mostrar_estadisticas_lotes
+from inference_cache import obtener_cache
+from tokenization_cache import obtener_cache_tokenizacion
+from result_sink import SumideroParquet
+from dedup import Deduplicador
+
+# Solo se importan al crear las visualizaciones
+plt = importar_perezoso("matplotlib.pyplot")
+pd = importar_perezoso("pandas")
+
+# Etiquetas de los modelos de sentimientos → español
+ETIQUETAS_ES = {
+    'LABEL_0': 'Negativo',
+    'LABEL_1': 'Neutral',
+    'LABEL_2': 'Positivo',
+    'NEGATIVE': 'Negativo',
+    'NEUTRAL': 'Neutral',
+    'POSITIVE': 'Positivo'
+}
+ETIQUETAS_INTERACTIVO = {
+    'LABEL_0': 'Negativo 😞',
+    'LABEL_1': 'Neutral 😐',
+    'LABEL_2': 'Positivo 😊'
+}
 
 def analisis_sentimientos_basico():
     """
@@ -21,10 +42,9 @@ def analisis_sentimientos_basico():
     
     # Crear pipeline para análisis de sentimientos
     # Usando modelo multilingüe que soporta español
-    sentiment_pipeline = pipeline(
+    sentiment_pipeline = obtener_pipeline(
         "sentiment-analysis",
-        model="cardiffnlp/twitter-xlm-roberta-base-sentiment",
-        tokenizer="cardiffnlp/twitter-xlm-roberta-base-sentiment"
+        "cardiffnlp/twitter-xlm-roberta-base-sentiment"
     )
     
     # Textos de ejemplo en español
@@ -41,33 +61,37 @@ def analisis_sentimientos_basico():
     print("\n📝 Analizando textos:")
     print("-" * 60)
     
-    resultados = []
-    for i, texto in enumerate(textos_ejemplo, 1):
-        resultado = sentiment_pipeline(texto)
-        sentimiento = resultado[0]
-        
-        # Mapear etiquetas a español
-        etiquetas_es = {
-            'LABEL_0': 'Negativo',
-            'LABEL_1': 'Neutral', 
-            'LABEL_2': 'Positivo',
-            'NEGATIVE': 'Negativo',
-            'NEUTRAL': 'Neutral',
-            'POSITIVE': 'Positivo'
-        }
-        
-        etiqueta = etiquetas_es.get(sentimiento['label'], sentimiento['label'])
-        confianza = sentimiento['score'] * 100
-        
+    # Puntuar todos los textos en lotes agrupados por longitud,
+    # reutilizando los resultados y los ids tokenizados guardados en disco.
+    # El resultado es columnar: etiquetas y confianzas salen como arrays
+    # Los textos repetidos tras normalizar (típicos en feeds) se infieren una sola vez
+    columnares, estadisticas = puntuar_columnar(sentiment_pipeline, textos_ejemplo,
+                                                cache=obtener_cache(),
+                                                cache_tokenizacion=obtener_cache_tokenizacion(),
+                                                deduplicador=Deduplicador())
+    etiquetas = columnares.nombres(mapeo=ETIQUETAS_ES)
+    confianzas = columnares.confianzas() * 100
+    
+    for i, (texto, etiqueta, confianza) in enumerate(zip(textos_ejemplo, etiquetas, confianzas), 1):
         print(f"{i}. Texto: {texto}")
         print(f"   Sentimiento: {etiqueta} ({confianza:.1f}% confianza)")
         print()
-        
-        resultados.append({
-            'texto': texto,
-            'sentimiento': etiqueta,
-            'confianza': confianza
-        })
+    
+    # Resultados por columnas (listos para pd.DataFrame)
+    resultados = {
+        'texto': textos_ejemplo,
+        'sentimiento': etiquetas,
+        'confianza': confianzas
+    }
+    
+    mostrar_estadisticas_lotes(estadisticas)
+    
+    # Guardar las columnas tal cual en Parquet para análisis posteriores
+    with SumideroParquet('sentimiento') as sumidero:
+        sumidero.escribir_columnas({'texto': resultados['texto'],
+                                    'etiqueta': resultados['sentimiento'],
+                                    'confianza': columnares.confianzas()})
+    print(f"💾 Resultados añadidos a {sumidero.directorio}")
     
     return resultados
 
@@ -81,17 +105,8 @@ def analisis_avanzado_con_modelo_personalizado():
     model_name = "pysentimiento/robertuito-sentiment-analysis"
     
     try:
-        # Cargar modelo y tokenizer
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForSequenceClassification.from_pretrained(model_name)
-        
-        # Crear pipeline personalizado
-        sentiment_pipeline = pipeline(
-            "sentiment-analysis",
-            model=model,
-            tokenizer=tokenizer,
-            device=0 if torch.cuda.is_available() else -1
-        )
+        # Obtener pipeline desde el registro compartido
+        sentiment_pipeline = obtener_pipeline("sentiment-analysis", model_name)
         
         # Textos más complejos en español
         textos_complejos = [
@@ -105,13 +120,18 @@ def analisis_avanzado_con_modelo_personalizado():
         print("\n📊 Análisis de textos complejos:")
         print("-" * 60)
         
-        for i, texto in enumerate(textos_complejos, 1):
-            resultado = sentiment_pipeline(texto)
+        predicciones, estadisticas = puntuar_por_lotes(sentiment_pipeline, textos_complejos,
+                                                       cache=obtener_cache(),
+                                                       cache_tokenizacion=obtener_cache_tokenizacion())
+        
+        for i, (texto, resultado) in enumerate(zip(textos_complejos, predicciones), 1):
             sentimiento = resultado[0]
             
             print(f"{i}. {texto}")
             print(f"   → {sentimiento['label']}: {sentimiento['score']:.3f}")
             print()
+        
+        mostrar_estadisticas_lotes(estadisticas)
             
     except Exception as e:
         print(f"⚠️  Error al cargar el modelo personalizado: {e}")
@@ -171,8 +191,8 @@ def ejemplo_interactivo():
     print("-" * 50)
     
     # Inicializar pipeline
-    sentiment_pipeline = pipeline("sentiment-analysis", 
-                                model="cardiffnlp/twitter-xlm-roberta-base-sentiment")
+    sentiment_pipeline = obtener_pipeline("sentiment-analysis",
+                                          "cardiffnlp/twitter-xlm-roberta-base-sentiment")
     
     while True:
         texto = input("\n📝 Ingresa tu texto: ").strip()
@@ -186,13 +206,7 @@ def ejemplo_interactivo():
             sentimiento = resultado[0]
             
             # Mapear a español
-            etiquetas_es = {
-                'LABEL_0': 'Negativo 😞',
-                'LABEL_1': 'Neutral 😐', 
-                'LABEL_2': 'Positivo 😊'
-            }
-            
-            etiqueta = etiquetas_es.get(sentimiento['label'], sentimiento['label'])
+            etiqueta = ETIQUETAS_INTERACTIVO.get(sentimiento['label'], sentimiento['label'])
             confianza = sentimiento['score'] * 100
             
             print(f"🎯 Resultado: {etiqueta}")
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Decodificación Especulativa con un Modelo Borrador
+==================================================
+
+Los generadores de text_generation.py (gpt2, DialoGPT-medium) hacen un
+forward completo del modelo por cada token. Con decodificación
+especulativa un modelo pequeño de la misma familia (mismo tokenizer)
+propone varios tokens seguidos y el modelo objetivo los verifica todos en
+una sola pasada:
+
+  - en greedy se aceptan los tokens propuestos mientras coinciden con el
+    argmax del objetivo, y en el primer desacuerdo se usa el token del
+    objetivo: el resultado es el mismo que sin borrador;
+  - con muestreo cada token propuesto x se acepta con probabilidad
+    min(1, p(x) / q(x)) y, si se rechaza, se muestrea de max(0, p - q)
+    normalizada, de modo que el texto sigue exactamente la distribución
+    del objetivo (p y q ya con temperature, top_k, top_p y
+    repetition_penalty aplicados).
+
+En cada ronda se aceptan entre 0 y `tokens_borrador` tokens y se añade uno
+del objetivo, así que una pasada del modelo grande produce varios tokens
+cuando el borrador acierta. Beam search no está soportado.
+"""
+
+import time
+
+from lazy_imports import importar_perezoso
+from batched_generation import MuestreoPorFila, _ids_eos, preparar_tokenizer
+
+torch = importar_perezoso("torch")
+transformers = importar_perezoso("transformers")
+
+# Borrador por defecto para cada generador de los ejemplos (mismo tokenizer)
+MODELOS_BORRADOR = {
+    'gpt2': 'distilgpt2',
+    'microsoft/DialoGPT-medium': 'microsoft/DialoGPT-small',
+    'microsoft/DialoGPT-large': 'microsoft/DialoGPT-small'
+}
+
+
+def _avanzar(modelo, estado, ids):
+    """
+    Pasa por el modelo los tokens de `ids` que aún no están en su caché KV
+    y devuelve los logits de esas posiciones
+    """
+    pasados = estado.get_seq_length()
+    nuevos = torch.tensor([ids[pasados:]], device=modelo.device)
+    salida = modelo(input_ids=nuevos, past_key_values=estado, use_cache=True,
+                    cache_position=torch.arange(pasados, len(ids), device=modelo.device))
+    return salida.logits[0].float().cpu()
+
+
+def _recortar(estado, longitud):
+    sobrantes = estado.get_seq_length() - longitud
+    if sobrantes > 0:
+        estado.crop(-sobrantes)
+
+
+def _distribucion(procesador, previos, logits):
+    """
+    Distribución del siguiente token tras aplicar los parámetros de muestreo
+    """
+    scores = procesador(torch.tensor([previos]), logits.unsqueeze(0))
+    return scores.softmax(dim=-1)[0]
+
+
+def generar_especulativo(generador, borrador, prompt, max_new_tokens=50, tokens_borrador=4,
+                         semilla=None, **parametros):
+    """
+    Genera una continuación de `prompt` con el modelo de `generador`
+    verificando las propuestas de `borrador` (pipeline o modelo).
+
+    `parametros` son los de muestreo (do_sample, temperature, top_p, top_k,
+    repetition_penalty). Devuelve (texto_generado, estadisticas) con la
+    tasa de aceptación y los tokens producidos por pasada del objetivo.
+    """
+    if parametros.get('num_beams', 1) > 1:
+        raise ValueError("La decodificación especulativa no admite beam search")
+    tokenizer = preparar_tokenizer(generador.tokenizer)
+    objetivo = generador.model
+    borrador = getattr(borrador, 'model', borrador)
+    if borrador.config.vocab_size != objetivo.config.vocab_size:
+        raise ValueError("El modelo borrador debe usar el mismo vocabulario que el objetivo")
+
+    muestrear = bool(parametros.get('do_sample', False))
+    ajustes = {clave: parametros.get(clave) for clave in ('temperature', 'top_p', 'top_k', 'repetition_penalty')}
+    procesador = MuestreoPorFila([{**ajustes, 'do_sample': muestrear}])
+    aleatorio = torch.Generator().manual_seed(semilla) if semilla is not None else None
+    eos_ids = _ids_eos(objetivo, tokenizer)
+
+    def elegir(distribucion):
+        if not muestrear:
+            return int(distribucion.argmax())
+        return int(torch.multinomial(distribucion, 1, generator=aleatorio))
+
+    ids = tokenizer(prompt)['input_ids']
+    longitud_prompt = len(ids)
+    estado_objetivo = transformers.DynamicCache(config=objetivo.config)
+    estado_borrador = transformers.DynamicCache(config=borrador.config)
+    contadores = {'rondas': 0, 'propuestos': 0, 'aceptados': 0}
+    objetivo.eval()
+    borrador.eval()
+
+    inicio = time.perf_counter()
+    with torch.inference_mode():
+        while len(ids) - longitud_prompt < max_new_tokens:
+            # 1. El borrador propone hasta k tokens, uno por pasada (barata)
+            k = min(tokens_borrador, max_new_tokens - (len(ids) - longitud_prompt))
+            propuestos, distribuciones = [], []
+            for _ in range(k):
+                q = _distribucion(procesador, ids + propuestos, _avanzar(borrador, estado_borrador, ids + propuestos)[-1])
+                propuestos.append(elegir(q))
+                distribuciones.append(q)
+                if propuestos[-1] in eos_ids:
+                    break
+
+            # 2. El objetivo puntúa todas las propuestas en una sola pasada
+            logits = _avanzar(objetivo, estado_objetivo, ids + propuestos)[-(len(propuestos) + 1):]
+            contadores['rondas'] += 1
+            contadores['propuestos'] += len(propuestos)
+
+            # 3. Aceptación: coincidencia con el argmax (greedy) o prueba de rechazo (muestreo)
+            aceptados, siguiente = 0, None
+            for j, token in enumerate(propuestos):
+                p = _distribucion(procesador, ids + propuestos[:j], logits[j])
+                if muestrear:
+                    q = distribuciones[j]
+                    azar = torch.rand(1, generator=aleatorio).item()
+                    if azar < min(1.0, float(p[token] / q[token])):
+                        aceptados += 1
+                        continue
+                    residual = (p - q).clamp(min=0)
+                    siguiente = elegir(residual / residual.sum() if residual.sum() > 0 else p)
+                else:
+                    siguiente = int(p.argmax())
+                    if siguiente == token:
+                        aceptados, siguiente = aceptados + 1, None
+                        continue
+                break
+            else:
+                # Todas aceptadas: el objetivo aporta un token más gratis
+                if not propuestos or propuestos[-1] not in eos_ids:
+                    siguiente = elegir(_distribucion(procesador, ids + propuestos, logits[len(propuestos)]))
+            contadores['aceptados'] += aceptados
+
+            nuevos = propuestos[:aceptados] + ([siguiente] if siguiente is not None else [])
+            nuevos = nuevos[:max_new_tokens - (len(ids) - longitud_prompt)]
+            terminado = False
+            for posicion, token in enumerate(nuevos):
+                if token in eos_ids:
+                    nuevos, terminado = nuevos[:posicion + 1], True
+                    break
+            ids = ids + nuevos
+
+            # Las cachés guardan todos los tokens salvo el último
+            _recortar(estado_objetivo, len(ids) - 1)
+            _recortar(estado_borrador, len(ids) - 1)
+            if terminado:
+                break
+    segundos = time.perf_counter() - inicio
+
+    tokens_nuevos = len(ids) - longitud_prompt
+    texto = tokenizer.decode(ids[longitud_prompt:], skip_special_tokens=True)
+    estadisticas = {
+        'tokens_nuevos': tokens_nuevos,
+        'rondas': contadores['rondas'],
+        'propuestos': contadores['propuestos'],
+        'aceptados': contadores['aceptados'],
+        'tasa_aceptacion': contadores['aceptados'] / contadores['propuestos'] if contadores['propuestos'] else 0.0,
+        'tokens_por_pasada': tokens_nuevos / contadores['rondas'] if contadores['rondas'] else 0.0,
+        'segundos': segundos
+    }
+    return prompt + texto, estadisticas
+
+
+def _generar_normal(generador, prompt, max_new_tokens, semilla, parametros):
+    """
+    Generación de referencia, un forward del objetivo por token
+    """
+    tokenizer = preparar_tokenizer(generador.tokenizer)
+    modelo = generador.model
+    if semilla is not None:
+        transformers.set_seed(semilla)
+    entradas = tokenizer(prompt, return_tensors="pt")
+    entradas = {clave: valor.to(modelo.device) for clave, valor in entradas.items()}
+    inicio = time.perf_counter()
+    with torch.inference_mode():
+        salida = modelo.generate(**entradas, max_new_tokens=max_new_tokens,
+                                 pad_token_id=tokenizer.pad_token_id, **parametros)
+    segundos = time.perf_counter() - inicio
+    texto = tokenizer.decode(salida[0, entradas['input_ids'].shape[1]:], skip_special_tokens=True)
+    return prompt + texto, segundos
+
+
+def comparar_estrategias(generador, borrador, prompt, configuraciones, max_new_tokens=40,
+                         tokens_borrador=4, semilla=42):
+    """
+    Ejecuta cada configuración ({'nombre', 'params'}) con y sin borrador y
+    devuelve, por estrategia, la tasa de aceptación y la aceleración
+    """
+    # Calentamiento: la primera llamada de cada modelo no es representativa
+    _generar_normal(generador, prompt, 2, None, {'do_sample': False})
+    generar_especulativo(generador, borrador, prompt, max_new_tokens=2, tokens_borrador=tokens_borrador)
+
+    filas = []
+    for config in configuraciones:
+        params = {clave: valor for clave, valor in config['params'].items() if clave != 'early_stopping'}
+        if params.get('num_beams', 1) > 1:
+            filas.append({'nombre': config['nombre'], 'omitida': "beam search no admite borrador"})
+            continue
+        texto_normal, segundos_normal = _generar_normal(generador, prompt, max_new_tokens, semilla, params)
+        texto, estadisticas = generar_especulativo(generador, borrador, prompt, max_new_tokens=max_new_tokens,
+                                                   tokens_borrador=tokens_borrador, semilla=semilla, **params)
+        filas.append({
+            'nombre': config['nombre'],
+            'texto': texto,
+            'tasa_aceptacion': estadisticas['tasa_aceptacion'],
+            'tokens_por_pasada': estadisticas['tokens_por_pasada'],
+            'segundos_normal': segundos_normal,
+            'segundos_especulativo': estadisticas['segundos'],
+            'aceleracion': segundos_normal / estadisticas['segundos'] if estadisticas['segundos'] > 0 else 0.0,
+            # En greedy el texto debe coincidir con la generación normal
+            'identico': texto == texto_normal if not params.get('do_sample') else None
+        })
+    return filas
+
+
+def mostrar_comparacion(filas):
+    """
+    Imprime la tabla de aceptación y aceleración por estrategia
+    """
+    print(f"\n{'Estrategia':<32}{'Aceptación':>11}{'Tok/pasada':>12}{'Normal':>9}{'Especul.':>10}{'Acel.':>8}")
+    print("-" * 82)
+    for fila in filas:
+        if 'omitida' in fila:
+            print(f"{fila['nombre'][:31]:<32}  ({fila['omitida']})")
+            continue
+        marca = {True: " ✓", False: " ≠", None: ""}[fila['identico']]
+        print(f"{fila['nombre'][:31]:<32}{fila['tasa_aceptacion'] * 100:>10.1f}%{fila['tokens_por_pasada']:>12.2f}"
+              f"{fila['segundos_normal']:>8.2f}s{fila['segundos_especulativo']:>9.2f}s"
+              f"{fila['aceleracion']:>7.2f}x{marca}")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Tiempo de Arranque
+===============================
+
+Mide cuánto tarda en importarse cada script del proyecto en un proceso
+nuevo, usando `python -X importtime`, y muestra las importaciones más
+costosas. Sirve para vigilar que las dependencias pesadas sigan cargándose
+de forma perezosa (ver lazy_imports.py).
+
+Ejemplos:
+    python startup_benchmark.py
+    python startup_benchmark.py --max-ms 200 --json arranque.json
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+MODULOS = [
+    "sentiment_analysis",
+    "text_generation",
+    "text_classification",
+    "examples.question_answering",
+    "examples.translation",
+    "image_generation",
+    "run_all_examples",
+    "batch_runner",
+    "inference_server"
+]
+
+DIRECTORIO_PROYECTO = Path(__file__).resolve().parent
+
+
+def parsear_importtime(salida):
+    """
+    Convierte la salida de -X importtime en una lista de
+    (modulo, propio_us, acumulado_us)
+    """
+    importaciones = []
+    for linea in salida.splitlines():
+        if not linea.startswith("import time:") or "[us]" in linea:
+            continue
+        propio, acumulado, nombre = linea[len("import time:"):].split("|")
+        importaciones.append((nombre.strip(), int(propio), int(acumulado)))
+    return importaciones
+
+
+def medir_modulo(modulo, repeticiones=3):
+    """
+    Importa `modulo` en procesos nuevos y devuelve sus tiempos de arranque
+    """
+    tiempos_import = []
+    tiempos_proceso = []
+    importaciones = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        proceso = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+            cwd=DIRECTORIO_PROYECTO, capture_output=True, text=True
+        )
+        tiempos_proceso.append((time.perf_counter() - inicio) * 1000)
+        if proceso.returncode != 0:
+            error = proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else "error"
+            raise RuntimeError(error)
+
+        importaciones = parsear_importtime(proceso.stderr)
+        total = next((acumulado for nombre, _, acumulado in reversed(importaciones)
+                      if nombre == modulo), 0)
+        tiempos_import.append(total / 1000)
+
+    return {
+        'modulo': modulo,
+        'ms_import': statistics.median(tiempos_import),
+        'ms_proceso': statistics.median(tiempos_proceso),
+        'mas_costosas': [
+            {'modulo': nombre, 'ms_propio': propio / 1000}
+            for nombre, propio, _ in sorted(importaciones, key=lambda i: i[1], reverse=True)[:10]
+        ],
+        'modulos_importados': len(importaciones)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide el tiempo de importación de los scripts")
+    parser.add_argument('--modulos', nargs='*', default=MODULOS)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--top', type=int, default=5,
+                        help="Importaciones más costosas a mostrar por módulo")
+    parser.add_argument('--max-ms', type=float,
+                        help="Falla (código 1) si algún módulo tarda más en importarse")
+    parser.add_argument('--json', help="Guardar los resultados en un archivo JSON")
+    opciones = parser.parse_args(argv)
+
+    print("⏱️  BENCHMARK DE ARRANQUE")
+    print("=" * 60)
+
+    resultados = []
+    for modulo in opciones.modulos:
+        try:
+            resultado = medir_modulo(modulo, opciones.repeticiones)
+        except RuntimeError as e:
+            print(f"❌ {modulo}: {e}")
+            continue
+        resultados.append(resultado)
+
+        print(f"\n📦 {modulo}: {resultado['ms_import']:.1f} ms de importación "
+              f"({resultado['ms_proceso']:.0f} ms el proceso completo, "
+              f"{resultado['modulos_importados']} módulos)")
+        for importacion in resultado['mas_costosas'][:opciones.top]:
+            print(f"   • {importacion['modulo']}: {importacion['ms_propio']:.1f} ms")
+
+    if opciones.json:
+        with open(opciones.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {opciones.json}")
+
+    if opciones.max_ms is not None:
+        lentos = [r['modulo'] for r in resultados if r['ms_import'] > opciones.max_ms]
+        if lentos:
+            print(f"\n❌ Superan {opciones.max_ms:.0f} ms: {', '.join(lentos)}")
+            sys.exit(1)
+        print(f"\n✅ Todos los módulos se importan en menos de {opciones.max_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Generación de Texto en Streaming
+================================
+
+Con `generator(prompt, ...)` no se ve nada hasta que termina la secuencia
+completa, así que la latencia que percibe el usuario es la de la
+generación entera. Aquí `generate` corre en un hilo en segundo plano con
+un streamer que recibe cada token en cuanto se produce:
+
+    streamer = generar_stream(generator, "Había una vez", max_new_tokens=80)
+    for fragmento in streamer:
+        print(fragmento, end="", flush=True)
+    print(streamer.metricas())
+
+El streamer mide por separado el tiempo hasta el primer token (TTFT, que
+incluye el prefill del prompt) y la latencia entre tokens sucesivos. Ambas
+se registran en metrics.py (hf_generacion_ttft_segundos y
+hf_generacion_entre_tokens_segundos). `generar_stream_async` ofrece lo
+mismo como iterador asíncrono para código asyncio.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+
+import metrics
+from lazy_imports import importar_perezoso
+from batched_generation import preparar_tokenizer
+
+torch = importar_perezoso("torch")
+
+_FIN = object()
+
+
+def _percentil(valores, percentil):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(percentil / 100 * (len(ordenados) - 1))))]
+
+
+class StreamerTokens:
+    """
+    Streamer para `generate` (interfaz put/end) que decodifica el texto de
+    forma incremental y guarda el instante de llegada de cada token.
+
+    Solo admite una secuencia por llamada (lote de tamaño 1).
+    """
+
+    def __init__(self, tokenizer, saltar_prompt=True, timeout=None, skip_special_tokens=True):
+        self.tokenizer = tokenizer
+        self.saltar_prompt = saltar_prompt
+        self.timeout = timeout
+        self.skip_special_tokens = skip_special_tokens
+        self._cola = queue.Queue()
+        self._tokens = []
+        self._texto_emitido = 0
+        self._prompt_visto = False
+        self.inicio = time.perf_counter()
+        self.instantes = []
+        self.error = None
+
+    def put(self, valor):
+        ahora = time.perf_counter()
+        if len(valor.shape) > 1:
+            if valor.shape[0] > 1:
+                raise ValueError("StreamerTokens solo admite lotes de tamaño 1")
+            valor = valor[0]
+        if self.saltar_prompt and not self._prompt_visto:
+            # La primera llamada de generate contiene el prompt
+            self._prompt_visto = True
+            return
+
+        nuevos = valor.tolist()
+        self._tokens.extend(nuevos)
+        self.instantes.extend([ahora] * len(nuevos))
+        texto = self.tokenizer.decode(self._tokens, skip_special_tokens=self.skip_special_tokens)
+        # Un carácter multibyte a medias se decodifica como U+FFFD: se espera al siguiente token
+        if texto.endswith("�"):
+            return
+        fragmento = texto[self._texto_emitido:]
+        self._texto_emitido = len(texto)
+        if fragmento:
+            self._cola.put(fragmento)
+
+    def end(self):
+        texto = self.tokenizer.decode(self._tokens, skip_special_tokens=self.skip_special_tokens)
+        if texto[self._texto_emitido:]:
+            self._cola.put(texto[self._texto_emitido:])
+        self._texto_emitido = len(texto)
+        self._cola.put(_FIN)
+
+    def fallar(self, error):
+        self.error = error
+        self._cola.put(_FIN)
+
+    def siguiente(self):
+        """
+        Devuelve el siguiente fragmento de texto, o None al terminar
+        """
+        elemento = self._cola.get(timeout=self.timeout)
+        if elemento is _FIN:
+            if self.error is not None:
+                raise self.error
+            return None
+        return elemento
+
+    def __iter__(self):
+        while True:
+            fragmento = self.siguiente()
+            if fragmento is None:
+                return
+            yield fragmento
+
+    @property
+    def texto(self):
+        return self.tokenizer.decode(self._tokens, skip_special_tokens=self.skip_special_tokens)
+
+    def metricas(self):
+        """
+        TTFT, latencia entre tokens (media, p50, p95) y tokens por segundo
+        """
+        entre_tokens = [b - a for a, b in zip(self.instantes, self.instantes[1:])]
+        segundos = (self.instantes[-1] - self.inicio) if self.instantes else 0.0
+        return {
+            'tokens': len(self.instantes),
+            'ttft': self.instantes[0] - self.inicio if self.instantes else None,
+            'entre_tokens_media': sum(entre_tokens) / len(entre_tokens) if entre_tokens else 0.0,
+            'entre_tokens_p50': _percentil(entre_tokens, 50),
+            'entre_tokens_p95': _percentil(entre_tokens, 95),
+            'segundos': segundos,
+            'tokens_por_segundo': len(self.instantes) / segundos if segundos > 0 else 0.0
+        }
+
+
+def generar_stream(generador, prompt, timeout=None, **parametros):
+    """
+    Lanza la generación de `prompt` en un hilo y devuelve un StreamerTokens
+    que se itera para obtener el texto a medida que se genera.
+
+    `parametros` se pasan a generate (max_new_tokens, temperature...).
+    Al terminar, el TTFT y las latencias entre tokens se registran en metrics.
+    """
+    tokenizer = preparar_tokenizer(generador.tokenizer)
+    modelo = generador.model
+    model_id = modelo.config.name_or_path
+    parametros.setdefault('pad_token_id', tokenizer.pad_token_id)
+    if parametros.get('num_return_sequences', 1) > 1 or parametros.get('num_beams', 1) > 1:
+        raise ValueError("El streaming genera una sola secuencia (sin beam search)")
+
+    streamer = StreamerTokens(tokenizer, timeout=timeout)
+
+    def ejecutar():
+        try:
+            entradas = tokenizer(prompt, return_tensors="pt")
+            entradas = {clave: valor.to(modelo.device) for clave, valor in entradas.items()}
+            with torch.inference_mode():
+                modelo.generate(**entradas, streamer=streamer, **parametros)
+        except Exception as e:
+            streamer.fallar(e)
+            return
+        estadisticas = streamer.metricas()
+        metrics.registrar_streaming(model_id, estadisticas['ttft'],
+                                    [b - a for a, b in zip(streamer.instantes, streamer.instantes[1:])])
+
+    streamer.inicio = time.perf_counter()
+    threading.Thread(target=ejecutar, daemon=True, name="generar-stream").start()
+    return streamer
+
+
+async def generar_stream_async(generador, prompt, **parametros):
+    """
+    Igual que generar_stream, como iterador asíncrono:
+
+        async for fragmento in generar_stream_async(generator, prompt):
+            ...
+    """
+    streamer = generar_stream(generador, prompt, **parametros)
+    while True:
+        fragmento = await asyncio.to_thread(streamer.siguiente)
+        if fragmento is None:
+            return
+        yield fragmento
+
+
+def mostrar_metricas_stream(estadisticas):
+    """
+    Imprime el TTFT y la latencia entre tokens de una generación en streaming
+    """
+    if estadisticas['ttft'] is None:
+        print("⏱️  No se generó ningún token")
+        return
+    print(f"⏱️  Primer token: {estadisticas['ttft'] * 1000:.0f} ms | entre tokens: "
+          f"{estadisticas['entre_tokens_media'] * 1000:.1f} ms de media "
+          f"(p95 {estadisticas['entre_tokens_p95'] * 1000:.1f} ms) | "
+          f"{estadisticas['tokens']} tokens, {estadisticas['tokens_por_segundo']:.1f} tokens/s")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Métricas de Evaluación Incrementales
+====================================
+
+Evaluar un conjunto etiquetado grande guardando todas las predicciones en
+listas y calculando el informe al final no escala: la memoria crece con el
+número de filas y no hay resultados hasta terminar. Aquí la matriz de
+confusión es un acumulador NumPy de tamaño fijo que se actualiza lote a
+lote; precisión, recall y F1 por clase se derivan de ella en cualquier
+momento, así que el archivo se recorre en streaming con memoria constante
+y con instantáneas periódicas.
+
+Ejemplo (evaluar el modelo de sentimientos sobre un JSONL con 'texto' y
+'etiqueta', con una instantánea cada 10000 filas):
+
+    python streaming_metrics.py sentimiento resenas.jsonl --cada 10000 \\
+        --instantaneas evaluacion.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from lazy_imports import importar_perezoso
+
+np = importar_perezoso("numpy")
+
+
+class MetricasIncrementales:
+    """
+    Matriz de confusión y métricas por clase con memoria constante.
+
+    Si no se pasan `clases`, se registran a medida que aparecen hasta
+    `max_clases`; las etiquetas que no caben se cuentan en 'descartadas'.
+    """
+
+    def __init__(self, clases=None, max_clases=256):
+        self.clases = []
+        self._indices = {}
+        self.max_clases = max(max_clases, len(clases or ()))
+        self.matriz = np.zeros((self.max_clases, self.max_clases), dtype=np.int64)
+        self.descartadas = 0
+        for clase in clases or ():
+            self._indice(clase)
+
+    def _indice(self, clase):
+        indice = self._indices.get(clase)
+        if indice is None and len(self.clases) < self.max_clases:
+            indice = len(self.clases)
+            self._indices[clase] = indice
+            self.clases.append(clase)
+        return indice
+
+    @property
+    def total(self):
+        return int(self.matriz.sum())
+
+    def actualizar(self, reales, predichas):
+        """
+        Suma un lote de pares (etiqueta real, etiqueta predicha)
+        """
+        pares = [(self._indice(real), self._indice(predicha)) for real, predicha in zip(reales, predichas)]
+        validos = np.array([par for par in pares if None not in par], dtype=np.int64).reshape(-1, 2)
+        self.descartadas += len(pares) - len(validos)
+        if len(validos):
+            # Un único bincount por lote en lugar de un incremento por fila
+            planos = validos[:, 0] * self.max_clases + validos[:, 1]
+            self.matriz += np.bincount(planos, minlength=self.max_clases ** 2).reshape(self.matriz.shape)
+
+    def combinar(self, otras):
+        """
+        Suma los contadores de otro acumulador (p. ej. de otro proceso)
+        """
+        for real in otras.clases:
+            for predicha in otras.clases:
+                cuenta = otras.matriz[otras._indices[real], otras._indices[predicha]]
+                if cuenta:
+                    i, j = self._indice(real), self._indice(predicha)
+                    if i is None or j is None:
+                        self.descartadas += int(cuenta)
+                    else:
+                        self.matriz[i, j] += cuenta
+        self.descartadas += otras.descartadas
+
+    def resumen(self):
+        """
+        Devuelve exactitud, F1 macro/ponderado y precisión/recall/F1 por clase
+        """
+        n = len(self.clases)
+        matriz = self.matriz[:n, :n]
+        aciertos = np.diag(matriz).astype(np.float64)
+        soporte = matriz.sum(axis=1)
+        predichas = matriz.sum(axis=0)
+        total = int(soporte.sum())
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(predichas > 0, aciertos / predichas, 0.0)
+            recall = np.where(soporte > 0, aciertos / soporte, 0.0)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+        presentes = soporte > 0
+        return {
+            'total': total,
+            'descartadas': self.descartadas,
+            'exactitud': float(aciertos.sum() / total) if total else 0.0,
+            'f1_macro': float(f1[presentes].mean()) if presentes.any() else 0.0,
+            'f1_ponderado': float((f1 * soporte).sum() / total) if total else 0.0,
+            'por_clase': {
+                str(clase): {'precision': float(precision[i]), 'recall': float(recall[i]),
+                             'f1': float(f1[i]), 'soporte': int(soporte[i])}
+                for i, clase in enumerate(self.clases)
+            },
+            'clases': [str(clase) for clase in self.clases],
+            'matriz_confusion': matriz.tolist()
+        }
+
+
+def mostrar_resumen(resumen, matriz=True):
+    """
+    Imprime el informe por clase (y la matriz de confusión) de un resumen
+    """
+    print(f"\n{'Clase':<16}{'Precisión':>10}{'Recall':>9}{'F1':>8}{'Soporte':>10}")
+    print("-" * 53)
+    for clase, valores in resumen['por_clase'].items():
+        print(f"{clase[:15]:<16}{valores['precision']:>10.3f}{valores['recall']:>9.3f}"
+              f"{valores['f1']:>8.3f}{valores['soporte']:>10}")
+    print("-" * 53)
+    print(f"Exactitud: {resumen['exactitud'] * 100:.1f}% | F1 macro: {resumen['f1_macro']:.3f} | "
+          f"F1 ponderado: {resumen['f1_ponderado']:.3f} | {resumen['total']} filas")
+
+    if matriz and resumen['clases']:
+        ancho = max(8, max(len(clase) for clase in resumen['clases'][:10]) + 1)
+        print("\nMatriz de confusión (filas = real, columnas = predicho):")
+        print(" " * ancho + "".join(f"{clase[:ancho - 1]:>{ancho}}" for clase in resumen['clases']))
+        for clase, fila in zip(resumen['clases'], resumen['matriz_confusion']):
+            print(f"{clase[:ancho - 1]:<{ancho}}" + "".join(f"{valor:>{ancho}}" for valor in fila))
+
+
+def evaluar_stream(lotes, predecir, metricas=None, cada=10000):
+    """
+    Evalúa un iterable de lotes (listas de (entrada, etiqueta)) en streaming.
+
+    `predecir` recibe la lista de entradas de un lote y devuelve sus
+    etiquetas predichas. Genera un resumen cada `cada` filas y uno final.
+    """
+    metricas = metricas or MetricasIncrementales()
+    vistas = 0
+    # Filas vistas en la última instantánea (None si aún no hay ninguna)
+    ultima = None
+    siguiente = cada
+    for lote in lotes:
+        entradas = [entrada for entrada, _ in lote]
+        reales = [etiqueta for _, etiqueta in lote]
+        metricas.actualizar(reales, predecir(entradas))
+        vistas += len(lote)
+        if cada and vistas >= siguiente:
+            siguiente = (vistas // cada + 1) * cada
+            ultima = vistas
+            yield metricas.resumen()
+    if vistas != ultima:
+        yield metricas.resumen()
+
+
+def main(argv=None):
+    import batch_runner
+
+    parser = argparse.ArgumentParser(description="Evalúa una tarea de clasificación sobre un "
+                                                 "archivo etiquetado con métricas incrementales")
+    parser.add_argument('tarea', choices=['sentimiento', 'emociones', 'idioma', 'zero-shot'])
+    parser.add_argument('entrada', help="Archivo JSONL/CSV etiquetado ('-' para stdin)")
+    parser.add_argument('--formato', choices=['jsonl', 'csv'])
+    parser.add_argument('--campo-etiqueta', default='etiqueta',
+                        help="Campo con la etiqueta real (default=etiqueta)")
+    parser.add_argument('--mapeo', help="JSON {etiqueta del modelo: etiqueta real}, en línea o en "
+                                        "un archivo, para comparar etiquetas con nombres distintos")
+    parser.add_argument('--tamano-lote', type=int, default=256)
+    parser.add_argument('--cada', type=int, default=10000,
+                        help="Filas entre instantáneas (0 = solo al final)")
+    parser.add_argument('--instantaneas', help="Archivo JSONL donde añadir cada instantánea")
+    parser.add_argument('--categorias', help="Categorías separadas por comas para zero-shot")
+    parser.add_argument('--modelo', action='append', metavar='TAREA=MODELO')
+    parser.add_argument('--sin-cache', action='store_true')
+    opciones = parser.parse_args(argv)
+    opciones.prefiltro_k = None
+
+    batch_runner.configurar_modelos(opciones.modelo)
+    opciones.cache = None if opciones.sin_cache else batch_runner.obtener_cache()
+    procesar = batch_runner.TAREAS[opciones.tarea]
+    mapeo = {}
+    if opciones.mapeo and os.path.isfile(opciones.mapeo):
+        with open(opciones.mapeo, encoding='utf-8') as f:
+            mapeo = json.load(f)
+    elif opciones.mapeo:
+        try:
+            mapeo = json.loads(opciones.mapeo)
+        except json.JSONDecodeError:
+            parser.error(f"--mapeo no es un archivo ni un JSON válido: {opciones.mapeo}")
+
+    def predecir(registros):
+        predichas = [resultado.get('etiqueta', resultado.get('categoria'))
+                     for resultado in procesar(registros, opciones)]
+        return [mapeo.get(etiqueta, etiqueta) for etiqueta in predichas]
+
+    registros = batch_runner.leer_registros(opciones.entrada, opciones.formato)
+    pares = ((registro, str(registro[opciones.campo_etiqueta])) for registro in registros)
+    lotes = batch_runner.agrupar_en_lotes(pares, opciones.tamano_lote)
+
+    salida = open(opciones.instantaneas, 'a', encoding='utf-8') if opciones.instantaneas else None
+    inicio = time.time()
+    resumen = None
+    try:
+        for resumen in evaluar_stream(lotes, predecir, cada=opciones.cada):
+            segundos = time.time() - inicio
+            print(f"📊 {resumen['total']} filas | exactitud {resumen['exactitud'] * 100:.1f}% | "
+                  f"F1 macro {resumen['f1_macro']:.3f} | {resumen['total'] / max(segundos, 1e-9):.0f} filas/s",
+                  file=sys.stderr)
+            if salida is not None:
+                salida.write(json.dumps({'segundos': segundos, **resumen}, ensure_ascii=False) + '\n')
+                salida.flush()
+    finally:
+        if salida is not None:
+            salida.close()
+
+    if resumen is not None:
+        mostrar_resumen(resumen)
+
+
+if __name__ == "__main__":
+    main()
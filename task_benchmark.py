@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Tareas sin Conexión
+================================
+
+Mide cada tarea del proyecto (sentimientos, generación, zero-shot,
+emociones, idioma, QA, traducción y Stable Diffusion) con calentamiento y
+repeticiones, y reporta latencia p50/p95/p99, rendimiento y pico de memoria
+(RSS) en JSON.
+
+Puede ejecutarse con:
+  - modelos diminutos inicializados al azar a partir de configuraciones
+    locales (--modelos tiny): no necesita red y sirve para comparar el
+    coste del código del proyecto entre versiones
+  - los checkpoints reales de los ejemplos, si ya están en la caché de
+    Hugging Face (--modelos reales)
+  - lo que haya disponible para cada tarea (--modelos auto, por defecto)
+
+Ejemplos:
+    python task_benchmark.py --modelos tiny --json benchmark.json
+    python task_benchmark.py --tareas sentimiento qa --repeticiones 20
+"""
+
+import os
+
+# Trabajar solo con la caché local (antes de importar transformers)
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import json
+import platform
+import resource
+import string
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from lazy_imports import importar_perezoso
+from model_registry import memoria_rss_mb, obtener_pipeline, obtener_registro
+from batch_runner import MODELOS
+
+torch = importar_perezoso("torch")
+transformers = importar_perezoso("transformers")
+
+MODELOS_REALES = dict(MODELOS, **{
+    'generacion': "datificate/gpt2-small-spanish",
+    'imagen': "runwayml/stable-diffusion-v1-5"
+})
+
+TEXTOS = [
+    "¡Me encanta este producto! Es fantástico.",
+    "Este servicio es terrible, muy decepcionante.",
+    "El clima está bien hoy, ni muy bueno ni muy malo.",
+    "I'm so excited about my vacation next week!",
+    "This traffic is making me so angry and frustrated.",
+    "Bonjour, comment allez-vous aujourd'hui?",
+    "La inteligencia artificial está transformando la forma en que trabajamos.",
+    "Aunque el producto tiene algunas fallas menores, en general estoy satisfecho con la compra."
+]
+CATEGORIAS = ["tecnología", "deportes", "política", "economía"]
+PREGUNTAS = [
+    ("¿Qué está transformando la inteligencia artificial?",
+     "La inteligencia artificial está transformando la forma en que trabajamos y vivimos."),
+    ("¿Dónde está la Torre Eiffel?",
+     "La Torre Eiffel es una torre de hierro construida en París, Francia, en 1889.")
+]
+PROMPT_IMAGEN = "a beautiful sunset over a mountain landscape, digital art"
+
+DIRECTORIO_TINY = Path(tempfile.gettempdir()) / "hf_benchmark_tiny"
+
+
+def _ciclo(elementos, cantidad):
+    return [elementos[i % len(elementos)] for i in range(cantidad)]
+
+
+def percentil(valores, p):
+    """
+    Percentil `p` (0-100) con interpolación lineal
+    """
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+class MuestreadorRSS:
+    """
+    Registra en segundo plano el pico de memoria residente del proceso
+    """
+
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self.pico_mb = 0.0
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def __enter__(self):
+        self.pico_mb = memoria_rss_mb()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+        self._hilo.start()
+        return self
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo):
+            self.pico_mb = max(self.pico_mb, memoria_rss_mb())
+
+    def __exit__(self, *_):
+        self._detener.set()
+        self._hilo.join()
+        self.pico_mb = max(self.pico_mb, memoria_rss_mb())
+
+
+# ---------------------------------------------------------------------------
+# Modelos diminutos a partir de configuraciones locales
+# ---------------------------------------------------------------------------
+
+def _tokenizador_tiny(model_max_length=128):
+    """
+    Tokenizador por palabras con el vocabulario de los textos del benchmark
+    """
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+
+    vocabulario = {"<pad>": 0, "<s>": 1, "</s>": 2, "<unk>": 3}
+    palabras = " ".join(TEXTOS + CATEGORIAS + [p for par in PREGUNTAS for p in par] + [PROMPT_IMAGEN])
+    for palabra in list(string.ascii_lowercase) + palabras.lower().split():
+        palabra = palabra.strip(string.punctuation + "¿¡")
+        if palabra:
+            vocabulario.setdefault(palabra, len(vocabulario))
+
+    tokenizador = Tokenizer(models.WordLevel(vocabulario, unk_token="<unk>"))
+    tokenizador.normalizer = normalizers.Lowercase()
+    tokenizador.pre_tokenizer = pre_tokenizers.Whitespace()
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizador, pad_token="<pad>", bos_token="<s>", eos_token="</s>",
+        unk_token="<unk>", model_max_length=model_max_length
+    )
+
+
+def _config_roberta(tokenizador, **kwargs):
+    return transformers.RobertaConfig(
+        vocab_size=len(tokenizador), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=tokenizador.model_max_length + 4,
+        pad_token_id=tokenizador.pad_token_id, **kwargs
+    )
+
+
+def _clasificador_tiny(etiquetas):
+    def construir(tokenizador):
+        config = _config_roberta(tokenizador, num_labels=len(etiquetas),
+                                 id2label=dict(enumerate(etiquetas)),
+                                 label2id={e: i for i, e in enumerate(etiquetas)})
+        return transformers.RobertaForSequenceClassification(config)
+    return construir
+
+
+def _qa_tiny(tokenizador):
+    return transformers.RobertaForQuestionAnswering(_config_roberta(tokenizador))
+
+
+def _generador_tiny(tokenizador):
+    return transformers.GPT2LMHeadModel(transformers.GPT2Config(
+        vocab_size=len(tokenizador), n_embd=32, n_layer=2, n_head=2, n_positions=256,
+        bos_token_id=tokenizador.bos_token_id, eos_token_id=tokenizador.eos_token_id,
+        pad_token_id=tokenizador.pad_token_id
+    ))
+
+
+def _traductor_tiny(tokenizador):
+    return transformers.BartForConditionalGeneration(transformers.BartConfig(
+        vocab_size=len(tokenizador), d_model=32, encoder_layers=2, decoder_layers=2,
+        encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=64, decoder_ffn_dim=64,
+        max_position_embeddings=tokenizador.model_max_length + 4,
+        pad_token_id=tokenizador.pad_token_id, bos_token_id=tokenizador.bos_token_id,
+        eos_token_id=tokenizador.eos_token_id, decoder_start_token_id=tokenizador.eos_token_id,
+        forced_eos_token_id=tokenizador.eos_token_id
+    ))
+
+
+CONSTRUCTORES_TINY = {
+    'sentimiento': _clasificador_tiny(["negative", "neutral", "positive"]),
+    'zero-shot': _clasificador_tiny(["contradiction", "neutral", "entailment"]),
+    'emociones': _clasificador_tiny(["anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise"]),
+    'idioma': _clasificador_tiny(["es", "en", "fr", "de", "it"]),
+    'qa': _qa_tiny,
+    'generacion': _generador_tiny,
+    'traduccion': _traductor_tiny
+}
+
+
+def crear_modelo_tiny(nombre, directorio=DIRECTORIO_TINY):
+    """
+    Guarda en disco un modelo diminuto con pesos aleatorios y devuelve su ruta
+    """
+    ruta = Path(directorio) / nombre
+    if not (ruta / "config.json").exists():
+        torch.manual_seed(0)
+        tokenizador = _tokenizador_tiny()
+        modelo = CONSTRUCTORES_TINY[nombre](tokenizador)
+        modelo.save_pretrained(ruta)
+        tokenizador.save_pretrained(ruta)
+    return str(ruta)
+
+
+def crear_difusion_tiny():
+    """
+    Construye en memoria un Stable Diffusion diminuto (UNet, VAE y CLIP)
+    """
+    # Sin el intento de reparación de image_generation: el benchmark no
+    # debe instalar ni desinstalar paquetes
+    import diffusers
+
+    torch.manual_seed(0)
+    tokenizador = _tokenizador_tiny(model_max_length=16)
+    unet = diffusers.UNet2DConditionModel(
+        sample_size=8, in_channels=4, out_channels=4, layers_per_block=1,
+        block_out_channels=(32, 64), down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"), cross_attention_dim=32,
+        attention_head_dim=8, norm_num_groups=32
+    )
+    vae = diffusers.AutoencoderKL(
+        in_channels=3, out_channels=3, latent_channels=4, block_out_channels=(32, 64),
+        down_block_types=("DownEncoderBlock2D", "DownEncoderBlock2D"),
+        up_block_types=("UpDecoderBlock2D", "UpDecoderBlock2D"), norm_num_groups=32
+    )
+    codificador = transformers.CLIPTextModel(transformers.CLIPTextConfig(
+        vocab_size=len(tokenizador), hidden_size=32, intermediate_size=64, num_attention_heads=2,
+        num_hidden_layers=2, max_position_embeddings=tokenizador.model_max_length,
+        bos_token_id=tokenizador.bos_token_id, eos_token_id=tokenizador.eos_token_id,
+        pad_token_id=tokenizador.pad_token_id
+    ))
+    # El tokenizador no es CLIPTokenizer, por eso el pipeline se construye
+    # directamente en lugar de guardarlo y cargarlo con from_pretrained
+    return diffusers.StableDiffusionPipeline(
+        vae=vae, text_encoder=codificador, tokenizer=tokenizador, unet=unet,
+        scheduler=diffusers.DDIMScheduler(), safety_checker=None,
+        feature_extractor=None, requires_safety_checker=False
+    )
+
+
+def modelo_en_cache(model_id, archivo="config.json"):
+    """
+    Indica si un modelo del Hub ya está descargado en la caché local
+    """
+    from huggingface_hub import try_to_load_from_cache
+    return isinstance(try_to_load_from_cache(model_id, archivo), str)
+
+
+# ---------------------------------------------------------------------------
+# Tareas
+# ---------------------------------------------------------------------------
+
+def _preparar_clasificacion(tarea):
+    def preparar(model_id, opciones):
+        pipe = obtener_pipeline(tarea, model_id)
+        lote = _ciclo(TEXTOS, opciones.tamano_lote)
+        return lambda: pipe(lote), len(lote)
+    return preparar
+
+
+def _preparar_zero_shot(model_id, opciones):
+    pipe = obtener_pipeline("zero-shot-classification", model_id)
+    lote = _ciclo(TEXTOS, opciones.tamano_lote)
+    return lambda: pipe(lote, candidate_labels=CATEGORIAS), len(lote)
+
+
+def _preparar_qa(model_id, opciones):
+    pipe = obtener_pipeline("question-answering", model_id)
+    preguntas, contextos = zip(*_ciclo(PREGUNTAS, opciones.tamano_lote))
+    return lambda: pipe(question=list(preguntas), context=list(contextos)), len(preguntas)
+
+
+def _preparar_generacion(model_id, opciones):
+    pipe = obtener_pipeline("text-generation", model_id)
+    lote = _ciclo(TEXTOS, opciones.tamano_lote)
+    if pipe.tokenizer.pad_token is None:
+        pipe.tokenizer.pad_token = pipe.tokenizer.eos_token
+    return lambda: pipe(lote, max_new_tokens=opciones.tokens_nuevos, do_sample=False,
+                        batch_size=len(lote)), len(lote)
+
+
+def _preparar_traduccion(model_id, opciones):
+    pipe = obtener_pipeline("translation", model_id)
+    lote = _ciclo(TEXTOS, opciones.tamano_lote)
+    return lambda: pipe(lote, max_new_tokens=opciones.tokens_nuevos,
+                        batch_size=len(lote)), len(lote)
+
+
+def _preparar_imagen(model_id, opciones):
+    from image_generation import obtener_pipeline_difusion
+
+    if opciones.modelo_tiny:
+        pipe = obtener_registro().obtener("text-to-image", model_id, cargador=crear_difusion_tiny)
+        tamano = {'height': 16, 'width': 16}
+    else:
+        pipe = obtener_pipeline_difusion(model_id, "cuda" if torch.cuda.is_available() else "cpu")
+        tamano = {}
+    pipe.set_progress_bar_config(disable=True)
+    return lambda: pipe(PROMPT_IMAGEN, num_inference_steps=opciones.pasos_difusion, **tamano), 1
+
+
+TAREAS_BENCHMARK = {
+    'sentimiento': _preparar_clasificacion("sentiment-analysis"),
+    'generacion': _preparar_generacion,
+    'zero-shot': _preparar_zero_shot,
+    'emociones': _preparar_clasificacion("text-classification"),
+    'idioma': _preparar_clasificacion("text-classification"),
+    'qa': _preparar_qa,
+    'traduccion': _preparar_traduccion,
+    'imagen': _preparar_imagen
+}
+
+
+def _elegir_modelo(nombre, modo):
+    """
+    Devuelve (model_id, es_tiny) según el modo pedido y la caché local
+    """
+    real = MODELOS_REALES[nombre]
+    archivo = "model_index.json" if nombre == 'imagen' else "config.json"
+    if modo == 'reales' or (modo == 'auto' and modelo_en_cache(real, archivo)):
+        return real, False
+    if nombre == 'imagen':
+        return "tiny/stable-diffusion", True
+    return crear_modelo_tiny(nombre), True
+
+
+def medir_tarea(nombre, opciones):
+    """
+    Ejecuta el calentamiento y las repeticiones de una tarea
+    """
+    model_id, es_tiny = _elegir_modelo(nombre, opciones.modelos)
+    opciones.modelo_tiny = es_tiny
+
+    with MuestreadorRSS() as muestreador:
+        rss_inicial = muestreador.pico_mb
+        inicio = time.perf_counter()
+        ejecutar, elementos = TAREAS_BENCHMARK[nombre](model_id, opciones)
+        segundos_carga = time.perf_counter() - inicio
+
+        for _ in range(opciones.calentamiento):
+            ejecutar()
+
+        latencias = []
+        for _ in range(opciones.repeticiones):
+            inicio = time.perf_counter()
+            ejecutar()
+            latencias.append(time.perf_counter() - inicio)
+
+    total = sum(latencias)
+    return {
+        'tarea': nombre,
+        'modelo': model_id,
+        'tiny': es_tiny,
+        'elementos_por_llamada': elementos,
+        'repeticiones': len(latencias),
+        'segundos_carga': segundos_carga,
+        'latencia_ms': {
+            'media': total / len(latencias) * 1000,
+            'p50': percentil(latencias, 50) * 1000,
+            'p95': percentil(latencias, 95) * 1000,
+            'p99': percentil(latencias, 99) * 1000
+        },
+        'elementos_por_segundo': elementos * len(latencias) / total if total > 0 else 0.0,
+        'rss_inicial_mb': rss_inicial,
+        'rss_pico_mb': muestreador.pico_mb
+    }
+
+
+def entorno():
+    """
+    Versiones y hardware con los que se ejecutó el benchmark
+    """
+    return {
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'torch': torch.__version__,
+        'transformers': transformers.__version__,
+        'hilos_torch': torch.get_num_threads(),
+        'cuda': torch.cuda.is_available()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de las tareas del proyecto")
+    parser.add_argument('--tareas', nargs='*', choices=list(TAREAS_BENCHMARK), default=list(TAREAS_BENCHMARK))
+    parser.add_argument('--modelos', choices=['auto', 'tiny', 'reales'], default='auto',
+                        help="tiny: pesos aleatorios locales; reales: checkpoints de los "
+                             "ejemplos; auto: reales si están en caché (default)")
+    parser.add_argument('--calentamiento', type=int, default=2)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--tamano-lote', type=int, default=8,
+                        help="Entradas por llamada al pipeline (default=8)")
+    parser.add_argument('--tokens-nuevos', type=int, default=16,
+                        help="Tokens generados en generación y traducción (default=16)")
+    parser.add_argument('--pasos-difusion', type=int, default=2,
+                        help="Pasos de inferencia de Stable Diffusion (default=2)")
+    parser.add_argument('--json', help="Guardar los resultados en un archivo JSON ('-' = stdout)")
+    opciones = parser.parse_args(argv)
+    if opciones.repeticiones < 1:
+        parser.error("--repeticiones debe ser al menos 1")
+
+    silencioso = opciones.json == '-'
+    salida = sys.stderr if silencioso else sys.stdout
+    print("📊 BENCHMARK DE TAREAS", file=salida)
+    print("=" * 60, file=salida)
+
+    resultados = []
+    for nombre in opciones.tareas:
+        try:
+            resultado = medir_tarea(nombre, opciones)
+        except Exception as e:
+            print(f"❌ {nombre}: {e}", file=salida)
+            resultados.append({'tarea': nombre, 'error': str(e)})
+            continue
+        finally:
+            # Cada tarea parte de un registro vacío para medir su propia memoria
+            obtener_registro().limpiar()
+        resultados.append(resultado)
+
+        latencia = resultado['latencia_ms']
+        print(f"\n🔹 {nombre} ({resultado['modelo']})", file=salida)
+        print(f"   p50 {latencia['p50']:.1f} ms | p95 {latencia['p95']:.1f} ms | "
+              f"p99 {latencia['p99']:.1f} ms", file=salida)
+        print(f"   {resultado['elementos_por_segundo']:.1f} elementos/s | "
+              f"pico RSS {resultado['rss_pico_mb']:.0f} MB", file=salida)
+
+    informe = {
+        'entorno': entorno(),
+        'parametros': {
+            'modelos': opciones.modelos,
+            'calentamiento': opciones.calentamiento,
+            'repeticiones': opciones.repeticiones,
+            'tamano_lote': opciones.tamano_lote,
+            'tokens_nuevos': opciones.tokens_nuevos,
+            'pasos_difusion': opciones.pasos_difusion
+        },
+        'resultados': resultados,
+        'rss_pico_proceso_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+    if silencioso:
+        json.dump(informe, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    elif opciones.json:
+        with open(opciones.json, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en {opciones.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+La deduplicación por defecto solo agrupa textos iguales tras normalizar: las
+negaciones cambian pocos n-gramas y no deben heredar el resultado de la
+frase afirmativa.
+"""
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from dedup import UMBRAL_CASI_DUPLICADOS, Deduplicador
+
+NEGACIONES = [
+    "La película fue excelente",
+    "La película no fue excelente",
+    "No llegó a tiempo y el embalaje venía roto, no lo recomiendo",
+    "No llegó a tiempo y el embalaje venía roto, lo recomiendo",
+]
+
+
+@pytest.mark.parametrize("deduplicador", [Deduplicador(), Deduplicador(UMBRAL_CASI_DUPLICADOS)])
+def test_negaciones_no_se_agrupan(deduplicador):
+    representantes, asignacion = deduplicador.agrupar(NEGACIONES)
+    assert representantes == [0, 1, 2, 3]
+    assert asignacion == [0, 1, 2, 3]
+
+
+def test_por_defecto_solo_duplicados_exactos_tras_normalizar():
+    textos = ["¡Me encanta!", "me encanta!!", "Me  encanta", "Me encanta este producto @ana",
+              "Me encanta este producto @luis"]
+    deduplicador = Deduplicador()
+    representantes, asignacion = deduplicador.agrupar(textos)
+    assert representantes == [0, 3, 4]
+    assert asignacion == [0, 0, 0, 1, 2]
+    assert deduplicador.estadisticas()['casi_duplicados'] == 0
+
+
+def test_casi_duplicados_opcionales():
+    texto = ("El servicio al cliente respondió rápido y resolvió el problema del envío sin coste adicional. "
+             "El paquete llegó dos días después, bien embalado y con todas las piezas; la batería dura toda "
+             "la jornada y la pantalla se ve perfecta incluso al sol. Muy contento con la compra, repetiría "
+             "sin dudarlo")
+    textos = [texto, texto + " @ana", "RT " + texto, texto.replace("Muy contento", "No estoy contento")]
+    assert Deduplicador().agrupar(textos)[0] == [0, 1, 2, 3]
+    representantes, asignacion = Deduplicador(UMBRAL_CASI_DUPLICADOS).agrupar(textos)
+    assert representantes == [0, 3]
+    assert asignacion == [0, 0, 0, 1]
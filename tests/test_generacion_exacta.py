@@ -0,0 +1,123 @@
+"""
+Las rutas de generación propias (lotes con relleno a la izquierda, muestreo
+por fila, caché de prefijos y decodificación especulativa) deben dar en
+greedy exactamente lo mismo que `generate(do_sample=False)`. Se usa un GPT-2 diminuto con pesos aleatorios
+y un tokenizer de palabras creado aquí, sin descargas.
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from batched_generation import generar_por_lotes
+from prefix_cache import CachePrefijos
+from speculative_decoding import generar_especulativo
+
+PALABRAS = ("hola mundo el la un una de que y en los se del las por con para es al lo como más "
+            "pero sus le ya o este sí porque esta entre cuando muy sin sobre también me hasta hay "
+            "donde quien desde todo nos durante todos uno les ni contra otros ese eso ante ellos").split()
+
+PROMPTS = [
+    "hola mundo",
+    "el perro de la casa se",
+    "hola mundo el la un",
+    "que y en los se del las por con para es",
+]
+
+MAX_NUEVOS = 10
+
+
+def crear_tokenizer():
+    vocabulario = {"<pad>": 0, "<unk>": 1, "</s>": 2}
+    for palabra in PALABRAS:
+        vocabulario.setdefault(palabra, len(vocabulario))
+    base = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocabulario, unk_token="<unk>"))
+    base.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    return transformers.PreTrainedTokenizerFast(tokenizer_object=base, pad_token="<pad>",
+                                                eos_token="</s>", unk_token="<unk>")
+
+
+def crear_modelo(tokenizer, capas, semilla):
+    torch.manual_seed(semilla)
+    config = transformers.GPT2Config(vocab_size=len(tokenizer), n_positions=64, n_embd=32,
+                                     n_layer=capas, n_head=2, bos_token_id=2, eos_token_id=2,
+                                     pad_token_id=0,
+                                     # Con la inicialización por defecto greedy repite una sola palabra
+                                     initializer_range=0.5)
+    return transformers.GPT2LMHeadModel(config).eval()
+
+
+@pytest.fixture(scope="module")
+def generador():
+    tokenizer = crear_tokenizer()
+    return transformers.pipeline("text-generation", model=crear_modelo(tokenizer, 2, 0),
+                                 tokenizer=tokenizer)
+
+
+def referencia(generador, prompt, **parametros):
+    """
+    Texto nuevo de generate greedy con el prompt solo (sin relleno)
+    """
+    tokenizer = generador.tokenizer
+    entradas = tokenizer(prompt, return_tensors="pt")
+    with torch.inference_mode():
+        salida = generador.model.generate(**entradas, max_new_tokens=MAX_NUEVOS, do_sample=False,
+                                          pad_token_id=tokenizer.pad_token_id, **parametros)
+    return tokenizer.decode(salida[0, entradas['input_ids'].shape[1]:], skip_special_tokens=True)
+
+
+@pytest.mark.parametrize("parametros", [{}, {'repetition_penalty': 1.5}])
+def test_lotes_igual_que_generate(generador, parametros):
+    # Prompts de longitudes distintas en un mismo lote: las filas cortas llevan relleno
+    resultados, _ = generar_por_lotes(generador, PROMPTS, max_new_tokens=MAX_NUEVOS,
+                                      tamano_lote=4, do_sample=False, **parametros)
+    for prompt, grupo in zip(PROMPTS, resultados):
+        assert grupo[0]['generated_text'] == prompt + referencia(generador, prompt, **parametros)
+
+
+def test_muestreo_por_fila_greedy_igual_que_generate(generador):
+    parametros = [{'do_sample': False}, {'do_sample': False, 'repetition_penalty': 1.5},
+                  {'temperature': 0}, {'do_sample': False, 'repetition_penalty': 1.2}]
+    resultados, _ = generar_por_lotes(generador, PROMPTS, max_new_tokens=MAX_NUEVOS, tamano_lote=4,
+                                      parametros_por_prompt=parametros)
+    for prompt, propios, grupo in zip(PROMPTS, parametros, resultados):
+        penalizacion = {clave: valor for clave, valor in propios.items() if clave == 'repetition_penalty'}
+        assert grupo[0]['generated_text'] == prompt + referencia(generador, prompt, **penalizacion)
+
+
+def test_cache_prefijos_igual_que_generate(generador):
+    cache = CachePrefijos()
+    # Prompts repetidos y con prefijo común; la segunda pasada sale entera de la caché
+    prompts = PROMPTS + [PROMPTS[0], PROMPTS[2]]
+    for _ in range(2):
+        resultados, _ = generar_por_lotes(generador, prompts, num_return_sequences=2,
+                                          max_new_tokens=MAX_NUEVOS, cache_prefijos=cache,
+                                          do_sample=False, repetition_penalty=1.3)
+        for prompt, grupo in zip(prompts, resultados):
+            esperado = prompt + referencia(generador, prompt, repetition_penalty=1.3)
+            assert [secuencia['generated_text'] for secuencia in grupo] == [esperado, esperado]
+    estadisticas = cache.estadisticas()
+    assert estadisticas['aciertos'] > 0 and estadisticas['aciertos_parciales'] > 0
+
+
+@pytest.mark.parametrize("parametros", [{}, {'repetition_penalty': 1.3}])
+def test_especulativa_greedy_igual_que_generate(generador, parametros):
+    # Borrador con otros pesos: acierta poco, así que se ejercitan aceptaciones y rechazos
+    borrador = crear_modelo(generador.tokenizer, 1, 1)
+    for prompt in PROMPTS:
+        for tokens_borrador in (1, 3, 5):
+            texto, estadisticas = generar_especulativo(generador, borrador, prompt, max_new_tokens=MAX_NUEVOS,
+                                                       tokens_borrador=tokens_borrador, do_sample=False,
+                                                       **parametros)
+            assert texto == prompt + referencia(generador, prompt, **parametros)
+            assert estadisticas['tokens_nuevos'] <= MAX_NUEVOS
+
+
+def test_especulativa_con_el_mismo_modelo_acepta_todo(generador):
+    prompt = PROMPTS[1]
+    texto, estadisticas = generar_especulativo(generador, generador.model, prompt, max_new_tokens=MAX_NUEVOS,
+                                               tokens_borrador=4, do_sample=False)
+    assert texto == prompt + referencia(generador, prompt)
+    assert estadisticas['tasa_aceptacion'] == 1.0
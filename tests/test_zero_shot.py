@@ -0,0 +1,52 @@
+"""
+MotorZeroShot debe puntuar igual que el pipeline de zero-shot aunque el
+tokenizer compartido venga de una llamada con relleno o truncado. Usa el
+modelo NLI diminuto de task_benchmark.py, sin descargas.
+"""
+
+import pytest
+
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("tokenizers")
+
+from task_benchmark import CATEGORIAS, TEXTOS, crear_modelo_tiny
+from zero_shot import PLANTILLA_HIPOTESIS, MotorZeroShot
+
+
+@pytest.fixture(scope="module")
+def clasificador(tmp_path_factory):
+    ruta = crear_modelo_tiny("zero-shot", tmp_path_factory.mktemp("tiny"))
+    return transformers.pipeline("zero-shot-classification", model=ruta, device=-1)
+
+
+def comparar(clasificador, motor, multi_label=False):
+    # Los pares deben ser los que el tokenizer construye para (texto, hipótesis)
+    hipotesis = motor._tokenizar_hipotesis(CATEGORIAS, PLANTILLA_HIPOTESIS)
+    pares = motor._codificar_pares(TEXTOS, [CATEGORIAS] * len(TEXTOS), hipotesis)
+    esperados = [clasificador.tokenizer(texto, PLANTILLA_HIPOTESIS.format(categoria), truncation="only_first")
+                 for texto in TEXTOS for categoria in CATEGORIAS]
+    assert [par['input_ids'] for par in pares] == [esperado['input_ids'] for esperado in esperados]
+    assert all(all(par['attention_mask']) for par in pares)
+
+    # El modelo diminuto da scores casi uniformes: se comparan por categoría, no por orden
+    esperados = clasificador(TEXTOS, candidate_labels=CATEGORIAS, multi_label=multi_label)
+    obtenidos = motor.clasificar(TEXTOS, CATEGORIAS, multi_label=multi_label)
+    for esperado, obtenido in zip(esperados, obtenidos):
+        assert dict(zip(obtenido['labels'], obtenido['scores'])) == pytest.approx(
+            dict(zip(esperado['labels'], esperado['scores'])), abs=1e-5)
+
+
+@pytest.mark.parametrize("llamada_previa", [
+    # El pipeline rellena los pares de cada texto
+    lambda clasificador: clasificador("hola", candidate_labels=CATEGORIAS),
+    lambda clasificador: clasificador.tokenizer(TEXTOS, padding=True, truncation=True, max_length=6),
+    lambda clasificador: clasificador.tokenizer(TEXTOS, padding="max_length", max_length=40),
+])
+def test_motor_igual_que_pipeline_tras_otra_llamada(clasificador, llamada_previa):
+    motor = MotorZeroShot(clasificador)
+    llamada_previa(clasificador)
+    comparar(clasificador, motor)
+    # Las hipótesis guardadas en la caché tampoco quedan rellenas ni truncadas
+    llamada_previa(clasificador)
+    comparar(clasificador, motor, multi_label=True)
+    assert motor.estadisticas()['aciertos_hipotesis'] > 0
@@ -7,19 +7,56 @@ Este script demuestra diferentes técnicas de clasificación de texto
 usando modelos preentrenados y fine-tuning con Hugging Face.
 """
 
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-from transformers import TrainingArguments, Trainer
-from datasets import Dataset, load_dataset
-import torch
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import classification_report, confusion_matrix
-from sklearn.model_selection import train_test_split
 import warnings
 warnings.filterwarnings('ignore')
 
+from lazy_imports import importar_perezoso
+from model_registry import obtener_pipeline
+from batch_scoring import puntuar_por_lotes, puntuar_columnar
+from inference_cache import obtener_cache
+from zero_shot import obtener_motor_zero_shot, obtener_prefiltro
+from cascade import CascadaClasificacion, evaluar_cascada, mapeo_modelo, mostrar_evaluacion
+from language_id import obtener_detector
+from head_training import barrido, embeddings_en_cache, entrenar_modelo
+from tokenization_cache import dataset_etiquetado, obtener_cache_tokenizacion
+from streaming_metrics import MetricasIncrementales, mostrar_resumen
+from long_documents import clasificar_documentos_largos
+from result_sink import SumideroParquet
+
+# Con más categorías que este umbral, solo las K más parecidas al texto
+# (según un modelo de embeddings) pasan por el modelo NLI
+UMBRAL_PREFILTRO = 20
+K_PREFILTRO = 10
+
+# Solo se importan al crear las visualizaciones
+np = importar_perezoso("numpy")
+pd = importar_perezoso("pandas")
+plt = importar_perezoso("matplotlib.pyplot")
+
+# Reseñas etiquetadas usadas en la clasificación personalizada y la cascada
+DATOS_RESENAS = [
+    # Reviews positivos
+    ("Este producto es fantástico, lo recomiendo totalmente", "positivo"),
+    ("Excelente calidad, superó mis expectativas", "positivo"),
+    ("Me encanta, definitivamente volveré a comprar", "positivo"),
+    ("Muy buena experiencia de compra, rápido y eficiente", "positivo"),
+    ("Producto de alta calidad, vale la pena el precio", "positivo"),
+    
+    # Reviews negativos
+    ("Terrible producto, no funciona como se describe", "negativo"),
+    ("Muy decepcionante, perdí mi dinero", "negativo"),
+    ("Pésima calidad, se rompió al primer uso", "negativo"),
+    ("No lo recomiendo para nada, muy malo", "negativo"),
+    ("Servicio al cliente horrible, nunca más compro aquí", "negativo"),
+    
+    # Reviews neutros
+    ("El producto está bien, nada especial", "neutral"),
+    ("Cumple su función básica, precio justo", "neutral"),
+    ("No está mal pero tampoco es extraordinario", "neutral"),
+    ("Producto promedio, hay mejores opciones", "neutral"),
+    ("Funciona correctamente, sin más", "neutral")
+]
+
 def clasificacion_basica_zero_shot():
     """
     Ejemplo de clasificación zero-shot (sin entrenamiento previo)
@@ -27,10 +64,9 @@ def clasificacion_basica_zero_shot():
     print("🚀 Clasificación Zero-Shot...")
     
     # Crear pipeline de clasificación zero-shot
-    classifier = pipeline(
+    classifier = obtener_pipeline(
         "zero-shot-classification",
-        model="facebook/bart-large-mnli",
-        device=0 if torch.cuda.is_available() else -1
+        "facebook/bart-large-mnli"
     )
     
     # Textos de ejemplo
@@ -56,8 +92,16 @@ def clasificacion_basica_zero_shot():
     
     resultados = []
     
-    for i, texto in enumerate(textos, 1):
-        resultado = classifier(texto, categorias)
+    # Clasificar solo los textos que no están en la caché de resultados,
+    # con todos los pares (texto, categoría) en lotes
+    motor = obtener_motor_zero_shot(classifier)
+    resultados_modelo = obtener_cache().obtener_o_calcular_lote(
+        "zero-shot-classification", classifier, textos,
+        lambda pendientes: motor.clasificar(pendientes, categorias),
+        parametros={'candidate_labels': categorias}
+    )
+    
+    for i, (texto, resultado) in enumerate(zip(textos, resultados_modelo), 1):
         
         categoria_principal = resultado['labels'][0]
         confianza_principal = resultado['scores'][0] * 100
@@ -81,6 +125,12 @@ def clasificacion_basica_zero_shot():
             'todas_confianzas': resultado['scores']
         })
     
+    # Esquema estable de zero-shot en Parquet (confianza en [0, 1])
+    with SumideroParquet('zero-shot') as sumidero:
+        sumidero.escribir([{**resultado, 'confianza': resultado['confianza'] / 100}
+                           for resultado in resultados])
+    print(f"💾 Resultados añadidos a {sumidero.directorio}")
+    
     return resultados
 
 def clasificacion_emociones():
@@ -90,10 +140,9 @@ def clasificacion_emociones():
     print("😊 Clasificación de Emociones...")
     
     # Pipeline especializado en emociones
-    emotion_classifier = pipeline(
+    emotion_classifier = obtener_pipeline(
         "text-classification",
-        model="j-hartmann/emotion-english-distilroberta-base",
-        device=0 if torch.cuda.is_available() else -1
+        "j-hartmann/emotion-english-distilroberta-base"
     )
     
     # Textos con diferentes emociones
@@ -112,8 +161,11 @@ def clasificacion_emociones():
     
     emociones_detectadas = []
     
-    for i, texto in enumerate(textos_emocionales, 1):
-        resultado = emotion_classifier(texto)
+    resultados_modelo, _ = puntuar_por_lotes(emotion_classifier, textos_emocionales,
+                                             cache=obtener_cache(),
+                                             cache_tokenizacion=obtener_cache_tokenizacion())
+    
+    for i, (texto, resultado) in enumerate(zip(textos_emocionales, resultados_modelo), 1):
         
         # Obtener todas las emociones con sus scores
         emociones = [(r['label'], r['score']) for r in resultado]
@@ -138,6 +190,41 @@ def clasificacion_emociones():
     
     return emociones_detectadas
 
+def clasificacion_emociones_documentos_largos():
+    """
+    Emociones en transcripciones largas: ventanas solapadas en vez de truncar
+    """
+    print("📜 Clasificación de Emociones en Documentos Largos...")
+    
+    emotion_classifier = obtener_pipeline(
+        "text-classification",
+        "j-hartmann/emotion-english-distilroberta-base"
+    )
+    
+    # Transcripciones de soporte simuladas: la queja aparece al final,
+    # más allá de los 512 tokens que vería el modelo con truncado
+    saludo = "Agent: Thank you for calling, how can I help you today? Customer: Hi, I have a question. " * 30
+    transcripciones = [
+        saludo + "Customer: This is the third time my order arrives broken, I am furious and I want a refund now!",
+        saludo + "Customer: You solved it in five minutes, thank you so much, I'm really happy with the service!",
+        "Customer: I'm worried my package got lost, it was a gift for tomorrow."
+    ]
+    
+    longitud_maxima = min(emotion_classifier.tokenizer.model_max_length, 512)
+    for agregacion in ('media', 'maximo'):
+        resultados, estadisticas = clasificar_documentos_largos(
+            emotion_classifier, transcripciones, solapamiento=64, agregacion=agregacion,
+            cache=obtener_cache()
+        )
+        print(f"\n🔎 Agregación '{agregacion}' ({estadisticas['ventanas']} ventanas de hasta "
+              f"{longitud_maxima} tokens en {estadisticas['lotes']} lotes):")
+        for i, resultado in enumerate(resultados, 1):
+            principal = resultado['etiquetas'][0]
+            print(f"   {i}. {resultado['ventanas']} ventana(s) → {principal['label']} "
+                  f"({principal['score'] * 100:.1f}%)")
+    
+    return resultados
+
 def clasificacion_idioma():
     """
     Ejemplo de detección de idioma
@@ -156,12 +243,9 @@ def clasificacion_idioma():
         "你好，你今天怎么样？"
     ]
     
-    # Usar pipeline de clasificación con modelo de detección de idioma
-    language_detector = pipeline(
-        "text-classification",
-        model="papluca/xlm-roberta-base-language-detection",
-        device=0 if torch.cuda.is_available() else -1
-    )
+    # Detector de n-gramas; con un perfil entrenado (language_id.py --entrenar)
+    # solo los textos dudosos pasan por papluca/xlm-roberta-base-language-detection
+    language_detector = obtener_detector()
     
     print("\n🔍 Detectando idiomas:")
     print("-" * 50)
@@ -173,16 +257,23 @@ def clasificacion_idioma():
         'pt': 'Portugués', 'ar': 'Árabe', 'hi': 'Hindi', 'ko': 'Coreano'
     }
     
-    for i, texto in enumerate(textos_multiidioma, 1):
-        resultado = language_detector(texto)
+    resultados_modelo = language_detector.detectar(textos_multiidioma, cache=obtener_cache())
+    
+    for i, (texto, resultado) in enumerate(zip(textos_multiidioma, resultados_modelo), 1):
         
-        codigo_idioma = resultado[0]['label']
-        confianza = resultado[0]['score'] * 100
+        codigo_idioma = resultado['label']
+        # Los n-gramas de un perfil sin validar no tienen confianza medida
+        confianza = f"{resultado['score'] * 100:.1f}%" if resultado['score'] is not None else "-"
         nombre_idioma = idiomas.get(codigo_idioma, codigo_idioma)
+        fuente = "n-gramas" if resultado['fuente'] == 'ngramas' else "transformer"
         
         print(f"{i}. '{texto}'")
-        print(f"   → {nombre_idioma} ({codigo_idioma}) - {confianza:.1f}%")
+        print(f"   → {nombre_idioma} ({codigo_idioma}) - {confianza} [{fuente}]")
         print()
+    
+    estadisticas = language_detector.estadisticas()
+    print(f"⚡ Resueltos por n-gramas: {estadisticas['ngramas']}/{estadisticas['textos']} "
+          f"({estadisticas['us_por_texto_ngramas']:.0f} µs/texto)")
 
 def clasificacion_personalizada_con_datos():
     """
@@ -191,32 +282,12 @@ def clasificacion_personalizada_con_datos():
     print("🎯 Clasificación con Datos Personalizados...")
     
     # Crear dataset de ejemplo para clasificación de reviews
-    datos_ejemplo = [
-        # Reviews positivos
-        ("Este producto es fantástico, lo recomiendo totalmente", "positivo"),
-        ("Excelente calidad, superó mis expectativas", "positivo"),
-        ("Me encanta, definitivamente volveré a comprar", "positivo"),
-        ("Muy buena experiencia de compra, rápido y eficiente", "positivo"),
-        ("Producto de alta calidad, vale la pena el precio", "positivo"),
-        
-        # Reviews negativos
-        ("Terrible producto, no funciona como se describe", "negativo"),
-        ("Muy decepcionante, perdí mi dinero", "negativo"),
-        ("Pésima calidad, se rompió al primer uso", "negativo"),
-        ("No lo recomiendo para nada, muy malo", "negativo"),
-        ("Servicio al cliente horrible, nunca más compro aquí", "negativo"),
-        
-        # Reviews neutros
-        ("El producto está bien, nada especial", "neutral"),
-        ("Cumple su función básica, precio justo", "neutral"),
-        ("No está mal pero tampoco es extraordinario", "neutral"),
-        ("Producto promedio, hay mejores opciones", "neutral"),
-        ("Funciona correctamente, sin más", "neutral")
-    ]
+    datos_ejemplo = DATOS_RESENAS
+    dataset = dataset_etiquetado(datos_ejemplo)
     
     # Separar textos y etiquetas
-    textos = [dato[0] for dato in datos_ejemplo]
-    etiquetas = [dato[1] for dato in datos_ejemplo]
+    textos = list(dataset['texto'])
+    etiquetas = list(dataset['etiqueta'])
     
     print(f"\n📊 Dataset de ejemplo creado:")
     print(f"   Total de muestras: {len(datos_ejemplo)}")
@@ -228,41 +299,96 @@ def clasificacion_personalizada_con_datos():
         print(f"   {etiqueta}: {cantidad} muestras")
     
     # Usar modelo preentrenado para clasificar estos textos
-    classifier = pipeline(
+    classifier = obtener_pipeline(
         "sentiment-analysis",
-        model="nlptown/bert-base-multilingual-uncased-sentiment",
-        device=0 if torch.cuda.is_available() else -1
+        "nlptown/bert-base-multilingual-uncased-sentiment"
     )
     
     print("\n🔬 Clasificando con modelo preentrenado:")
     print("-" * 60)
     
-    predicciones = []
-    etiquetas_reales = []
-    
-    for texto, etiqueta_real in datos_ejemplo:
-        resultado = classifier(texto)
-        prediccion = resultado[0]
-        
-        # Mapear etiquetas del modelo a nuestras etiquetas
-        mapeo_etiquetas = {
-            'LABEL_1': 'muy_negativo', 'LABEL_2': 'negativo', 'LABEL_3': 'neutral',
-            'LABEL_4': 'positivo', 'LABEL_5': 'muy_positivo',
-            'NEGATIVE': 'negativo', 'POSITIVE': 'positivo'
-        }
-        
-        etiqueta_predicha = mapeo_etiquetas.get(prediccion['label'], prediccion['label'])
-        confianza = prediccion['score'] * 100
-        
+    # Los ids tokenizados se guardan en Arrow y se reutilizan entre ejecuciones;
+    # el postproceso (mapeo de etiquetas, porcentajes) es vectorizado. No se
+    # deduplica: es un conjunto de evaluación y cada reseña cuenta
+    columnares, _ = puntuar_columnar(classifier, textos, cache=obtener_cache(),
+                                     cache_tokenizacion=obtener_cache_tokenizacion())
+    # Etiquetas del modelo ("1 star".."5 stars") → clases de DATOS_RESENAS
+    mapeo = mapeo_modelo(classifier.model.config)
+    predicciones = columnares.nombres(
+        mapeo={etiqueta: mapeo[etiqueta.lower()] for etiqueta in columnares.etiquetas
+               if etiqueta.lower() in mapeo}
+    ).tolist()
+    confianzas = columnares.confianzas() * 100
+    etiquetas_reales = etiquetas
+    
+    for texto, etiqueta_real, etiqueta_predicha, confianza in zip(textos, etiquetas_reales,
+                                                                  predicciones, confianzas):
         print(f"Texto: {texto[:50]}...")
         print(f"Real: {etiqueta_real} | Predicho: {etiqueta_predicha} ({confianza:.1f}%)")
         print()
-        
-        predicciones.append(etiqueta_predicha)
-        etiquetas_reales.append(etiqueta_real)
+    
+    # Matriz de confusión y métricas por clase (con archivos grandes, ver
+    # streaming_metrics.py: se actualizan lote a lote con memoria constante)
+    metricas = MetricasIncrementales(sorted(set(etiquetas)))
+    metricas.actualizar(etiquetas_reales, predicciones)
+    mostrar_resumen(metricas.resumen())
     
     return predicciones, etiquetas_reales
 
+def clasificacion_en_cascada():
+    """
+    Cascada: modelo rápido y escalado al modelo grande solo si hay duda
+    """
+    print("🪜 Clasificación en Cascada...")
+    
+    textos = [dato[0] for dato in DATOS_RESENAS]
+    etiquetas = [dato[1] for dato in DATOS_RESENAS]
+    
+    cascada = CascadaClasificacion(umbral=0.8)
+    temperatura = cascada.calibrar(textos, etiquetas)
+    print(f"   Modelo rápido: {cascada.modelo_rapido}")
+    print(f"   Modelo preciso: {cascada.modelo_preciso}")
+    print(f"   Temperatura calibrada del modelo rápido: {temperatura:.2f}")
+    
+    resultados, estadisticas = cascada.clasificar(textos, cache=obtener_cache())
+    print(f"\n🔬 Umbral {cascada.umbral:.2f}: {estadisticas['escalados']}/{estadisticas['textos']} "
+          f"textos escalados al modelo preciso ({estadisticas['fraccion_escalada'] * 100:.0f}%)")
+    for texto, etiqueta_real, resultado in zip(textos, etiquetas, resultados):
+        emoji = "⚡" if resultado['etapa'] == 'rapido' else "🐢"
+        print(f"{emoji} {texto[:45]}... | Real: {etiqueta_real} | "
+              f"Predicho: {resultado['label']} ({resultado['score'] * 100:.1f}%)")
+    
+    # Exactitud frente a latencia para varios umbrales
+    filas = evaluar_cascada(cascada, textos, etiquetas)
+    mostrar_evaluacion(filas)
+    return filas
+
+def clasificacion_con_cabeza_entrenada():
+    """
+    Fine-tuning barato: cabeza lineal sobre embeddings congelados y reutilizados
+    """
+    print("🧠 Entrenamiento de una Cabeza sobre Embeddings Congelados...")
+    
+    textos = [dato[0] for dato in DATOS_RESENAS]
+    etiquetas = [dato[1] for dato in DATOS_RESENAS]
+    
+    # El codificador solo se ejecuta la primera vez; después se lee el .npy
+    embeddings = embeddings_en_cache(textos)
+    print(f"   Embeddings: {embeddings.shape[0]}×{embeddings.shape[1]} ({embeddings.filename})")
+    
+    for fila in barrido(embeddings, etiquetas, decaimientos=(0.0, 0.01, 0.1)):
+        exactitud = fila['exactitud_validacion'] or 0.0
+        print(f"   Decaimiento {fila['decaimiento']:<5} → validación {exactitud * 100:.1f}% "
+              f"({fila['segundos_entrenamiento']:.2f}s)")
+    
+    modelo = entrenar_modelo(textos, etiquetas)
+    print("\n🔬 Predicciones de la cabeza entrenada:")
+    print("-" * 60)
+    nuevas = ["Me encantó, lo recomiendo a todos", "Llegó roto y nadie responde"]
+    for texto, prediccion in zip(nuevas, modelo(nuevas)):
+        print(f"{texto} → {prediccion[0]['label']} ({prediccion[0]['score'] * 100:.1f}%)")
+    return modelo
+
 def visualizar_resultados_clasificacion(resultados):
     """
     Crear visualizaciones de los resultados de clasificación
@@ -351,12 +477,18 @@ def ejemplo_interactivo_clasificacion():
         print(f"Categorías definidas: {categorias}")
     
     # Inicializar clasificador
-    classifier = pipeline(
+    classifier = obtener_pipeline(
         "zero-shot-classification",
-        model="facebook/bart-large-mnli",
-        device=0 if torch.cuda.is_available() else -1
+        "facebook/bart-large-mnli"
     )
     
+    # Las hipótesis de las categorías se tokenizan una sola vez por sesión
+    motor = obtener_motor_zero_shot(classifier)
+    prefiltro = None
+    if len(categorias) > UMBRAL_PREFILTRO:
+        print(f"🔎 Muchas categorías: solo las {K_PREFILTRO} más parecidas a cada texto pasarán por el modelo NLI")
+        prefiltro = obtener_prefiltro()
+    
     print(f"\n🔄 Clasificador listo con {len(categorias)} categorías")
     print("Ahora ingresa textos para clasificar:")
     
@@ -369,7 +501,10 @@ def ejemplo_interactivo_clasificacion():
         
         try:
             print("🔄 Clasificando...")
-            resultado = classifier(texto, categorias)
+            if prefiltro is not None:
+                resultado = motor.clasificar_en_dos_etapas(texto, categorias, prefiltro, K_PREFILTRO)[0]
+            else:
+                resultado = motor.clasificar(texto, categorias)[0]
             
             print(f"\n🎯 Resultados para: '{texto}'")
             print("-" * 50)
@@ -404,16 +539,28 @@ def main():
         print("\n2️⃣  Ejecutando clasificación de emociones...")
         clasificacion_emociones()
         
+        # Emociones en documentos largos
+        print("\n3️⃣  Ejecutando clasificación de documentos largos...")
+        clasificacion_emociones_documentos_largos()
+        
         # Detección de idioma
-        print("\n3️⃣  Ejecutando detección de idioma...")
+        print("\n4️⃣  Ejecutando detección de idioma...")
         clasificacion_idioma()
         
         # Clasificación con datos personalizados
-        print("\n4️⃣  Ejecutando clasificación personalizada...")
+        print("\n5️⃣  Ejecutando clasificación personalizada...")
         clasificacion_personalizada_con_datos()
         
+        # Cascada de modelos por confianza
+        print("\n6️⃣  Ejecutando clasificación en cascada...")
+        clasificacion_en_cascada()
+        
+        # Cabeza entrenada sobre embeddings congelados
+        print("\n7️⃣  Entrenando una cabeza sobre embeddings congelados...")
+        clasificacion_con_cabeza_entrenada()
+        
         # Visualizaciones
-        print("\n5️⃣  Creando visualizaciones...")
+        print("\n8️⃣  Creando visualizaciones...")
         visualizar_resultados_clasificacion(resultados_zero_shot)
         
         # Modo interactivo
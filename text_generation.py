@@ -7,11 +7,19 @@ Este script demuestra diferentes técnicas de generación de texto
 usando modelos preentrenados de Hugging Face.
 """
 
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM, set_seed
-import torch
+import os
 import time
 from typing import List, Dict
 
+from lazy_imports import importar_perezoso
+from model_registry import obtener_pipeline
+from batched_generation import generar_por_lotes, mostrar_estadisticas_generacion
+from prefix_cache import obtener_cache_prefijos
+from streaming_generation import generar_stream, mostrar_metricas_stream
+from speculative_decoding import MODELOS_BORRADOR, comparar_estrategias, mostrar_comparacion
+
+transformers = importar_perezoso("transformers")
+
 def generacion_basica():
     """
     Ejemplo básico de generación de texto usando pipeline
@@ -19,15 +27,13 @@ def generacion_basica():
     print("🚀 Iniciando generación básica de texto...")
     
     # Configurar semilla para reproducibilidad
-    set_seed(42)
+    transformers.set_seed(42)
     
     # Crear pipeline de generación de texto
     # Usando GPT-2 en español
-    generator = pipeline(
+    generator = obtener_pipeline(
         "text-generation",
-        model="datificate/gpt2-small-spanish",
-        tokenizer="datificate/gpt2-small-spanish",
-        device=0 if torch.cuda.is_available() else -1
+        "datificate/gpt2-small-spanish"
     )
     
     # Prompts de ejemplo
@@ -44,23 +50,23 @@ def generacion_basica():
     
     resultados = []
     
-    for i, prompt in enumerate(prompts, 1):
+    # Todos los prompts y sus 2 variantes en una sola llamada a generate
+    print("   Generando...")
+    generaciones, estadisticas = generar_por_lotes(
+        generator,
+        prompts,
+        num_return_sequences=2,
+        max_length=100,
+        temperature=0.8,
+        do_sample=True
+    )
+    
+    for i, (prompt, resultado) in enumerate(zip(prompts, generaciones), 1):
         print(f"\n{i}. Prompt: '{prompt}'")
-        print("   Generando...")
-        
-        # Generar texto
-        resultado = generator(
-            prompt,
-            max_length=100,
-            num_return_sequences=2,
-            temperature=0.8,
-            do_sample=True,
-            pad_token_id=generator.tokenizer.eos_token_id
-        )
         
         for j, generacion in enumerate(resultado, 1):
             texto_generado = generacion['generated_text']
-            texto_nuevo = texto_generado[len(prompt):].strip()
+            texto_nuevo = generacion['texto_nuevo']
             
             print(f"   Opción {j}: {prompt}{texto_nuevo}")
             
@@ -72,31 +78,29 @@ def generacion_basica():
         
         print()
     
+    mostrar_estadisticas_generacion(estadisticas)
+    
     return resultados
 
-def generacion_avanzada_con_parametros():
+def generacion_avanzada_con_parametros(especulativa=False):
     """
-    Ejemplo avanzado mostrando diferentes parámetros de generación
+    Ejemplo avanzado mostrando diferentes parámetros de generación.
+    
+    Con `especulativa=True` repite cada estrategia con decodificación
+    especulativa (modelo borrador pequeño) y muestra aceptación y aceleración.
     """
     print("🔬 Generación avanzada con diferentes parámetros...")
     
     try:
-        # Cargar modelo y tokenizer específicos
+        # Obtener modelo y tokenizer específicos desde el registro
         model_name = "microsoft/DialoGPT-medium"
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = AutoModelForCausalLM.from_pretrained(model_name)
+        generator = obtener_pipeline("text-generation", model_name)
+        tokenizer = generator.tokenizer
         
         # Añadir pad_token si no existe
         if tokenizer.pad_token is None:
             tokenizer.pad_token = tokenizer.eos_token
         
-        generator = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            device=0 if torch.cuda.is_available() else -1
-        )
-        
         prompt = "The future of artificial intelligence is"
         
         # Diferentes configuraciones de generación
@@ -122,26 +126,57 @@ def generacion_avanzada_con_parametros():
         print(f"\n📊 Comparando diferentes estrategias con prompt: '{prompt}'")
         print("-" * 80)
         
+        # Las estrategias de muestreo y greedy comparten un lote (parámetros
+        # por fila) y un único prefill del prompt (caché de prefijos); beam
+        # search necesita su propia llamada
+        por_fila = [config for config in configuraciones if config['params'].get('num_beams', 1) == 1]
+        cache_prefijos = obtener_cache_prefijos()
+        start_time = time.time()
+        generaciones, _ = generar_por_lotes(
+            generator,
+            [prompt] * len(por_fila),
+            max_length=80,
+            parametros_por_prompt=[config['params'] for config in por_fila],
+            cache_prefijos=cache_prefijos
+        )
+        tiempo_lote = time.time() - start_time
+        textos = {config['nombre']: resultado[0]['generated_text']
+                  for config, resultado in zip(por_fila, generaciones)}
+        
         for config in configuraciones:
             print(f"\n🎯 {config['nombre']}:")
             
-            params = {
-                'max_length': 80,
-                'num_return_sequences': 1,
-                'pad_token_id': tokenizer.eos_token_id,
-                **config['params']
-            }
-            
-            start_time = time.time()
-            resultado = generator(prompt, **params)
-            end_time = time.time()
-            
-            texto_generado = resultado[0]['generated_text']
-            tiempo = end_time - start_time
+            if config['nombre'] in textos:
+                texto_generado = textos[config['nombre']]
+                tiempo = tiempo_lote
+            else:
+                params = {
+                    'max_length': 80,
+                    'num_return_sequences': 1,
+                    'pad_token_id': tokenizer.eos_token_id,
+                    **config['params']
+                }
+                
+                start_time = time.time()
+                resultado = generator(prompt, **params)
+                end_time = time.time()
+                
+                texto_generado = resultado[0]['generated_text']
+                tiempo = end_time - start_time
             
             print(f"   Resultado: {texto_generado}")
-            print(f"   Tiempo: {tiempo:.2f}s")
+            print(f"   Tiempo: {tiempo:.2f}s" + (" (lote compartido)" if config['nombre'] in textos else ""))
             print()
+        
+        estadisticas_cache = cache_prefijos.estadisticas()
+        print(f"🧠 Caché de prefijos: {estadisticas_cache['tokens_reutilizados']} tokens reutilizados, "
+              f"{estadisticas_cache['tokens_calculados']} calculados")
+        
+        if especulativa:
+            modelo_borrador = MODELOS_BORRADOR[model_name]
+            print(f"\n🚀 Decodificación especulativa con borrador '{modelo_borrador}':")
+            borrador = obtener_pipeline("text-generation", modelo_borrador)
+            mostrar_comparacion(comparar_estrategias(generator, borrador, prompt, configuraciones))
             
     except Exception as e:
         print(f"⚠️  Error con modelo avanzado: {e}")
@@ -155,10 +190,9 @@ def generacion_conversacional():
     
     try:
         # Usar modelo conversacional
-        chatbot = pipeline(
+        chatbot = obtener_pipeline(
             "conversational",
-            model="microsoft/DialoGPT-medium",
-            device=0 if torch.cuda.is_available() else -1
+            "microsoft/DialoGPT-medium"
         )
         
         print("\n🤖 Simulando conversación:")
@@ -196,10 +230,9 @@ def generacion_con_control_de_estilo():
     print("🎨 Generación con control de estilo...")
     
     # Usar modelo que permite mejor control
-    generator = pipeline(
+    generator = obtener_pipeline(
         "text-generation",
-        model="gpt2",
-        device=0 if torch.cuda.is_available() else -1
+        "gpt2"
     )
     
     # Prompts con diferentes estilos
@@ -229,22 +262,23 @@ def generacion_con_control_de_estilo():
     print("\n🎭 Generando textos con diferentes estilos:")
     print("-" * 60)
     
-    for estilo_info in estilos:
+    # Todos los estilos en un mismo lote, cada uno con su temperature y top_p
+    generaciones, estadisticas = generar_por_lotes(
+        generator,
+        [estilo_info['prompt'] for estilo_info in estilos],
+        max_length=120,
+        do_sample=True,
+        parametros_por_prompt=[estilo_info['params'] for estilo_info in estilos]
+    )
+    textos_completos = [resultado[0]['generated_text'] for resultado in generaciones]
+    
+    for estilo_info, texto_completo in zip(estilos, textos_completos):
         print(f"\n📝 Estilo: {estilo_info['estilo']}")
         print(f"Prompt: '{estilo_info['prompt']}'")
-        
-        resultado = generator(
-            estilo_info['prompt'],
-            max_length=120,
-            num_return_sequences=1,
-            do_sample=True,
-            pad_token_id=generator.tokenizer.eos_token_id,
-            **estilo_info['params']
-        )
-        
-        texto_completo = resultado[0]['generated_text']
         print(f"Resultado: {texto_completo}")
         print()
+    
+    mostrar_estadisticas_generacion(estadisticas)
 
 def ejemplo_interactivo_generacion():
     """
@@ -256,10 +290,9 @@ def ejemplo_interactivo_generacion():
     print("-" * 50)
     
     # Inicializar generador
-    generator = pipeline(
+    generator = obtener_pipeline(
         "text-generation",
-        model="gpt2",
-        device=0 if torch.cuda.is_available() else -1
+        "gpt2"
     )
     
     while True:
@@ -293,25 +326,27 @@ def ejemplo_interactivo_generacion():
         
         try:
             start_time = time.time()
-            resultados = generator(
-                prompt,
-                max_length=max_length,
-                num_return_sequences=num_sequences,
-                temperature=temperature,
-                do_sample=True,
-                pad_token_id=generator.tokenizer.eos_token_id,
-                top_p=0.9
-            )
-            end_time = time.time()
-            
-            print(f"\n✨ Resultados generados en {end_time - start_time:.2f}s:")
             print("=" * 60)
             
-            for i, resultado in enumerate(resultados, 1):
-                texto_generado = resultado['generated_text']
-                print(f"\n{i}. {texto_generado}")
+            # Cada variación se muestra a medida que se generan sus tokens
+            for i in range(1, num_sequences + 1):
+                print(f"\n{i}. {prompt}", end="", flush=True)
+                streamer = generar_stream(
+                    generator,
+                    prompt,
+                    max_length=max_length,
+                    temperature=temperature,
+                    do_sample=True,
+                    top_p=0.9
+                )
+                for fragmento in streamer:
+                    print(fragmento, end="", flush=True)
+                print()
+                mostrar_metricas_stream(streamer.metricas())
             
+            end_time = time.time()
             print("=" * 60)
+            print(f"✨ Resultados generados en {end_time - start_time:.2f}s")
             
         except Exception as e:
             print(f"❌ Error al generar texto: {e}")
@@ -330,7 +365,9 @@ def main():
         
         # Ejemplo avanzado
         print("\n2️⃣  Ejecutando generación avanzada...")
-        generacion_avanzada_con_parametros()
+        generacion_avanzada_con_parametros(
+            especulativa=os.environ.get("HF_DECODIFICACION_ESPECULATIVA") == "1"
+        )
         
         # Generación conversacional
         print("\n3️⃣  Ejecutando generación conversacional...")
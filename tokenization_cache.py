@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Caché de Tokenización en Arrow
+==============================
+
+Los ejemplos tokenizan los mismos textos en cada ejecución. Este módulo
+pasa los textos nuevos por un `datasets.Dataset`, los tokeniza con `map`
+por lotes y guarda los ids en fragmentos Arrow en disco. Las ejecuciones
+siguientes abren esos fragmentos mapeados en memoria: no se vuelve a
+tokenizar y los ids no ocupan el heap de Python hasta que se lee cada lote.
+
+Hay una carpeta por huella del tokenizer (vocabulario, normalización y
+configuración) y longitud máxima; dentro, cada texto se indexa por su hash,
+de modo que cualquier subconjunto de textos ya tokenizados es un acierto.
+La carpeta tiene un tamaño máximo y se borran primero los fragmentos
+usados hace más tiempo.
+
+La carpeta se configura con HF_CACHE_TOKENIZACION (por defecto
+'.cache_inferencia/tokenizados').
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from lazy_imports import importar_perezoso
+
+datasets = importar_perezoso("datasets")
+
+DIRECTORIO_POR_DEFECTO = os.path.join(".cache_inferencia", "tokenizados")
+COLUMNA_LONGITUD = "longitud"
+COLUMNA_CLAVE = "clave"
+
+
+def huella_tokenizador(tokenizer):
+    """
+    Devuelve un hash que cambia si cambia cómo tokeniza `tokenizer`
+    """
+    huella = getattr(tokenizer, '_huella_tokenizacion', None)
+    if huella is not None:
+        return huella
+
+    resumen = hashlib.sha256(type(tokenizer).__name__.encode('utf-8'))
+    backend = getattr(tokenizer, 'backend_tokenizer', None)
+    if backend is not None:
+        # Vocabulario, normalizador, pre-tokenizador y post-procesado
+        resumen.update(backend.to_str().encode('utf-8'))
+        resumen.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode('utf-8'))
+    else:
+        resumen.update(datasets.fingerprint.Hasher.hash(tokenizer).encode('utf-8'))
+    huella = resumen.hexdigest()
+    tokenizer._huella_tokenizacion = huella
+    return huella
+
+
+def _clave_texto(texto):
+    return hashlib.blake2b(texto.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class CacheTokenizacion:
+    """
+    Textos tokenizados guardados en archivos Arrow mapeados en memoria.
+
+    Cada texto se indexa por separado, así que cualquier subconjunto de
+    textos ya vistos (los fallos de la caché de inferencia, un
+    calentamiento con los dos primeros...) se sirve sin tokenizar. Los
+    textos nuevos de cada llamada van a un fragmento Arrow nuevo dentro de
+    la carpeta del tokenizer; si la carpeta supera `max_mb` se borran los
+    fragmentos usados hace más tiempo.
+    """
+
+    def __init__(self, directorio=None, tamano_lote_map=1000, max_mb=1024):
+        if directorio is None:
+            directorio = os.environ.get("HF_CACHE_TOKENIZACION", DIRECTORIO_POR_DEFECTO)
+        self.directorio = Path(directorio)
+        self.tamano_lote_map = tamano_lote_map
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self._lock = threading.Lock()
+        # carpeta -> {clave del texto: (fragmento, fila)}
+        self._indices = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self.fragmentos_borrados = 0
+        self.segundos_tokenizacion = 0.0
+
+    def _carpeta(self, tokenizer, max_longitud):
+        nombre = hashlib.sha256(f"{huella_tokenizador(tokenizer)}\0{max_longitud}".encode('utf-8')).hexdigest()
+        return self.directorio / nombre[:32]
+
+    def _indice(self, carpeta):
+        """
+        Índice de los textos de una carpeta, leído de la columna 'clave'
+        de sus fragmentos la primera vez que se usa
+        """
+        indice = self._indices.get(carpeta)
+        if indice is None:
+            indice = {}
+            for fragmento in sorted(carpeta.glob("*.arrow")):
+                claves = datasets.Dataset.from_file(str(fragmento))[COLUMNA_CLAVE]
+                for fila, clave in enumerate(claves):
+                    indice[clave] = (fragmento, fila)
+            self._indices[carpeta] = indice
+        return indice
+
+    def _escribir_fragmento(self, carpeta, tokenizer, textos, claves, max_longitud):
+        def tokenizar_lote(lote):
+            codificados = dict(tokenizer(lote['texto'], truncation=True, max_length=max_longitud))
+            codificados[COLUMNA_LONGITUD] = [len(ids) for ids in codificados['input_ids']]
+            return codificados
+
+        carpeta.mkdir(parents=True, exist_ok=True)
+        nombre = f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+        ruta = carpeta / f"{nombre}.arrow"
+        temporal = carpeta / f"{nombre}.tmp"
+        corpus = datasets.Dataset.from_dict({'texto': textos, COLUMNA_CLAVE: claves})
+        # map escribe los resultados directamente en el archivo Arrow por bloques
+        corpus.map(tokenizar_lote, batched=True, batch_size=self.tamano_lote_map,
+                   remove_columns=['texto'], cache_file_name=str(temporal),
+                   load_from_cache_file=False, desc="Tokenizando")
+        os.replace(temporal, ruta)
+        return ruta
+
+    def _aplicar_limite(self, en_uso):
+        """
+        Borra los fragmentos usados hace más tiempo mientras la caché
+        supere max_bytes (nunca los de la llamada en curso)
+        """
+        if not self.max_bytes or not self.directorio.exists():
+            return
+        fragmentos = sorted(self.directorio.glob("*/*.arrow"), key=lambda ruta: ruta.stat().st_mtime)
+        total = sum(ruta.stat().st_size for ruta in fragmentos)
+        for fragmento in fragmentos:
+            if total <= self.max_bytes:
+                break
+            if fragmento in en_uso:
+                continue
+            total -= fragmento.stat().st_size
+            fragmento.unlink(missing_ok=True)
+            self.fragmentos_borrados += 1
+            indice = self._indices.get(fragmento.parent)
+            if indice is not None:
+                for clave in [clave for clave, (ruta, _) in indice.items() if ruta == fragmento]:
+                    del indice[clave]
+
+    def tokenizar(self, tokenizer, textos, max_longitud=None):
+        """
+        Devuelve un Dataset con input_ids, attention_mask (y token_type_ids si
+        el tokenizer los usa) más la columna 'longitud', en el orden de `textos`
+        """
+        textos = list(textos)
+        carpeta = self._carpeta(tokenizer, max_longitud)
+        claves = [_clave_texto(texto) for texto in textos]
+
+        with self._lock:
+            indice = self._indice(carpeta)
+            # Fragmentos borrados por el límite de tamaño de otro proceso
+            borrados = {indice[clave][0] for clave in claves if clave in indice}
+            borrados = {ruta for ruta in borrados if not ruta.exists()}
+            if borrados:
+                for clave in [clave for clave, (ruta, _) in indice.items() if ruta in borrados]:
+                    del indice[clave]
+            nuevos = {clave: texto for clave, texto in zip(claves, textos) if clave not in indice}
+            self.aciertos += sum(clave in indice for clave in claves)
+            self.fallos += len(textos) - sum(clave in indice for clave in claves)
+
+            if nuevos:
+                inicio = time.perf_counter()
+                ruta = self._escribir_fragmento(carpeta, tokenizer, list(nuevos.values()),
+                                                list(nuevos), max_longitud)
+                for fila, clave in enumerate(nuevos):
+                    indice[clave] = (ruta, fila)
+                self.segundos_tokenizacion += time.perf_counter() - inicio
+
+            # Las filas pedidas, en orden, sobre los fragmentos concatenados
+            fragmentos, desplazamientos, filas = [], {}, []
+            for clave in claves:
+                ruta, fila = indice[clave]
+                if ruta not in desplazamientos:
+                    desplazamientos[ruta] = sum(len(fragmento) for fragmento in fragmentos)
+                    fragmentos.append(datasets.Dataset.from_file(str(ruta)))
+                    os.utime(ruta)
+                filas.append(desplazamientos[ruta] + fila)
+            self._aplicar_limite(set(desplazamientos))
+
+        if not fragmentos:
+            return datasets.Dataset.from_dict({'input_ids': [], COLUMNA_LONGITUD: []})
+        corpus = fragmentos[0] if len(fragmentos) == 1 else datasets.concatenate_datasets(fragmentos)
+        return corpus.select(filas).remove_columns([COLUMNA_CLAVE])
+
+    def estadisticas(self):
+        with self._lock:
+            archivos = list(self.directorio.glob("*/*.arrow")) if self.directorio.exists() else []
+            consultas = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+                'segundos_tokenizacion': self.segundos_tokenizacion,
+                'fragmentos': len(archivos),
+                'fragmentos_borrados': self.fragmentos_borrados,
+                'tamano_mb': sum(archivo.stat().st_size for archivo in archivos) / (1024 * 1024)
+            }
+
+
+_cache_global = None
+_lock_global = threading.Lock()
+
+
+def obtener_cache_tokenizacion():
+    """
+    Devuelve la caché de tokenización compartida por todo el proceso
+    """
+    global _cache_global
+    with _lock_global:
+        if _cache_global is None:
+            _cache_global = CacheTokenizacion()
+        return _cache_global
+
+
+def dataset_etiquetado(datos):
+    """
+    Convierte una lista de (texto, etiqueta) en un Dataset con columnas
+    'texto' y 'etiqueta'
+    """
+    return datasets.Dataset.from_dict({
+        'texto': [texto for texto, _ in datos],
+        'etiqueta': [etiqueta for _, etiqueta in datos]
+    })
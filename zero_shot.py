@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Motor Zero-Shot con Pares NLI por Lotes
+=======================================
+
+La clasificación zero-shot con un modelo NLI (por ejemplo
+facebook/bart-large-mnli) evalúa un par (texto, hipótesis) por cada
+categoría. El pipeline de transformers vuelve a tokenizar la plantilla de
+hipótesis de todas las categorías en cada llamada y procesa los textos de
+uno en uno.
+
+Este módulo aplana todos los pares (texto, categoría) de muchos textos,
+los agrupa en lotes de longitud similar (ver batch_scoring.py) y guarda
+las hipótesis ya tokenizadas de cada categoría, de forma que se reutilizan
+entre llamadas. Los resultados tienen el mismo formato que el pipeline:
+{'sequence', 'labels', 'scores'}.
+
+Con taxonomías de cientos de categorías se puede usar un modo en dos
+etapas: un modelo pequeño de embeddings ordena todas las categorías por
+similitud coseno con el texto y solo las k mejores pasan por el modelo
+NLI. Ejecutado como script mide el recall de ese prefiltro frente a la
+clasificación NLI completa para elegir k:
+
+    python zero_shot.py --textos textos.txt --categorias taxonomia.txt --k 5 10 20
+
+Ejemplo:
+    motor = obtener_motor_zero_shot(obtener_pipeline("zero-shot-classification", modelo))
+    resultados = motor.clasificar(textos, ["deportes", "finanzas"])
+    resultados = motor.clasificar_en_dos_etapas(textos, taxonomia, obtener_prefiltro(), k=10)
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from batch_scoring import _crear_lotes
+from lazy_imports import importar_perezoso
+from model_registry import obtener_pipeline
+
+torch = importar_perezoso("torch")
+np = importar_perezoso("numpy")
+
+PLANTILLA_HIPOTESIS = "This example is {}."
+MODELO_NLI = "facebook/bart-large-mnli"
+MODELO_EMBEDDINGS = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Datos del ejemplo de text_classification.py
+TEXTOS_EJEMPLO = [
+    "Me encanta programar en Python, es muy divertido",
+    "El partido de fútbol fue emocionante hasta el final",
+    "La nueva película de Marvel es increíble",
+    "Necesito comprar ingredientes para hacer una pizza",
+    "El mercado de valores subió significativamente hoy",
+    "Mi gato se perdió y estoy muy preocupado",
+    "La conferencia sobre inteligencia artificial fue muy educativa"
+]
+CATEGORIAS_EJEMPLO = [
+    "tecnología", "deportes", "entretenimiento",
+    "cocina", "finanzas", "mascotas", "educación"
+]
+
+
+class MotorZeroShot:
+    """
+    Clasificador zero-shot sobre el modelo NLI de un pipeline
+    """
+
+    def __init__(self, clasificador, max_tokens_por_lote=8192, max_tamano_lote=64,
+                 max_hipotesis=4096):
+        self.clasificador = clasificador
+        self.tokenizer = clasificador.tokenizer
+        self.modelo = clasificador.model
+        self.max_tokens_por_lote = max_tokens_por_lote
+        self.max_tamano_lote = max_tamano_lote
+        self.max_hipotesis = max_hipotesis
+        self.max_longitud = min(self.tokenizer.model_max_length, 1024)
+        self._hipotesis = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {'llamadas': 0, 'textos': 0, 'pares': 0, 'lotes': 0,
+                            'aciertos_hipotesis': 0, 'fallos_hipotesis': 0}
+
+        label2id = {etiqueta.lower(): int(i) for etiqueta, i in self.modelo.config.label2id.items()}
+        self.id_implicacion = next(
+            (i for etiqueta, i in label2id.items() if etiqueta.startswith("entail")), -1
+        )
+        # Igual que el pipeline: la contradicción es la primera etiqueta
+        # salvo que esa sea la de implicación
+        self.id_contradiccion = -1 if self.id_implicacion == 0 else 0
+
+    def _tokenizar_hipotesis(self, categorias, plantilla):
+        """
+        Devuelve {categoria: hipótesis tokenizada}, desde la caché si es posible
+        """
+        hipotesis = {}
+        pendientes = []
+        with self._lock:
+            for categoria in dict.fromkeys(categorias):
+                codificada = self._hipotesis.get((plantilla, categoria))
+                if codificada is None:
+                    pendientes.append(categoria)
+                else:
+                    self._hipotesis.move_to_end((plantilla, categoria))
+                    hipotesis[categoria] = codificada
+            self._contadores['aciertos_hipotesis'] += len(hipotesis)
+            self._contadores['fallos_hipotesis'] += len(pendientes)
+
+        if pendientes:
+            codificadas = self._codificar([plantilla.format(c) for c in pendientes])
+            with self._lock:
+                for categoria, codificada in zip(pendientes, codificadas):
+                    hipotesis[categoria] = codificada
+                    self._hipotesis[(plantilla, categoria)] = codificada
+                while len(self._hipotesis) > self.max_hipotesis:
+                    self._hipotesis.popitem(last=False)
+        return hipotesis
+
+    def _codificar(self, textos):
+        """
+        Encodings (tokenizers) de `textos` sin tokens especiales, relleno ni truncado.
+
+        El tokenizer es el del pipeline compartido: encode_batch directo
+        heredaría el relleno y el truncado de su última llamada, así que se
+        pasa por el tokenizer de transformers, que los fija en cada llamada.
+        """
+        if not textos:
+            return []
+        return self.tokenizer(textos, add_special_tokens=False, padding=False, truncation=False,
+                              verbose=False).encodings
+
+    def _codificar_pares(self, textos, categorias_por_texto, hipotesis):
+        """
+        Construye todos los pares (texto, hipótesis) con sus tokens especiales
+        """
+        backend = self.tokenizer.backend_tokenizer
+        premisas = self._codificar(textos)
+        especiales = backend.num_special_tokens_to_add(True)
+        claves = self.tokenizer.model_input_names
+
+        pares = []
+        for premisa, categorias in zip(premisas, categorias_por_texto):
+            # Truncar solo la premisa para que quepa la hipótesis más larga
+            max_premisa = self.max_longitud - especiales - max(len(hipotesis[c].ids) for c in categorias)
+            if max_premisa > 0 and len(premisa.ids) > max_premisa:
+                premisa.truncate(max_premisa)
+            for categoria in categorias:
+                par = backend.post_process(premisa, hipotesis[categoria], add_special_tokens=True)
+                caracteristicas = {'input_ids': par.ids, 'attention_mask': par.attention_mask}
+                if 'token_type_ids' in claves:
+                    caracteristicas['token_type_ids'] = par.type_ids
+                pares.append(caracteristicas)
+        return pares
+
+    def _logits_implicacion(self, pares):
+        """
+        Ejecuta el modelo sobre los pares en lotes agrupados por longitud
+        """
+        tarea = "zero-shot-classification"
+        model_id = self.modelo.config.name_or_path
+        longitudes = [len(par['input_ids']) for par in pares]
+        lotes = _crear_lotes(longitudes, self.max_tokens_por_lote, self.max_tamano_lote)
+
+        logits = [None] * len(pares)
+        self.modelo.eval()
+        with torch.inference_mode():
+            for lote in lotes:
+                entradas = self.tokenizer.pad([pares[i] for i in lote], return_tensors="pt")
+                entradas = {clave: valor.to(self.modelo.device) for clave, valor in entradas.items()}
+
+                inicio = time.perf_counter()
+                salida = self.modelo(**entradas).logits.float().cpu()
+                tamano_lote, longitud = entradas['input_ids'].shape
+                metrics.registrar_forward(tarea, model_id, time.perf_counter() - inicio,
+                                          tamano_lote, longitud)
+                for fila, indice in enumerate(lote):
+                    logits[indice] = salida[fila]
+
+        with self._lock:
+            self._contadores['lotes'] += len(lotes)
+        return torch.stack(logits)
+
+    def _puntuar(self, logits, multi_label):
+        """
+        Convierte los logits NLI de las categorías de un texto en scores
+        """
+        if multi_label or logits.shape[0] == 1:
+            pares_logits = logits[:, [self.id_contradiccion, self.id_implicacion]]
+            return pares_logits.softmax(dim=-1)[:, 1]
+        return logits[:, self.id_implicacion].softmax(dim=-1)
+
+    def _clasificar(self, textos, categorias_por_texto, plantilla, multi_label):
+        tarea, model_id = "zero-shot-classification", self.modelo.config.name_or_path
+
+        inicio = time.perf_counter()
+        hipotesis = self._tokenizar_hipotesis(
+            [c for categorias in categorias_por_texto for c in categorias], plantilla
+        )
+        pares = self._codificar_pares(textos, categorias_por_texto, hipotesis)
+        metrics.registrar_etapa(tarea, model_id, "tokenizacion", time.perf_counter() - inicio)
+
+        logits = self._logits_implicacion(pares)
+
+        inicio = time.perf_counter()
+        resultados = []
+        tramos = logits.split([len(categorias) for categorias in categorias_por_texto])
+        for texto, categorias, tramo in zip(textos, categorias_por_texto, tramos):
+            fila = self._puntuar(tramo, multi_label).tolist()
+            orden = sorted(range(len(categorias)), key=lambda j: fila[j], reverse=True)
+            resultados.append({
+                'sequence': texto,
+                'labels': [categorias[j] for j in orden],
+                'scores': [fila[j] for j in orden]
+            })
+        metrics.registrar_etapa(tarea, model_id, "postproceso", time.perf_counter() - inicio)
+
+        with self._lock:
+            self._contadores['llamadas'] += 1
+            self._contadores['textos'] += len(textos)
+            self._contadores['pares'] += len(pares)
+        return resultados
+
+    def clasificar(self, textos, categorias, plantilla=PLANTILLA_HIPOTESIS, multi_label=False):
+        """
+        Clasifica `textos` en `categorias`.
+
+        Devuelve un resultado por texto con el formato del pipeline de
+        transformers: {'sequence': texto, 'labels': [...], 'scores': [...]}
+        ordenado de mayor a menor confianza.
+        """
+        textos = [textos] if isinstance(textos, str) else list(textos)
+        categorias = _normalizar_categorias(categorias)
+        if not textos:
+            return []
+
+        if not self.tokenizer.is_fast:
+            # Sin tokenizer rápido no se pueden montar los pares a partir de
+            # las hipótesis ya tokenizadas: se usa el pipeline tal cual
+            resultados = self.clasificador(textos, categorias, hypothesis_template=plantilla,
+                                           multi_label=multi_label)
+            return [resultados] if isinstance(resultados, dict) else resultados
+
+        return self._clasificar(textos, [categorias] * len(textos), plantilla, multi_label)
+
+    def clasificar_en_dos_etapas(self, textos, categorias, prefiltro, k=10,
+                                 plantilla=PLANTILLA_HIPOTESIS, multi_label=False):
+        """
+        Clasifica pasando por el modelo NLI solo las `k` categorías más
+        parecidas a cada texto según `prefiltro` (ver PrefiltroEtiquetas).
+
+        Los resultados solo incluyen esas `k` categorías y, sin
+        multi_label, sus scores suman 1 entre ellas.
+        """
+        textos = [textos] if isinstance(textos, str) else list(textos)
+        categorias = _normalizar_categorias(categorias)
+        if not textos:
+            return []
+        if k >= len(categorias):
+            return self.clasificar(textos, categorias, plantilla, multi_label)
+
+        candidatos = prefiltro.candidatos(textos, categorias, k)
+        if not self.tokenizer.is_fast:
+            return [self.clasificador(texto, candidatos_texto, hypothesis_template=plantilla,
+                                      multi_label=multi_label)
+                    for texto, candidatos_texto in zip(textos, candidatos)]
+        return self._clasificar(textos, candidatos, plantilla, multi_label)
+
+    def estadisticas(self):
+        """
+        Devuelve los contadores de uso del motor
+        """
+        with self._lock:
+            estadisticas = dict(self._contadores)
+            estadisticas['hipotesis_en_cache'] = len(self._hipotesis)
+        return estadisticas
+
+
+def _normalizar_categorias(categorias):
+    if isinstance(categorias, str):
+        categorias = [c.strip() for c in categorias.split(',') if c.strip()]
+    categorias = list(categorias)
+    if not categorias:
+        raise ValueError("Se necesita al menos una categoría")
+    return categorias
+
+
+class PrefiltroEtiquetas:
+    """
+    Ordena categorías por similitud coseno de embeddings de frases
+    """
+
+    def __init__(self, extractor, max_tokens_por_lote=8192, max_tamano_lote=128,
+                 max_conjuntos=32):
+        self.tokenizer = extractor.tokenizer
+        self.modelo = extractor.model
+        self.max_tokens_por_lote = max_tokens_por_lote
+        self.max_tamano_lote = max_tamano_lote
+        self.max_conjuntos = max_conjuntos
+        self.max_longitud = min(self.tokenizer.model_max_length, 512)
+        self._etiquetas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embeber(self, textos):
+        """
+        Devuelve una matriz (len(textos), dim) de embeddings normalizados
+        """
+        codificados = self.tokenizer(list(textos), truncation=True, max_length=self.max_longitud)
+        longitudes = [len(ids) for ids in codificados['input_ids']]
+        lotes = _crear_lotes(longitudes, self.max_tokens_por_lote, self.max_tamano_lote)
+
+        embeddings = None
+        self.modelo.eval()
+        with torch.inference_mode():
+            for lote in lotes:
+                features = [{clave: codificados[clave][i] for clave in codificados.keys()} for i in lote]
+                entradas = self.tokenizer.pad(features, return_tensors="pt")
+                entradas = {clave: valor.to(self.modelo.device) for clave, valor in entradas.items()}
+                estados = self.modelo(**entradas).last_hidden_state
+
+                # Media de los tokens reales (sin padding), como sentence-transformers
+                mascara = entradas['attention_mask'].unsqueeze(-1).to(estados.dtype)
+                medias = (estados * mascara).sum(dim=1) / mascara.sum(dim=1).clamp(min=1e-9)
+                medias = torch.nn.functional.normalize(medias.float(), dim=-1).cpu().numpy()
+
+                if embeddings is None:
+                    embeddings = np.empty((len(longitudes), medias.shape[1]), dtype=np.float32)
+                embeddings[lote] = medias
+        return embeddings
+
+    def _embeddings_etiquetas(self, categorias):
+        """
+        Embeddings de un conjunto de categorías, calculados una sola vez
+        """
+        clave = tuple(categorias)
+        with self._lock:
+            matriz = self._etiquetas.get(clave)
+            if matriz is not None:
+                self._etiquetas.move_to_end(clave)
+                return matriz
+
+        matriz = self.embeber(categorias)
+        with self._lock:
+            self._etiquetas[clave] = matriz
+            while len(self._etiquetas) > self.max_conjuntos:
+                self._etiquetas.popitem(last=False)
+        return matriz
+
+    def ordenar(self, textos, categorias, k):
+        """
+        Devuelve (indices, similitudes) de las `k` categorías más parecidas
+        a cada texto, ordenadas de mayor a menor similitud
+        """
+        similitudes = self.embeber(textos) @ self._embeddings_etiquetas(categorias).T
+        k = min(k, similitudes.shape[1])
+        if k < similitudes.shape[1]:
+            indices = np.argpartition(-similitudes, k - 1, axis=1)[:, :k]
+        else:
+            indices = np.broadcast_to(np.arange(k), similitudes.shape).copy()
+        filas = np.arange(similitudes.shape[0])[:, None]
+        orden = np.argsort(-similitudes[filas, indices], axis=1, kind='stable')
+        indices = indices[filas, orden]
+        return indices, similitudes[filas, indices]
+
+    def candidatos(self, textos, categorias, k):
+        """
+        Devuelve, para cada texto, la lista de sus `k` categorías candidatas
+        """
+        indices, _ = self.ordenar(textos, categorias, k)
+        return [[categorias[j] for j in fila] for fila in indices.tolist()]
+
+
+_lock_motores = threading.Lock()
+
+
+def obtener_motor_zero_shot(clasificador, **kwargs):
+    """
+    Devuelve el motor asociado a un pipeline zero-shot (uno por pipeline).
+
+    El motor se guarda en el propio pipeline, así que se libera junto con
+    él cuando el registro de modelos lo descarta.
+    """
+    with _lock_motores:
+        motor = getattr(clasificador, '_motor_zero_shot', None)
+        if motor is None:
+            motor = MotorZeroShot(clasificador, **kwargs)
+            clasificador._motor_zero_shot = motor
+        return motor
+
+
+def obtener_prefiltro(model_id=MODELO_EMBEDDINGS, **kwargs):
+    """
+    Devuelve el prefiltro de embeddings de `model_id` desde el registro de modelos
+    """
+    extractor = obtener_pipeline("feature-extraction", model_id)
+    with _lock_motores:
+        prefiltro = getattr(extractor, '_prefiltro_etiquetas', None)
+        if prefiltro is None:
+            prefiltro = PrefiltroEtiquetas(extractor, **kwargs)
+            extractor._prefiltro_etiquetas = prefiltro
+        return prefiltro
+
+
+def evaluar_recall(motor, prefiltro, textos, categorias, valores_k=(1, 3, 5, 10, 20), top_n=1,
+                   plantilla=PLANTILLA_HIPOTESIS):
+    """
+    Mide cuántas de las `top_n` categorías de la clasificación NLI completa
+    quedan dentro de las `k` candidatas del prefiltro, para cada k
+    """
+    categorias = _normalizar_categorias(categorias)
+    valores_k = sorted({min(k, len(categorias)) for k in valores_k})
+
+    inicio = time.perf_counter()
+    completos = motor.clasificar(textos, categorias, plantilla)
+    segundos_nli = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    candidatos = prefiltro.candidatos(textos, categorias, max(valores_k))
+    segundos_prefiltro = time.perf_counter() - inicio
+
+    recall = {}
+    for k in valores_k:
+        aciertos = [len(set(completo['labels'][:top_n]) & set(candidatos_texto[:k])) / top_n
+                    for completo, candidatos_texto in zip(completos, candidatos)]
+        recall[k] = sum(aciertos) / len(aciertos) if aciertos else 0.0
+
+    return {
+        'textos': len(textos),
+        'categorias': len(categorias),
+        'top_n': top_n,
+        'recall': recall,
+        'fraccion_pares_nli': {k: k / len(categorias) for k in valores_k},
+        'segundos_nli_completo': segundos_nli,
+        'segundos_prefiltro': segundos_prefiltro
+    }
+
+
+def _leer_lista(valor, por_defecto):
+    """
+    Lee una lista de un archivo (una entrada por línea) o separada por comas
+    """
+    if not valor:
+        return por_defecto
+    try:
+        with open(valor, encoding='utf-8') as f:
+            return [linea.strip() for linea in f if linea.strip()]
+    except FileNotFoundError:
+        return [elemento.strip() for elemento in valor.split(',') if elemento.strip()]
+
+
+def main(argv=None):
+    """
+    Informe de recall del prefiltro de embeddings frente al NLI completo
+    """
+    parser = argparse.ArgumentParser(description="Recall del prefiltro de categorías zero-shot")
+    parser.add_argument('--textos', help="Archivo con un texto por línea")
+    parser.add_argument('--categorias', help="Archivo con una categoría por línea o lista separada por comas")
+    parser.add_argument('--k', type=int, nargs='*', default=[1, 3, 5, 10, 20])
+    parser.add_argument('--top-n', type=int, default=1,
+                        help="Categorías del ranking NLI completo que deben quedar dentro de k")
+    parser.add_argument('--recall-objetivo', type=float, default=0.95)
+    parser.add_argument('--modelo', default=MODELO_NLI)
+    parser.add_argument('--modelo-embeddings', default=MODELO_EMBEDDINGS)
+    parser.add_argument('--json', help="Guardar el informe en un archivo JSON")
+    opciones = parser.parse_args(argv)
+
+    textos = _leer_lista(opciones.textos, TEXTOS_EJEMPLO)
+    categorias = _leer_lista(opciones.categorias, CATEGORIAS_EJEMPLO)
+
+    print("🔎 PREFILTRO DE CATEGORÍAS ZERO-SHOT - RECALL")
+    print("=" * 60)
+    print(f"📝 {len(textos)} textos | 🏷️  {len(categorias)} categorías | top-{opciones.top_n} NLI")
+
+    motor = obtener_motor_zero_shot(obtener_pipeline("zero-shot-classification", opciones.modelo))
+    prefiltro = obtener_prefiltro(opciones.modelo_embeddings)
+    informe = evaluar_recall(motor, prefiltro, textos, categorias, opciones.k, opciones.top_n)
+
+    print(f"\n⏱️  NLI completo: {informe['segundos_nli_completo']:.2f}s | "
+          f"prefiltro: {informe['segundos_prefiltro']:.2f}s")
+    for k, recall in informe['recall'].items():
+        print(f"   k={k:<4} recall {recall * 100:5.1f}% | "
+              f"{informe['fraccion_pares_nli'][k] * 100:5.1f}% de los pares NLI")
+
+    suficientes = [k for k, recall in informe['recall'].items() if recall >= opciones.recall_objetivo]
+    if suficientes:
+        print(f"\n✅ k={suficientes[0]} alcanza un recall de {opciones.recall_objetivo * 100:.0f}%")
+    else:
+        print(f"\n⚠️  Ningún k alcanza un recall de {opciones.recall_objetivo * 100:.0f}%")
+
+    if opciones.json:
+        with open(opciones.json, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Informe guardado en {opciones.json}")
+
+
+if __name__ == "__main__":
+    main()